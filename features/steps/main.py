@@ -1,12 +1,32 @@
 import boto3
 import logging
 import os
-import time
 
 import sam.app
+import sam.cloud
+import sam.template
 
 from behave import *
 
+def assert_scaffolded(context, status, existed):
+    '''
+    scaffold prints a header, then the resource diff and the change set of the stack it deployed
+
+    A new stack is compared against an empty template, so its diff lists every resource as added.
+    Scaffolding an existing stack again without changes is skipped, and its diff is empty.
+    '''
+    assert(status.exit_code == 0)
+    lines = status.output.splitlines()
+    assert(lines[0] == 'scaffolding...')
+    cloud = context.obj['app'].cloud
+    diff = sam.template.format_diff(cloud.diff)
+    assert(lines[1:] == diff + sam.cloud.Cloud.format_changes(cloud.changes))
+    if existed:
+        assert(diff == [])
+    else:
+        assert(diff and all(line.startswith('+ ') for line in diff))
+        assert(any(line.endswith('(AWS::Lambda::Function)') for line in diff))
+
 @given('I have an AWS account')
 def step_impl(context):
     iam = boto3.client('iam')
@@ -16,8 +36,9 @@ def step_impl(context):
 
 @when('I run the application to scaffold')
 def step_impl(context):
+    existed = context.obj['app'].stack_exists()
     status = context.runner.invoke(sam.app.scaffold, obj=context.obj)
-    assert(status.output == 'scaffolding...\n')
+    assert_scaffolded(context, status, existed)
 
 @then('the program will have created a scaffold of a basic serverless Python web application')
 def step_impl(context):
@@ -31,18 +52,14 @@ def step_impl(context):
 
     exists_status = context.runner.invoke(sam.app.exists, obj=context.obj)
     context.log.info('stack exist status %s' % exists_status.output)
-    if exists_status != 'stack %s exists' % stack_name:
+    if exists_status.output != 'stack %s exists\n' % stack_name:
         status = context.runner.invoke(sam.app.scaffold, obj=context.obj)
-        assert(status.output == 'scaffolding...\n')
+        assert_scaffolded(context, status, False)
+
+    status = context.obj['app'].cloud.wait()
+    context.log.info('stack %s finished in status %s' % (stack_name, status))
 
-    ready_status = None
-    timeout = 10
-    while ready_status is None or ready_status.output != 'stack %s ready\n' % stack_name:
-        ready_status = context.runner.invoke(sam.app.exists, ['--ready'], obj=context.obj)
-        time.sleep(5)
-        timeout -= 1
-        if timeout == 0:
-            break
+    ready_status = context.runner.invoke(sam.app.exists, ['--ready'], obj=context.obj)
     assert(ready_status.output == 'stack %s ready\n' % stack_name)
 
     result = context.runner.invoke(sam.app.exists, obj=context.obj)
@@ -0,0 +1,180 @@
+import asyncio
+import concurrent.futures
+import functools
+
+class Executor(object):
+    """
+    Runs the blocking boto3 calls of Cloud, Lambda and Bucket from an event loop
+
+    Every call runs on a thread pool, at most limit of them at a time, so that independent calls (existence
+    checks, resource lookups, uploads) overlap without flooding the connection pool of the shared clients.
+    """
+    LIMIT = 10
+
+    def __init__(self, limit=None, executor=None):
+        """Constructor for the Executor class
+
+        Args:
+            limit (int): maximum number of concurrent calls
+            executor (concurrent.futures.Executor): pool the calls run on, a thread pool of limit threads if None
+        """
+        self.limit = self.LIMIT if limit is None else limit
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.limit) if executor is None else executor
+        self._semaphores = {}
+
+    def _semaphore(self):
+        # a semaphore belongs to the loop it is first used in
+        loop = asyncio.get_running_loop()
+        if loop not in self._semaphores:
+            self._semaphores[loop] = asyncio.Semaphore(self.limit)
+        return self._semaphores[loop]
+
+    async def run(self, function, *args, **kwargs):
+        '''
+        Calls function with args and kwargs on the pool, waiting for a free slot first
+        '''
+        async with self._semaphore():
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, functools.partial(function, *args, **kwargs))
+
+    async def map(self, function, items, return_exceptions=False):
+        '''
+        Calls function once per item concurrently, the results are in the order of items
+        '''
+        return await asyncio.gather(*[self.run(function, item) for item in items], return_exceptions=return_exceptions)
+
+    def shutdown(self, wait=True):
+        self.executor.shutdown(wait=wait)
+
+class AsyncProxy(object):
+    """
+    Async view of a Cloud, Lambda or Bucket: every method becomes a coroutine function run on the executor
+
+        cloud = AsyncProxy(sam.cloud.Cloud(settings))
+        exists, resources = await asyncio.gather(cloud.stack_exists(name), cloud.stack_resources())
+
+    Properties may call AWS as well, they are read with get instead of plain attribute access.
+    """
+    def __init__(self, target, executor=None, limit=None):
+        self.target = target
+        self.executor = Executor(limit=limit) if executor is None else executor
+
+    def __getattr__(self, name):
+        attribute = getattr(type(self.target), name, None)
+        if isinstance(attribute, property):
+            raise AttributeError('%s is a property, read it with get(%r)' % (name, name))
+        method = getattr(self.target, name)
+        if not callable(method):
+            return method
+
+        @functools.wraps(method)
+        async def call(*args, **kwargs):
+            return await self.executor.run(method, *args, **kwargs)
+        return call
+
+    async def get(self, name):
+        '''
+        Reads an attribute of the wrapped object on the executor
+        '''
+        return await self.executor.run(getattr, self.target, name)
+
+class AsyncApp(object):
+    """
+    Async control plane of an App for embedding in an asyncio deploy orchestrator
+
+    The Cloud, Lambda and Bucket calls of the App run on one Executor, the limit is async_limit of
+    settings.json. Calls that do not depend on each other are started together: the function lookup
+    overlaps with packaging, the functions of the functions map are uploaded concurrently, and so are the
+    deployment targets of fan_out.
+    """
+    def __init__(self, app, limit=None, executor=None):
+        """Constructor for the AsyncApp class
+
+        Args:
+            app (sam.app.App): application to control
+            limit (int): maximum number of concurrent AWS calls, defaults to async_limit of settings.json
+            executor (Executor): executor shared with other components, created from limit if None
+        """
+        self.app = app
+        if executor is None:
+            executor = Executor(limit=app.settings.get('async_limit') if limit is None else limit)
+        self.executor = executor
+
+    @property
+    def cloud(self):
+        return AsyncProxy(self.app.cloud, executor=self.executor)
+
+    @property
+    def awslambda(self):
+        return AsyncProxy(self.app.awslambda, executor=self.executor)
+
+    def bucket(self):
+        import sam.bucket
+        return AsyncProxy(sam.bucket.Bucket(self.app.settings, clients=self.app.clients), executor=self.executor)
+
+    async def scaffold(self, dry=False, replace=False, wait=False, callback=None, detach=False):
+        return await self.executor.run(self.app.scaffold, dry=dry, replace=replace, wait=wait, callback=callback, detach=detach)
+
+    async def resume(self, wait=True, callback=None):
+        return await self.executor.run(self.app.resume, wait=wait, callback=callback)
+
+    async def upload_lambda_code(self):
+        '''
+        Async counterpart of App.upload_lambda_code, the function lookup overlaps with the packaging
+
+        Returns:
+            dict: the update status, or per function results with a functions map, None if nothing was uploaded
+        '''
+        app = self.app
+        if app.settings.get('functions'):
+            results = await self.upload_functions()
+            if any(result['error'] is not None for result in results.values()):
+                return None
+            return results
+
+        if not app._lambda_code_ready():
+            return None
+        function_name, _ = await asyncio.gather(self.cloud.get('function_name'), self.executor.run(app._package_lambda))
+        if function_name is None:
+            app.log.error('AWS Lambda Function not deployed to cloud, please deploy first')
+            return None
+        has_bucket = 'bucket' in app.settings
+        layer = await self.executor.run(app.publish_layer)
+        status = await self.executor.run(app._update_code, function_name, layer)
+        app._save_bucket(has_bucket)
+        return status
+
+    async def upload_functions(self):
+        '''
+        Async counterpart of App.upload_functions, every function is packaged and uploaded concurrently
+
+        Returns:
+            OrderedDict: per logical function name, its function_name, update status, error and elapsed seconds
+        '''
+        app = self.app
+        has_bucket = 'bucket' in app.settings
+        function_names, layer = await asyncio.gather(self.cloud.get('function_names'), self.executor.run(app.publish_layer))
+        layers = app._function_layers(layer)
+        awslambda = app.awslambda
+        results = await asyncio.gather(*[
+            self.executor.run(app._upload_function, awslambda, function_names.get(name), function, layers)
+            for name, function in app.functions.items()
+        ])
+        return app._collect_functions(has_bucket, results)
+
+    async def fan_out(self, method, regions=None, **kwargs):
+        '''
+        Async counterpart of App.fan_out, every deployment target runs concurrently under the executor limit
+
+        Args:
+            method (str): name of the App method, scaffold, resume or upload_lambda_code
+            regions (list): overrides the regions of settings.json
+            kwargs: arguments of the method
+
+        Returns:
+            OrderedDict: per target key, the App of the target, the result of the method, its error and elapsed seconds
+        '''
+        app = self.app
+        targets = await self.executor.run(app._prepare_targets, method, regions)
+        results = await asyncio.gather(*[self.executor.run(app._run_target, target, method, kwargs) for target in targets])
+        return app._collect_targets(targets, results)
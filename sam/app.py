@@ -1,13 +1,17 @@
 import click
+import collections
+import concurrent.futures
+import copy
+import itertools
 import json
 import logging
 import os
-import shutil
+import re
 import sys
+import time
 import uuid
 
-import sam.cloud
-import sam.awslambda
+import sam.package
 
 __version__ = '0.0.1'
 
@@ -17,6 +21,11 @@ class App(object):
     """
     SETTINGS_FILE = 'settings.json'
     LAMBDA_DIR = 'lambda/'
+    LAMBDA_ZIP = 'lambda.zip'
+    STATE_FILE = '.sapling/state.json'
+    UPLOAD_WORKERS = 8
+    TUNING_KEYS = ('runtime', 'memory_size', 'timeout', 'reserved_concurrency', 'architecture', 'provisioned_concurrency', 'alias', 'package')
+    TARGET_KEYS = ('bucket', 'layer_hash', 'layer_arn')
     FORMAT_STRING = '[%(asctime)s] p%(process)s {%(pathname)s:%(lineno)d} %(levelname)s - %(message)s'
 
     def __init__(self, name=None, debug=False, cwd=None, session=None):
@@ -39,9 +48,54 @@ class App(object):
         self.log.info('Current working directory is %s' % os.getcwd())
 
         self._load_settings()
+        self._validate_settings()
         self._preload_settings(name)
+        self._clients = None
+        self._cloud = None
+        self._awslambda = None
+        self._resource_cache = None
+        self._state = None
+        self._parent = None
+        self._prebuilt = frozenset()
+        self.profile_name = None
+        self.region_name = None
 
-        self.cloud = sam.cloud.Cloud(self.settings, session=self.session)
+    @property
+    def clients(self):
+        '''
+        boto3 clients shared by every AWS call of the application, see sam.clients.ClientRegistry
+        '''
+        if self._clients is None:
+            import sam.clients
+            self._clients = sam.clients.ClientRegistry(self.settings, session=self.session)
+        return self._clients
+
+    @property
+    def cloud(self):
+        '''
+        Cloudformation stack of the application, created on first use since it imports boto3 and troposphere
+        '''
+        if self._cloud is None:
+            import sam.cloud
+            self._cloud = sam.cloud.Cloud(self.settings, clients=self.clients, resource_cache=self._resource_cache, state=self.state)
+        return self._cloud
+
+    @property
+    def state(self):
+        '''
+        Local deployment state, kept in state_file of settings.json, .sapling/state.json by default
+        '''
+        if self._state is None:
+            import sam.state
+            self._state = sam.state.StateFile(self.settings.get('state_file', self.STATE_FILE))
+        return self._state
+
+    @property
+    def awslambda(self):
+        if self._awslambda is None:
+            import sam.awslambda
+            self._awslambda = sam.awslambda.Lambda(self.settings, clients=self.clients)
+        return self._awslambda
 
     @property
     def name(self):
@@ -55,9 +109,59 @@ class App(object):
     def rest_name(self):
         return self._settings('rest_name')
 
+    @property
+    def api_type(self):
+        '''
+        Kind of API Gateway in front of the functions, rest or http
+        '''
+        api_type = self.settings.get('api_gateway', {}).get('type', 'rest')
+        if api_type not in ('rest', 'http'):
+            raise Exception('Unknown api_gateway type %s, expected rest or http' % api_type)
+        return api_type
+
+    @property
+    def functions(self):
+        '''
+        AWS Lambda functions of the application keyed by logical name, each with its source subdirectory
+        of lambda/, handler, archive, tuning and packaging pipeline (see TUNING_KEYS). Taken from the functions map of settings.json,
+        defaults to the single function_name function packaged from lambda/ itself. Tuning keys at the top
+        level of settings.json apply to every function that does not set them.
+        '''
+        defaults = dict((key, self.settings[key]) for key in self.TUNING_KEYS if key in self.settings)
+        functions = collections.OrderedDict()
+        if not self.settings.get('functions'):
+            function = {'source': '', 'handler': 'index.handler', 'archive': self.LAMBDA_ZIP}
+            function.update(defaults)
+            functions[self.function_name] = function
+            return functions
+        for name, config in self.settings['functions'].items():
+            function = {'source': name, 'handler': 'main.handler', 'archive': 'lambda-%s.zip' % name}
+            function.update(defaults)
+            function.update(config)
+            functions[name] = function
+        return functions
+
+    @staticmethod
+    def alias_name(function):
+        '''
+        Alias a function is invoked through, None if it is invoked directly
+        '''
+        import sam.cloud
+        if function.get('alias') is not None:
+            return function['alias']
+        if function.get('provisioned_concurrency'):
+            return sam.cloud.Cloud.ALIAS_NAME
+        return None
+
     def _settings(self, key):
         return None if self.settings is None else self.settings[key]
 
+    def _validate_settings(self):
+        # keys of the functions map become CloudFormation logical IDs, which are alphanumeric only
+        for name in self.settings.get('functions') or {}:
+            if not re.match(r'^[A-Za-z0-9]+$', name):
+                raise Exception('Invalid function name %s in the functions map of %s, function names must be alphanumeric' % (name, self.SETTINGS_FILE))
+
     def _preload_settings(self, name):
         if 'name' not in self.settings:
             if name is None:
@@ -65,7 +169,7 @@ class App(object):
             else:
                 self.settings['name'] = name
         else:
-            self.log.warn('Using name %s from settings.json' % self.settings['name'])
+            self.log.warning('Using name %s from settings.json' % self.settings['name'])
 
         if 'function_name' not in self.settings:
             self.settings['function_name'] = '%sFunction' % self.name
@@ -76,16 +180,33 @@ class App(object):
     def _lambda_dir_exists(self):
         return os.path.exists('./%s' % self.LAMBDA_DIR)
 
-    def _package_lambda(self):
-        self.log.info('Creating lambda.zip') # create lambda.zip
-        shutil.make_archive('lambda', 'zip', './%s' % self.LAMBDA_DIR)
+    def package(self, function):
+        '''
+        Package of a function of the functions map, built with its package pipeline from settings.json
+        '''
+        source_dir = os.path.join('.', self.LAMBDA_DIR, function['source'])
+        return sam.package.Package(source_dir, function['archive'], log=self.log, config=function.get('package'), runtime=function.get('runtime'))
+
+    def _build(self, function, force=False):
+        '''
+        Builds the archive of a function, unless it was already built for every deployment target
+        '''
+        package = self.package(function)
+        if function['archive'] in self._prebuilt:
+            return False
+        return package.build(force=force)
+
+    def _package_lambda(self, force=False):
+        '''
+        Builds lambda.zip from the lambda/ directory, only if its contents changed since the last build
+        '''
+        return self._build(self.functions[self.function_name], force=force)
 
     def _load_settings(self):
         # validate existence of ./lambda/ directory
         if not self._lambda_dir_exists():
             self.log.info('Lambda directory does not exist, creating one...')
             os.mkdir('./%s' % self.LAMBDA_DIR)
-        self._package_lambda()
 
         # import or init settings.json
         if not os.path.isfile(self.SETTINGS_FILE):
@@ -99,6 +220,9 @@ class App(object):
         self.settings = json.loads(settings_json)
 
     def _save_settings(self):
+        if self._parent is not None:
+            # the state of a deployment target is merged into settings.json by the parent, see fan_out
+            return True
         with open('settings.json', 'w') as f:
             if self.settings is None:
                 self.settings = {}
@@ -129,11 +253,204 @@ class App(object):
         self._configure_log_level()
         self.log.addHandler(handler)
 
-    def scaffold(self, dry=False):
+    def targets(self, regions=None):
+        '''
+        (profile, region) pairs the application is deployed to: every region of regions in settings.json
+        in every account of profiles. [(None, None)] deploys to the region and account of the environment.
+
+        Args:
+            regions (list): overrides the regions of settings.json
+        '''
+        regions = regions or self.settings.get('regions') or [None]
+        profiles = self.settings.get('profiles') or [None]
+        return list(itertools.product(profiles, regions))
+
+    @staticmethod
+    def target_key(profile_name, region_name):
+        return '/'.join(part for part in (profile_name, region_name) if part) or 'default'
+
+    def for_target(self, profile_name=None, region_name=None):
+        '''
+        Copy of the App deploying to one region of one account
+
+        The copy shares the settings of the App except for the per target state (see TARGET_KEYS), which is
+        kept in the targets map of settings.json, and creates its own Cloud and Lambda from scoped clients.
+        '''
+        target = copy.copy(self)
+        target._parent = self
+        target.profile_name = profile_name
+        target.region_name = region_name
+        target.settings = dict((key, value) for key, value in self.settings.items() if key not in self.TARGET_KEYS)
+        target.settings.update(self.settings.get('targets', {}).get(self.target_key(profile_name, region_name), {}))
+        target._clients = self.clients.scoped(region_name=region_name, profile_name=profile_name)
+        target._cloud = None
+        target._awslambda = None
+        if self._resource_cache is None:
+            import sam.cache
+            self._resource_cache = sam.cache.ResourceCache(
+                ttl=self.settings.get('resource_cache_ttl'),
+                path=self.settings.get('resource_cache_file')
+            )
+        target._resource_cache = self._resource_cache
+        target._state = self.state
+        return target
+
+    @staticmethod
+    def _run_target(target, method, kwargs):
+        start = time.time()
+        result = {'target': target, 'result': None, 'error': None}
+        try:
+            result['result'] = getattr(target, method)(**kwargs)
+        except Exception as e:
+            result['error'] = str(e)
+        result['elapsed'] = time.time() - start
+        return result
+
+    def fan_out(self, method, regions=None, **kwargs):
+        '''
+        Runs an App method, scaffold, resume or upload_lambda_code, for every deployment target concurrently
+
+        The function archives are built once beforehand and shared by every target. A failing target does
+        not stop the others, the per target state is saved to settings.json once all of them are done.
+
+        Args:
+            method (str): name of the App method
+            regions (list): overrides the regions of settings.json
+            kwargs: arguments of the method
+
+        Returns:
+            OrderedDict: per target key, the App of the target, the result of the method, its error and elapsed seconds
+        '''
+        targets = self._prepare_targets(method, regions)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(targets)) as executor:
+            futures = [executor.submit(self._run_target, target, method, kwargs) for target in targets]
+        return self._collect_targets(targets, [future.result() for future in futures])
+
+    def _prepare_targets(self, method, regions=None):
+        '''
+        Apps of the deployment targets of fan_out, with the function archives built once for all of them
+        '''
+        targets = [self.for_target(profile_name, region_name) for profile_name, region_name in self.targets(regions)]
+        if method == 'upload_lambda_code':
+            built = set()
+            for function in self.functions.values():
+                if os.path.isdir(os.path.join('.', self.LAMBDA_DIR, function['source'])):
+                    self._build(function)
+                    built.add(function['archive'])
+            for target in targets:
+                target._prebuilt = frozenset(built)
+        return targets
+
+    def _collect_targets(self, targets, results):
+        '''
+        Saves the per target state of fan_out to settings.json and keys the results by target
+        '''
+        results = collections.OrderedDict(
+            (self.target_key(target.profile_name, target.region_name), result) for target, result in zip(targets, results)
+        )
+        for target in targets:
+            state = dict((key, target.settings[key]) for key in self.TARGET_KEYS if key in target.settings)
+            if state:
+                self.settings.setdefault('targets', {})[self.target_key(target.profile_name, target.region_name)] = state
+        self._save_settings()
+
+        for key, result in results.items():
+            if result['error'] is None:
+                self.log.info('%s done in %.2fs' % (key, result['elapsed']))
+            else:
+                self.log.error('%s failed: %s' % (key, result['error']))
+        return results
+
+    def publish_layer(self):
+        '''
+        Publishes the dependency layer when layer mode is enabled in settings.json and its requirements changed
+
+        Returns:
+            (str, bool): the LayerVersionArn (None without layer mode) and whether it changed since the last run
+        '''
+        if not self.settings.get('layer'):
+            return None, False
+        import sam.layer
+        previous = self.settings.get('layer_arn')
+        layer = sam.layer.Layer(self.settings, clients=self.clients)
+        arn = layer.publish()
+        changed = arn != previous
+        if changed:
+            self._save_settings()
+        return arn, changed
+
+    def synthesize(self, layer_arn=None):
+        '''
+        Adds the functions and the API Gateway of the application to the Cloudformation template
+
+        The API is configured by the api_gateway entry of settings.json: its type is rest (the default) or
+        http for an HTTP API. Both take a routes table mapping paths and methods to functions, and throttling,
+        a REST API also cache and minimum_compression_size, see sam.cloud.Cloud.add_api_gateway and
+        sam.cloud.Cloud.add_http_api.
+
+        Args:
+            layer_arn (str): LayerVersionArn of the dependency layer attached to every function
+        '''
+        layers = None if layer_arn is None else [layer_arn]
+        for name, function in self.functions.items():
+            self.cloud.add_lambda(
+                name,
+                lambda_handler=function['handler'],
+                memory_size=function.get('memory_size'),
+                timeout=function.get('timeout'),
+                layers=layers,
+                runtime=function.get('runtime'),
+                reserved_concurrency=function.get('reserved_concurrency'),
+                architecture=function.get('architecture'),
+                provisioned_concurrency=function.get('provisioned_concurrency'),
+                alias=function.get('alias')
+            )
+        api_gateway = self.settings.get('api_gateway', {})
+        if self.api_type == 'http':
+            if api_gateway.get('cache') or api_gateway.get('minimum_compression_size') is not None:
+                self.log.warning('HTTP APIs have no cache or compression settings, ignoring them')
+            self.cloud.add_http_api(self.rest_name, routes=api_gateway.get('routes'), throttling=api_gateway.get('throttling'))
+            return self.cloud.template
+        self.cloud.add_api_gateway(
+            self.rest_name,
+            cache=api_gateway.get('cache'),
+            throttling=api_gateway.get('throttling'),
+            minimum_compression_size=api_gateway.get('minimum_compression_size'),
+            routes=api_gateway.get('routes')
+        )
+        return self.cloud.template
+
+    def scaffold(self, dry=False, replace=False, wait=False, callback=None, detach=False):
         self.log.info('Creating scaffold in AWS cloud...')
-        self.cloud.add_lambda(self.function_name)
-        self.cloud.add_api_gateway(self.rest_name)
-        status = self.cloud.deploy(dry=dry)
+        if dry:
+            layer_arn = self.settings.get('layer_arn') if self.settings.get('layer') else None
+        else:
+            layer_arn, changed = self.publish_layer()
+        self.synthesize(layer_arn)
+        has_bucket = 'bucket' in self.settings
+        status = self.cloud.deploy(dry=dry, replace=replace, wait=wait, callback=callback, detach=detach)
+        self._save_bucket(has_bucket)
+        return status
+
+    def resume(self, wait=True, callback=None):
+        '''
+        Reattaches to the last stack operation recorded in the state file, see sam.cloud.Cloud.resume
+
+        The deletion of a detached replace is followed by the creation of the stack, which is waited for
+        with wait and only started otherwise.
+        '''
+        operation = self.cloud.operation()
+        status = self.cloud.resume(wait=wait, callback=callback)
+        if status == 'DELETE_COMPLETE' and operation is not None and operation.get('then') == 'CREATE':
+            self.log.info('Stack %s deleted, creating it again' % self.name)
+            if self.scaffold(wait=wait, detach=not wait, callback=callback) is None:
+                return status
+            status = self.cloud.operation()['status'] if wait else 'CREATE_IN_PROGRESS'
+        return status
+
+    def stack_status(self, stack_name=None):
+        stack_name = self.name if stack_name is None else stack_name
+        status = self.cloud.stack_status(stack_name)
         return status
 
     def stack_exists(self, stack_name=None):
@@ -149,23 +466,121 @@ class App(object):
     def upload_lambda_code(self):
         '''
         Packages the lambda/ directory and upload it to AWS Lambda
+
+        With a functions map in settings.json, every function is packaged and uploaded, see upload_functions
         '''
+        if self.settings.get('functions'):
+            results = self.upload_functions()
+            if any(result['error'] is not None for result in results.values()):
+                return None
+            return results
+
+        if not self._lambda_code_ready():
+            return None
         function_name = self.cloud.function_name
         if function_name is None:
             self.log.error('AWS Lambda Function not deployed to cloud, please deploy first')
             return None
+        self._package_lambda()
+        has_bucket = 'bucket' in self.settings
+        status = self._update_code(function_name, self.publish_layer())
+        self._save_bucket(has_bucket)
+        return status
+
+    def _lambda_code_ready(self):
         if not self._lambda_dir_exists():
             self.log.error('Lambda directory not found')
-            return None
+            return False
         if self.settings['function_name'] is None:
             self.log.error('Scaffold does not exist, please scaffold first')
-            return None
-        self._package_lambda()
-        # retrieve function_name from cloudformation stack
-        awslambda = sam.awslambda.Lambda(self.settings, session=self.session)
-        status = awslambda.update(function_name=function_name, code='lambda.zip')
+            return False
+        return True
+
+    def _update_code(self, function_name, layer):
+        '''
+        Uploads lambda.zip to the function, attaches the layer if it changed and moves the alias of the function
+
+        Args:
+            function_name (str): name of the deployed AWS Lambda function
+            layer (tuple): (LayerVersionArn, changed) as returned by publish_layer
+        '''
+        layer_arn, layer_changed = layer
+        awslambda = self.awslambda
+        status = awslambda.update(function_name=function_name, code=self.LAMBDA_ZIP)
+        if status and layer_changed:
+            awslambda.update(function_name=function_name, layers=[layer_arn])
+        alias_name = self.alias_name(self.functions[self.function_name])
+        if status and alias_name is not None and (layer_changed or not status.get('Skipped')):
+            awslambda.publish_alias(function_name, alias_name)
         return status
 
+    def _save_bucket(self, had_bucket):
+        if not had_bucket and 'bucket' in self.settings:
+            # keep uploading to the same bucket on subsequent runs
+            self._save_settings()
+
+    def _upload_function(self, awslambda, function_name, function, layers=None):
+        start = time.time()
+        result = {'function_name': function_name, 'status': None, 'error': None}
+        try:
+            if function_name is None:
+                raise Exception('AWS Lambda Function not deployed to cloud, please deploy first')
+            package = self.package(function)
+            if not os.path.isdir(package.source_dir):
+                raise FileNotFoundError('%s not found' % package.source_dir)
+            self._build(function)
+            result['status'] = awslambda.update(function_name=function_name, code=function['archive'])
+            if layers is not None:
+                awslambda.update(function_name=function_name, layers=layers)
+            alias_name = self.alias_name(function)
+            if alias_name is not None and (layers is not None or not result['status'].get('Skipped')):
+                awslambda.publish_alias(function_name, alias_name)
+        except Exception as e:
+            result['error'] = str(e)
+        result['elapsed'] = time.time() - start
+        return result
+
+    def upload_functions(self):
+        '''
+        Packages and uploads every function of the functions map on a bounded thread pool
+
+        The pool size is set with upload_workers in settings.json. A failing function does not stop the others.
+
+        Returns:
+            OrderedDict: per logical function name, its function_name, update status, error and elapsed seconds
+        '''
+        has_bucket = 'bucket' in self.settings
+        function_names = self.cloud.function_names
+        layers = self._function_layers(self.publish_layer())
+        awslambda = self.awslambda
+        workers = self.settings.get('upload_workers', self.UPLOAD_WORKERS)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(self._upload_function, awslambda, function_names.get(name), function, layers)
+                for name, function in self.functions.items()
+            ]
+        return self._collect_functions(has_bucket, [future.result() for future in futures])
+
+    @staticmethod
+    def _function_layers(layer):
+        layer_arn, layer_changed = layer
+        return [layer_arn] if layer_changed else None
+
+    def _collect_functions(self, had_bucket, results):
+        '''
+        Keys the results of upload_functions by logical function name, logging them, and saves a new bucket
+        '''
+        results = collections.OrderedDict(zip(self.functions, results))
+        self._save_bucket(had_bucket)
+
+        for name, result in results.items():
+            self.log.info('%s uploaded in %.2fs' % (name, result['elapsed']))
+        failures = [name for name, result in results.items() if result['error'] is not None]
+        for name in failures:
+            self.log.error('%s failed: %s' % (name, results[name]['error']))
+        self.log.info('%d of %d functions updated' % (len(results) - len(failures), len(results)))
+        return results
+
 ##
 # CLI
 ##
@@ -176,37 +591,319 @@ class App(object):
 @click.pass_context
 def cli(ctx, debug=False):
     ctx.obj['debug'] = debug
-    ctx.obj['app'] = App(debug=debug)
+
+def _app(ctx):
+    '''
+    App of the CLI context, only created once a command needs it so that --help and --version stay fast
+    '''
+    if 'app' not in ctx.obj:
+        ctx.obj['app'] = App(debug=ctx.obj.get('debug', False))
+    return ctx.obj['app']
+
+def _regions(app, regions):
+    '''
+    Regions of the --regions option, None if the command is not fanned out to several deployment targets
+    '''
+    regions = [region.strip() for region in regions.split(',') if region.strip()] if regions else None
+    if regions is None and not app.settings.get('regions') and not app.settings.get('profiles'):
+        return None
+    return regions or app.settings.get('regions')
+
+def _echo_targets(results, action):
+    for key, result in results.items():
+        if result['error'] is None:
+            click.echo('%s %s in %.2fs' % (key, action, result['elapsed']))
+        else:
+            click.echo('%s failed: %s' % (key, result['error']))
+    failures = len([result for result in results.values() if result['error'] is not None])
+    click.echo('%d of %d targets %s' % (len(results) - failures, len(results), action))
+
+def _echo_operation(key, operation):
+    prefix = '' if key is None else '%s: ' % key
+    if operation is None:
+        click.echo('%sno operation recorded' % prefix)
+        return
+    click.echo('%s%s of stack %s started %s, token %s' % (prefix, operation['action'], operation['stack_id'], operation['started'], operation['token']))
 
 @cli.command()
 @click.option('--dry/--no-dry', default=False, help='No changes are committed locally or to AWS')
+@click.option('--replace/--no-replace', default=False, help='Delete and recreate an existing stack instead of updating it')
+@click.option('--wait/--no-wait', default=False, help='Wait for the stack operation to finish, reporting its progress')
+@click.option('--async', 'detach', is_flag=True, default=False, help='Return as soon as the stack operation is recorded, without waiting for a change set or for the deletion of a replaced stack; follow it with wait or status')
+@click.option('--regions', type=str, default=None, help='Comma separated regions to deploy to concurrently, overrides settings.json')
 @click.pass_context
-def scaffold(ctx, dry=False):
-    app = ctx.obj['app']
+def scaffold(ctx, dry=False, replace=False, wait=False, detach=False, regions=None):
+    import sam.cloud
+    import sam.template
+    import sam.tracker
+    if wait and detach:
+        raise click.BadParameter('--wait and --async are mutually exclusive')
+    app = _app(ctx)
     click.echo('scaffolding...')
-    status = app.scaffold(dry=dry)
+    regions = _regions(app, regions)
+    if regions is not None or app.settings.get('profiles'):
+        results = app.fan_out('scaffold', regions=regions, dry=dry, replace=replace, wait=wait, detach=detach)
+        for key, result in results.items():
+            for line in sam.template.format_diff(result['target'].cloud.diff):
+                click.echo('%s: %s' % (key, line))
+            for line in sam.cloud.Cloud.format_changes(result['target'].cloud.changes):
+                click.echo('%s: %s' % (key, line))
+            if detach and result['error'] is None and result['result'] is not None:
+                _echo_operation(key, result['target'].cloud.operation())
+        _echo_targets(results, 'scaffolded')
+        return
+    callback = lambda event: click.echo(sam.tracker.StackTracker.format_event(event))
+    status = app.scaffold(dry=dry, replace=replace, wait=wait, callback=callback, detach=detach)
+    for line in sam.template.format_diff(app.cloud.diff):
+        click.echo(line)
+    for line in sam.cloud.Cloud.format_changes(app.cloud.changes):
+        click.echo(line)
+    if detach and status is not None:
+        _echo_operation(None, app.cloud.operation())
 
 @cli.command()
 @click.option('--stack', type=str, default=None, nargs=1)
 @click.option('--ready/--no-ready', default=False, help='If stack is in status CREATE_COMPLETE')
 @click.pass_context
 def exists(ctx, stack, ready):
-    app = ctx.obj['app']
+    import sam.cloud
+    app = _app(ctx)
     if stack is None:
         stack = app.name
+    stack_status = app.stack_status(stack)
     if ready:
-        result = app.stack_ready(stack)
+        result = sam.cloud.Cloud.is_ready(stack_status)
         status = 'ready' if result else 'not ready'
     else:
-        result = app.stack_exists(stack)
+        result = sam.cloud.Cloud.is_existing(stack_status)
         status = 'exists' if result else 'does not exist'
 
     click.echo('stack %s %s' % (stack, status))
 
 @cli.command()
+@click.option('--function', type=str, default=None, help='Function of the functions map to tune, all functions if omitted')
+@click.option('--runtime', type=str, default=None)
+@click.option('--memory-size', type=int, default=None, help='Memory in MB, CPU scales with it')
+@click.option('--timeout', type=int, default=None, help='Timeout in seconds')
+@click.option('--reserved-concurrency', type=int, default=None)
+@click.option('--architecture', type=click.Choice(['x86_64', 'arm64']), default=None)
+@click.option('--provisioned-concurrency', type=int, default=None, help='Execution environments kept warm on the alias')
+@click.option('--alias', type=str, default=None, help='Alias the API Gateway invokes')
+@click.pass_context
+def configure(ctx, function, **tuning):
+    '''
+    Saves function tuning to settings.json, applied on the next scaffold
+    '''
+    app = _app(ctx)
+    if function is None:
+        target = app.settings
+    else:
+        if function not in app.settings.get('functions', {}):
+            raise click.BadParameter('function %s not found in settings.json' % function, param_hint='--function')
+        target = app.settings['functions'][function]
+    for key, value in tuning.items():
+        if value is not None:
+            target[key] = value
+    app._save_settings()
+    click.echo('settings saved')
+
+@cli.command()
+@click.option('--host', type=str, default='127.0.0.1', help='Address to listen on')
+@click.option('--port', type=int, default=8000, help='Port to listen on')
+@click.option('--workers', type=int, default=None, help='Warm handler processes, defaults to the number of CPUs')
+@click.option('--function', type=str, default=None, help='Function to serve, defaults to the API Gateway function')
+@click.option('--handler', type=str, default=None, help='module.function to invoke instead of the function handler')
+@click.pass_context
+def serve(ctx, host, port, workers, function, handler):
+    '''
+    Serves the handler locally behind an emulated API Gateway proxy
+    '''
+    import sam.cloud
+    import sam.local
+    app = _app(ctx)
+    functions = app.functions
+    if function is None:
+        function = next(iter(functions))
+    if function not in functions:
+        raise click.BadParameter('function %s not found' % function, param_hint='--function')
+    config = functions[function]
+    source_dir = os.path.join(app.LAMBDA_DIR, config['source'])
+    handler = config['handler'] if handler is None else handler
+    if app.api_type == 'http':
+        server = sam.local.LocalServer(source_dir, handler, host=host, port=port, workers=workers, stage='$default', log=app.log, payload_format='2.0')
+    else:
+        server = sam.local.LocalServer(source_dir, handler, host=host, port=port, workers=workers, stage=sam.cloud.Cloud.stage_name, log=app.log)
+    click.echo('serving %s on http://%s:%d' % (handler, host, server.server_port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+@cli.command()
+@click.option('--function', type=str, default=None, help='Function to benchmark, defaults to the API Gateway function')
+@click.option('--handler', type=str, default=None, help='module.function to benchmark instead of the function handler')
+@click.option('--invocations', type=click.IntRange(min=1), default=1000, help='Warm invocations to measure')
+@click.option('--runs', type=click.IntRange(min=1), default=5, help='Cold imports to measure')
+@click.option('--output', type=click.Path(), default=None, help='Save the results as JSON')
+@click.option('--baseline', type=click.Path(exists=True), default=None, help='JSON results to compare against')
+@click.option('--threshold', type=float, default=0.1, help='Allowed regression against the baseline, 0.1 is 10%')
 @click.pass_context
-def update(ctx):
-    app = ctx.obj['app']
+def bench(ctx, function, handler, invocations, runs, output, baseline, threshold):
+    '''
+    Benchmarks cold import time, warm invocation latency and package size of the handler
+    '''
+    import sam.bench
+    app = _app(ctx)
+    functions = app.functions
+    function = next(iter(functions)) if function is None else function
+    if function not in functions:
+        raise click.BadParameter('function %s not found' % function, param_hint='--function')
+    config = functions[function]
+    source_dir = os.path.join(app.LAMBDA_DIR, config['source'])
+    handler = config['handler'] if handler is None else handler
+    app.package(config).build()
+
+    results = sam.bench.run(source_dir, handler, archive=config['archive'], invocations=invocations, runs=runs)
+    click.echo('cold import: %.1fms median' % (results['cold_import']['median'] * 1000))
+    for module in results['cold_import']['modules'][:10]:
+        click.echo('  %8.1fms %s' % (module['cumulative_us'] / 1000.0, module['module']))
+    warm = results['warm']
+    click.echo('warm: p50 %.3fms p95 %.3fms p99 %.3fms, %.0f invocations/s' % (warm['p50'] * 1000, warm['p95'] * 1000, warm['p99'] * 1000, warm['throughput']))
+    click.echo('archive: %d bytes, %d files' % (results['archive']['size'], results['archive']['files']))
+    if output is not None:
+        sam.bench.save(results, output)
+
+    if baseline is not None:
+        regressions = sam.bench.compare(sam.bench.load(baseline), results, threshold=threshold)
+        for metric, old, new in regressions:
+            click.echo('regression: %s %s -> %s' % (metric, old, new))
+        if regressions:
+            ctx.exit(1)
+
+@cli.command()
+@click.option('--function', type=str, default=None, help='Function to package, all functions if omitted')
+@click.option('--force/--no-force', default=False, help='Rebuild the archive even if it is up to date')
+@click.pass_context
+def package(ctx, function, force):
+    '''
+    Builds the archives of the functions and prints their size per top-level package
+    '''
+    app = _app(ctx)
+    functions = app.functions
+    if function is not None and function not in functions:
+        raise click.BadParameter('function %s not found' % function, param_hint='--function')
+    for name, config in functions.items():
+        if function is not None and name != function:
+            continue
+        package = app.package(config)
+        package.build(force=force)
+        entries = package.breakdown()
+        click.echo('%s: %d bytes, %d files' % (package.archive, os.path.getsize(package.archive), sum(entry[1] for entry in entries)))
+        for top_level, files, size, compressed in entries:
+            click.echo('  %10d %10d %5d %s' % (compressed, size, files, top_level))
+
+@cli.command()
+@click.option('--output', type=click.Path(), default=None, help='Write the minified template to this file')
+@click.pass_context
+def template(ctx, output):
+    '''
+    Renders the Cloudformation template and reports its size against the Cloudformation limits
+    '''
+    import sam.template
+    app = _app(ctx)
+    layer_arn = app.settings.get('layer_arn') if app.settings.get('layer') else None
+    template_body = sam.template.render(app.synthesize(layer_arn))
+    for line in sam.template.format_size_report(sam.template.size_report(template_body)):
+        click.echo(line)
+    if output is not None:
+        with open(output, 'w') as f:
+            f.write(template_body)
+
+@cli.command()
+@click.option('--stack', type=str, default=None, nargs=1, help='Stack to follow instead of the last recorded operation')
+@click.option('--regions', type=str, default=None, help='Comma separated regions to reattach to, overrides settings.json')
+@click.pass_context
+def wait(ctx, stack, regions=None):
+    '''
+    Waits for the stack to reach a terminal state, reporting its events as they happen
+
+    Without --stack, reattaches to the operation recorded by the last scaffold and replays its events so far.
+    '''
+    import sam.tracker
+    app = _app(ctx)
+    callback = lambda event: click.echo(sam.tracker.StackTracker.format_event(event))
+    if stack is None:
+        regions = _regions(app, regions)
+        if regions is not None or app.settings.get('profiles'):
+            results = app.fan_out('resume', regions=regions, wait=True)
+            for key, result in results.items():
+                if result['error'] is None:
+                    click.echo('%s: stack %s' % (key, result['result'] or 'does not exist'))
+            _echo_targets(results, 'done')
+            return
+        if app.cloud.operation() is not None:
+            _echo_operation(None, app.cloud.operation())
+            status = app.resume(wait=True, callback=callback)
+            click.echo('stack %s %s' % (app.name, 'does not exist' if status is None else status))
+            return
+        stack = app.name
+    tracker = sam.tracker.StackTracker(app.cloud.client, stack, log=app.log)
+    status = tracker.wait(callback=callback)
+    click.echo('stack %s %s' % (stack, 'does not exist' if status is None else status))
+
+@cli.command()
+@click.option('--regions', type=str, default=None, help='Comma separated regions to report on, overrides settings.json')
+@click.pass_context
+def status(ctx, regions=None):
+    '''
+    Reports the progress of the operation recorded by the last scaffold without waiting for it
+    '''
+    import sam.tracker
+    app = _app(ctx)
+    regions = _regions(app, regions)
+    if regions is not None or app.settings.get('profiles'):
+        results = app.fan_out('resume', regions=regions, wait=False)
+        for key, result in results.items():
+            if result['error'] is None:
+                _echo_operation(key, result['target'].cloud.operation())
+                click.echo('%s: stack %s' % (key, result['result'] or 'does not exist'))
+        _echo_targets(results, 'reported')
+        return
+    operation = app.cloud.operation()
+    _echo_operation(None, operation)
+    if operation is None:
+        return
+    callback = lambda event: click.echo(sam.tracker.StackTracker.format_event(event))
+    status = app.resume(wait=False, callback=callback)
+    click.echo('stack %s %s' % (app.name, 'does not exist' if status is None else status))
+
+@cli.command()
+@click.option('--regions', type=str, default=None, help='Comma separated regions to update concurrently, overrides settings.json')
+@click.pass_context
+def update(ctx, regions=None):
+    app = _app(ctx)
+    regions = _regions(app, regions)
+    if regions is not None or app.settings.get('profiles'):
+        results = app.fan_out('upload_lambda_code', regions=regions)
+        for result in results.values():
+            if result['error'] is None and not result['result']:
+                result['error'] = 'not updated'
+        _echo_targets(results, 'updated')
+        return
+
+    if app.settings.get('functions'):
+        results = app.upload_functions()
+        for name, result in results.items():
+            if result['error'] is None:
+                click.echo('lambda function %s updated in %.2fs' % (result['function_name'], result['elapsed']))
+            else:
+                click.echo('lambda function %s not updated: %s' % (result['function_name'] or name, result['error']))
+        failures = len([result for result in results.values() if result['error'] is not None])
+        click.echo('%d of %d functions updated' % (len(results) - failures, len(results)))
+        return
+
     result = app.upload_lambda_code()
     status = 'lambda function %s' % app.cloud.function_name
     if not result:
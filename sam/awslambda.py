@@ -1,12 +1,19 @@
-import boto3
 import logging
 import os
 
+import sam.bucket
+import sam.clients
+import sam.package
+
 class Lambda:
-    def __init__(self, settings, session=None):
+    DIRECT_UPLOAD_LIMIT = 50 * 1024 * 1024
+
+    def __init__(self, settings, session=None, clients=None):
         self.log = logging.getLogger(settings['name'])
-        self.client = boto3.client('lambda') if session is None else session.client('lambda')
+        self.clients = sam.clients.ClientRegistry(settings, session=session) if clients is None else clients
+        self.client = self.clients.client('lambda')
         self.settings = settings
+        self.upload_threshold = settings.get('s3_upload_threshold', self.DIRECT_UPLOAD_LIMIT)
 
     def exists(self, function_name):
         functions = self.client.list_functions()
@@ -15,16 +22,44 @@ class Lambda:
                 return True
         return False
 
-    def update(self, function_name=None, code=None, handler=None):
+    def code_sha256(self, function_name):
+        '''
+        Returns the CodeSha256 of the code currently deployed to the AWS Lambda function
+        '''
+        response = self.client.get_function_configuration(FunctionName=function_name)
+        return response.get('CodeSha256')
+
+    def _upload_code(self, function_name, code):
+        '''
+        Sends the zip file inline, or through S3 if it is larger than s3_upload_threshold bytes
+        '''
+        if os.path.getsize(code) <= self.upload_threshold:
+            with open(code, 'rb') as f:
+                return self.client.update_function_code(FunctionName=function_name, ZipFile=f.read())
+
+        bucket = sam.bucket.Bucket.shared(self.settings, clients=self.clients)
+        bucket.create_bucket()
+        key = '%s/%s.zip' % (function_name, sam.package.file_sha256(code))
+        self.log.info('Uploading %s to s3://%s/%s' % (code, bucket.name, key))
+        bucket.upload_file(code, key)
+        return self.client.update_function_code(FunctionName=function_name, S3Bucket=bucket.name, S3Key=key)
+
+    def update(self, function_name=None, code=None, handler=None, force=False, layers=None):
         '''
         Updates an AWS Lambda function, either the code or the handler (or both) if they are specified.
 
         Either the code or handler argument must be specified, or an Exception will be raised.
 
+        The code upload is skipped when the SHA-256 of the zip file matches the CodeSha256 of the deployed
+        function, unless force is specified. Zip files above the s3_upload_threshold setting are streamed
+        to the S3 bucket with a multipart transfer instead of being sent inline.
+
         Args:
             function_name (str): name of the AWS Lambda function to update
             code (str): zip file location of the lambda code to upload
             handler (str): the name of the handler to update the function configuration
+            force (bool): upload the code even if it is identical to the deployed code
+            layers (list): ARNs of the layer versions to attach to the function configuration
         '''
         if function_name is None:
             if 'function_name' not in self.settings:
@@ -33,19 +68,54 @@ class Lambda:
             else:
                 function_name = self.settings['function_name']
 
-        if code is None and handler is None:
+        if code is None and handler is None and layers is None:
             raise Exception('No code or handler configuration to update AWS Lambda function')
             return None
 
         if code is not None:
             if not os.path.exists(code):
                 raise FileNotFoundError('%s not found' % code)
-            response = self.client.update_function_code(FunctionName=function_name, ZipFile=open(code, 'rb').read())
-            if response['ResponseMetadata']['HTTPStatusCode'] != 200:
-                return response
+            if not force and sam.package.code_sha256(code) == self.code_sha256(function_name):
+                self.log.info('Code of %s is unchanged, skipping upload' % function_name)
+                response = {'FunctionName': function_name, 'Skipped': True}
+            else:
+                response = self._upload_code(function_name, code)
+                if response['ResponseMetadata']['HTTPStatusCode'] != 200:
+                    return response
+                self.wait_updated(function_name)
+
+
+        if handler is not None or layers is not None:
+            configuration = {}
+            if handler is not None:
+                configuration['Handler'] = handler
+            if layers is not None:
+                configuration['Layers'] = layers
+            response = self.client.update_function_configuration(FunctionName=function_name, **configuration)
+            self.wait_updated(function_name)
+
+        return response
 
+    def wait_updated(self, function_name):
+        '''
+        Blocks until the last update of a function is applied, Lambda rejects any other update or publish
+        of the function with a ResourceConflictException while LastUpdateStatus is InProgress
+        '''
+        self.client.get_waiter('function_updated').wait(FunctionName=function_name)
 
-        if handler is not None:
-            response = self.client.update_function_configuration(FunctionName=function_name, Handler=handler)
+    def publish_alias(self, function_name, alias_name):
+        '''
+        Publishes the current code and configuration of a function as a new version and points the alias at it,
+        once the updates of the function are applied
 
+        Needed after a code update when the function is invoked through an alias, which otherwise keeps
+        serving the version it was created with.
+
+        Returns:
+            dict: the update_alias response
+        '''
+        self.wait_updated(function_name)
+        version = self.client.publish_version(FunctionName=function_name)['Version']
+        self.log.info('Pointing alias %s of %s at version %s' % (alias_name, function_name, version))
+        response = self.client.update_alias(FunctionName=function_name, Name=alias_name, FunctionVersion=version)
         return response
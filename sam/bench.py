@@ -0,0 +1,156 @@
+import json
+import math
+import os
+import subprocess
+import sys
+import time
+import zipfile
+
+import sam.local
+
+METRICS = (
+    ('cold_import', 'median'),
+    ('warm', 'p50'),
+    ('warm', 'p95'),
+    ('warm', 'p99'),
+    ('archive', 'size')
+)
+
+def percentile(values, percent):
+    '''
+    Nearest-rank percentile of a list of numbers
+    '''
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, int(math.ceil(percent / 100.0 * len(ordered))))
+    return ordered[min(rank, len(ordered)) - 1]
+
+def parse_importtime(output, limit=20):
+    '''
+    Parses the stderr of python -X importtime into the slowest modules by cumulative microseconds
+    '''
+    modules = []
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        fields = line[len('import time:'):].split('|')
+        if len(fields) != 3:
+            continue
+        modules.append({
+            'module': fields[2].strip(),
+            'self_us': int(fields[0]),
+            'cumulative_us': int(fields[1])
+        })
+    modules.sort(key=lambda module: module['cumulative_us'], reverse=True)
+    return modules[:limit]
+
+def cold_import(source_dir, module, runs=5):
+    '''
+    Measures the import time of the handler module in a fresh interpreter, run after run
+
+    Returns:
+        dict: seconds of every run, their median and the per-module breakdown of the last run
+    '''
+    code = 'import time\nstart = time.perf_counter()\nimport %s\nprint(time.perf_counter() - start)' % module
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.path.abspath(source_dir)
+    env['PYTHONDONTWRITEBYTECODE'] = '1'
+    seconds = []
+    breakdown = []
+    for _ in range(runs):
+        process = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', code],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env, universal_newlines=True
+        )
+        if process.returncode != 0:
+            # the error is the last line that is not an -X importtime report
+            lines = [line for line in process.stderr.strip().splitlines() if not line.startswith('import time:')]
+            raise Exception('Importing %s failed: %s' % (module, lines[-1] if lines else 'exit status %d' % process.returncode))
+        seconds.append(float(process.stdout.strip().splitlines()[-1]))
+        breakdown = parse_importtime(process.stderr)
+    return {'seconds': seconds, 'median': percentile(seconds, 50), 'modules': breakdown}
+
+def warm_invocations(source_dir, handler, invocations=1000, events=None):
+    '''
+    Invokes the handler in-process with synthetic API Gateway proxy events after a warm-up call
+
+    Returns:
+        dict: p50/p95/p99/mean latency in seconds and throughput in invocations per second
+    '''
+    if events is None:
+        if invocations < 1:
+            raise Exception('At least one invocation is required, got %d' % invocations)
+        events = [sam.local.proxy_event('GET', '/bench/%d' % i, query=[('i', str(i))]) for i in range(invocations)]
+    elif not events:
+        raise Exception('At least one event is required')
+    function = sam.local.load_handler(source_dir, handler)
+    context = sam.local.LocalContext(handler)
+    function(events[0], context)
+
+    latencies = []
+    start = time.perf_counter()
+    for event in events:
+        begin = time.perf_counter()
+        function(event, context)
+        latencies.append(time.perf_counter() - begin)
+    total = time.perf_counter() - start
+    return {
+        'invocations': len(latencies),
+        'p50': percentile(latencies, 50),
+        'p95': percentile(latencies, 95),
+        'p99': percentile(latencies, 99),
+        'mean': sum(latencies) / len(latencies),
+        'throughput': len(latencies) / total if total else None
+    }
+
+def archive_stats(archive):
+    '''
+    Compressed size, uncompressed size and file count of a zip file
+    '''
+    with zipfile.ZipFile(archive) as z:
+        infos = z.infolist()
+    return {
+        'size': os.path.getsize(archive),
+        'uncompressed_size': sum(info.file_size for info in infos),
+        'files': len(infos)
+    }
+
+def run(source_dir, handler, archive=None, invocations=1000, runs=5):
+    '''
+    Runs the cold import, warm invocation and archive benchmarks of a handler
+    '''
+    results = {
+        'handler': handler,
+        'python': sys.version.split()[0],
+        'cold_import': cold_import(source_dir, handler.rsplit('.', 1)[0], runs=runs),
+        'warm': warm_invocations(source_dir, handler, invocations=invocations)
+    }
+    if archive is not None:
+        results['archive'] = archive_stats(archive)
+    return results
+
+def save(results, path):
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+
+def load(path):
+    with open(path, 'r') as f:
+        return json.load(f)
+
+def compare(baseline, results, threshold=0.1):
+    '''
+    Lists the metrics that got worse than the baseline by more than threshold (a fraction, 0.1 is 10%)
+
+    Returns:
+        list: (metric, baseline value, new value) tuples of the regressions
+    '''
+    regressions = []
+    for section, key in METRICS:
+        old = baseline.get(section, {}).get(key)
+        new = results.get(section, {}).get(key)
+        if old is None or new is None or old <= 0:
+            continue
+        if new > old * (1 + threshold):
+            regressions.append(('%s.%s' % (section, key), old, new))
+    return regressions
@@ -1,12 +1,37 @@
-import boto3
+import threading
 import uuid
 
+from boto3.s3.transfer import TransferConfig
+from botocore.exceptions import ClientError
+
+import sam.clients
+
 class Bucket(object):
-    def __init__(self, settings, session=None):
-        self.client = boto3.client('s3') if session is None else session.client('s3')
+    PART_SIZE = 8 * 1024 * 1024
+    CONCURRENCY = 10
+
+    # naming and creating a bucket is serialized, parallel uploads share the settings of one application
+    _lock = threading.RLock()
+
+    def __init__(self, settings, session=None, clients=None):
+        self.clients = sam.clients.ClientRegistry(settings, session=session) if clients is None else clients
+        self.client = self.clients.client('s3')
         self.settings = settings
 
         self.name = self.settings['bucket'] if 'bucket' in self.settings else 'my-lambda-%s' % uuid.uuid4()
+        self.part_size = self.settings.get('upload_part_size', self.PART_SIZE)
+        self.concurrency = self.settings.get('upload_concurrency', self.CONCURRENCY)
+
+    @classmethod
+    def shared(cls, settings, session=None, clients=None):
+        '''
+        Bucket of settings.json, a new bucket name is saved in settings so that every upload of the run,
+        including the ones of parallel workers, goes to that one bucket
+        '''
+        with cls._lock:
+            bucket = cls(settings, session=session, clients=clients)
+            settings['bucket'] = bucket.name
+        return bucket
 
     def bucket_exists(self):
         buckets = self.client.list_buckets()
@@ -18,12 +43,47 @@ class Bucket(object):
         return False
 
     def create_bucket(self):
-        exists = self.bucket_exists()
-        if exists:
-            return
+        with self._lock:
+            exists = self.bucket_exists()
+            if exists:
+                return
+
+            region_name = self.client.meta.region_name
+            if region_name in (None, 'us-east-1'):
+                status = self.client.create_bucket(Bucket=self.name)
+            else:
+                status = self.client.create_bucket(Bucket=self.name, CreateBucketConfiguration={'LocationConstraint': region_name})
+            return status
+
+    def transfer_config(self):
+        '''
+        Multipart transfer configuration, files larger than one part are streamed from disk in parts
+        of upload_part_size bytes with upload_concurrency parts in flight
+        '''
+        return TransferConfig(
+            multipart_threshold=self.part_size,
+            multipart_chunksize=self.part_size,
+            max_concurrency=self.concurrency
+        )
+
+    def object_exists(self, key):
+        try:
+            self.client.head_object(Bucket=self.name, Key=key)
+        except ClientError as e:
+            if e.response['Error'].get('Code') in ('404', 'NoSuchKey', 'NoSuchBucket', 'NotFound'):
+                return False
+            raise
+        return True
+
+    def put_object(self, key, body):
+        return self.client.put_object(Bucket=self.name, Key=key, Body=body)
 
-        status = self.client.create_bucket(Bucket=self.name)
-        return status
+    def url(self, key):
+        '''
+        Regional virtual-hosted URL of an object, as Cloudformation expects for TemplateURL
+        '''
+        region_name = self.client.meta.region_name or 'us-east-1'
+        return 'https://%s.s3.%s.amazonaws.com/%s' % (self.name, region_name, key)
 
     def upload_file(self, filepath, filename):
-        self.client.upload_file(filepath, self.name, filename)
+        self.client.upload_file(filepath, self.name, filename, Config=self.transfer_config())
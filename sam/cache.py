@@ -0,0 +1,108 @@
+import json
+import logging
+import os
+import threading
+import time
+
+class StackResources(object):
+    """
+    Resources of a Cloudformation stack, indexed by ResourceType and LogicalResourceId
+    """
+    KEYS = ('LogicalResourceId', 'PhysicalResourceId', 'ResourceType', 'ResourceStatus')
+
+    def __init__(self, resources):
+        self.resources = [dict((key, resource.get(key)) for key in self.KEYS) for resource in resources]
+        self._by_type = {}
+        self._by_logical_id = {}
+        for resource in self.resources:
+            self._by_type.setdefault(resource['ResourceType'], []).append(resource)
+            self._by_logical_id[resource['LogicalResourceId']] = resource
+
+    def __iter__(self):
+        return iter(self.resources)
+
+    def __len__(self):
+        return len(self.resources)
+
+    def by_type(self, resource_type):
+        return self._by_type.get(resource_type, [])
+
+    def by_logical_id(self, logical_id):
+        return self._by_logical_id.get(logical_id)
+
+class ResourceCache(object):
+    """
+    Per-process cache of stack resources keyed by stack name, optionally persisted to a JSON file so that
+    successive CLI runs can reuse it
+
+    Entries expire after ttl seconds, deploying a stack must invalidate its entry. A cache can be shared by
+    the Cloud objects of several deployment targets running on different threads. Lookups use the indexed
+    StackResources kept in memory, the file only carries the entries from one run to the next.
+    """
+    TTL = 60
+
+    def __init__(self, ttl=None, path=None):
+        """Constructor for the ResourceCache class
+
+        Args:
+            ttl (float): seconds a cached entry stays valid
+            path (str): JSON file to persist the cache to, only kept in memory if None
+        """
+        self.log = logging.getLogger(__name__)
+        self.ttl = self.TTL if ttl is None else ttl
+        self.path = path
+        self._entries = {}
+        self._indexed = {}
+        self._lock = threading.RLock()
+        self._load()
+
+    def _load(self):
+        if self.path is None or not os.path.isfile(self.path):
+            return
+        try:
+            with open(self.path, 'r') as f:
+                self._entries = json.load(f)
+        except ValueError:
+            self.log.warning('Resource cache %s is corrupt, ignoring' % self.path)
+            self._entries = {}
+
+    def _save(self):
+        if self.path is None:
+            return
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        with open(self.path, 'w') as f:
+            json.dump(self._entries, f)
+
+    def get(self, stack_name):
+        """Cached resources of a stack, None if missing or expired
+        """
+        with self._lock:
+            entry = self._entries.get(stack_name)
+            if entry is None or time.time() - entry['time'] > self.ttl:
+                return None
+            # entries loaded from the file are indexed on their first lookup
+            if stack_name not in self._indexed:
+                self._indexed[stack_name] = StackResources(entry['resources'])
+            return self._indexed[stack_name]
+
+    def put(self, stack_name, resources):
+        resources = StackResources(resources)
+        with self._lock:
+            self._entries[stack_name] = {'time': time.time(), 'resources': resources.resources}
+            self._indexed[stack_name] = resources
+            self._save()
+        return resources
+
+    def invalidate(self, stack_name=None):
+        """Drops the entry of a stack, or every entry if no stack name is given
+        """
+        with self._lock:
+            if stack_name is None:
+                self._entries = {}
+                self._indexed = {}
+            else:
+                self._entries.pop(stack_name, None)
+                self._indexed.pop(stack_name, None)
+            self._save()
@@ -0,0 +1,93 @@
+import boto3
+import threading
+
+from botocore.config import Config
+
+class ClientRegistry(object):
+    """
+    boto3 clients shared by Cloud, Lambda, Layer and Bucket, created once per service and region
+
+    Creating a client resolves the endpoint and loads the service model, which takes tens of milliseconds,
+    clients are thread safe once created so they are reused by every caller. The botocore configuration is
+    read from the client_config entry of settings.json, with the optional max_pool_connections, retry_mode,
+    max_attempts, connect_timeout, read_timeout and tcp_keepalive keys.
+
+    Clients of other accounts are created from a session of the named profile, see scoped.
+    """
+    MAX_POOL_CONNECTIONS = 50
+    RETRY_MODE = 'adaptive'
+    MAX_ATTEMPTS = 10
+    CONNECT_TIMEOUT = 10
+    READ_TIMEOUT = 60
+    TCP_KEEPALIVE = True
+
+    def __init__(self, settings=None, session=None):
+        """Constructor for the ClientRegistry class
+
+        Args:
+            settings (dict): application settings
+            session (boto3.session.Session): session the clients are created from, a new one if None
+        """
+        config = {} if settings is None else settings.get('client_config', {})
+        self.session = session
+        self.region_name = None
+        self.profile_name = None
+        self.config = Config(
+            max_pool_connections=config.get('max_pool_connections', self.MAX_POOL_CONNECTIONS),
+            retries={
+                'mode': config.get('retry_mode', self.RETRY_MODE),
+                'max_attempts': config.get('max_attempts', self.MAX_ATTEMPTS)
+            },
+            connect_timeout=config.get('connect_timeout', self.CONNECT_TIMEOUT),
+            read_timeout=config.get('read_timeout', self.READ_TIMEOUT),
+            tcp_keepalive=config.get('tcp_keepalive', self.TCP_KEEPALIVE)
+        )
+        self._clients = {}
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def _session(self, profile_name):
+        if profile_name is None:
+            if self.session is None:
+                self.session = boto3.session.Session()
+            return self.session
+        if profile_name not in self._sessions:
+            self._sessions[profile_name] = boto3.session.Session(profile_name=profile_name)
+        return self._sessions[profile_name]
+
+    def client(self, service, region_name=None, profile_name=None):
+        """Client of a service in a region, the region of the session if None
+
+        Args:
+            service (str): name of the AWS service
+            region_name (str): region of the client, the region of the session if None
+            profile_name (str): profile of the account, the session given to the constructor if None
+        """
+        key = (profile_name, service, region_name)
+        with self._lock:
+            # sessions are not thread safe, clients are only created under the lock
+            if key not in self._clients:
+                session = self._session(profile_name)
+                self._clients[key] = session.client(service, region_name=region_name, config=self.config)
+            return self._clients[key]
+
+    def scoped(self, region_name=None, profile_name=None):
+        """View of the registry whose clients default to a region and profile, sharing the created clients
+        """
+        return ScopedClients(self, region_name=region_name, profile_name=profile_name)
+
+    def __len__(self):
+        return len(self._clients)
+
+class ScopedClients(object):
+    """
+    Clients of one deployment target, a region of the account of a profile
+    """
+    def __init__(self, registry, region_name=None, profile_name=None):
+        self.registry = registry
+        self.region_name = region_name
+        self.profile_name = profile_name
+
+    def client(self, service, region_name=None):
+        region_name = self.region_name if region_name is None else region_name
+        return self.registry.client(service, region_name=region_name, profile_name=self.profile_name)
@@ -1,110 +1,601 @@
-import boto3
+import collections
+import datetime
+import hashlib
+import json
 import logging
+import re
 import time
 import uuid
 
-from troposphere import GetAtt, Join, Output, Template, Ref
-from troposphere.apigateway import Integration, IntegrationResponse, Method, MethodResponse, Model, RestApi, Resource
-from troposphere.apigateway import ApiKey, Deployment, Stage, StageKey
-from troposphere.awslambda import Code, Function, Permission
-from troposphere.iam import Policy, Role
-from troposphere.s3 import Bucket, Private
+from botocore.exceptions import ClientError
+from dateutil.parser import isoparse
+from dateutil.tz import tzutc
+
+import sam.bucket
+import sam.cache
+import sam.clients
+import sam.nested
+import sam.state
+import sam.template
+import sam.tracker
 
 class Cloud(object):
+    """
+    Cloudformation stack of the application
+
+    troposphere is only imported by the methods that build the template, querying the stack needs boto3 alone.
+    """
     version = '2010-09-09'
     stage_name = 'v1'
 
-    def __init__(self, settings, session=None):
+    CHANGE_SET_POLL = 2
+    CHANGE_SET_PENDING = ('CREATE_PENDING', 'CREATE_IN_PROGRESS')
+    NO_CHANGES = ("didn't contain changes", 'No updates are to be performed')
+    READY_STATUSES = ('CREATE_COMPLETE', 'UPDATE_COMPLETE')
+    RUNTIME = 'python3.6'
+    ALIAS_NAME = 'live'
+    FUNCTION_TYPE = 'AWS::Lambda::Function'
+    STACK_TYPE = sam.nested.STACK_TYPE
+    TEMPLATE_PREFIX = 'templates'
+
+    def __init__(self, settings, session=None, clients=None, resource_cache=None, state=None):
         self._name = settings['name'] # TODO error check
         self.log = logging.getLogger(self.name)
+        self.settings = settings
 
-        self.client = boto3.client('cloudformation') if session is None else session.client('cloudformation')
-        self.template = Template()
-        self.template.add_version(self.version)
+        self.clients = sam.clients.ClientRegistry(settings, session=session) if clients is None else clients
+        self.client = self.clients.client('cloudformation')
+        self._template = None
 
         self.lambda_role = None
         self.lambda_function = None
+        self.lambda_functions = collections.OrderedDict()
+        self.lambda_aliases = {}
+        self.route_keys = {}
+        self.changes = []
+        self.diff = []
+        self.size_report = None
+        self.state = sam.state.StateFile() if state is None else state
+        if resource_cache is None:
+            resource_cache = sam.cache.ResourceCache(
+                ttl=settings.get('resource_cache_ttl'),
+                path=settings.get('resource_cache_file')
+            )
+        self.resource_cache = resource_cache
+        # the same stack name is deployed to several regions and accounts
+        self.cache_key = '/'.join(part for part in (self.clients.profile_name, self.client.meta.region_name, self.name) if part)
 
     @property
     def name(self):
         return self._name
 
+    @property
+    def template(self):
+        if self._template is None:
+            from troposphere import Template
+            self._template = Template()
+            self._template.set_version(self.version)
+        return self._template
+
     @property
     def function_name(self):
-        if not self.is_deployed():
+        if self.resource_cache.get(self.cache_key) is None and not self.is_deployed():
+            return None
+        function_resource = self.get_resource(self.FUNCTION_TYPE)
+        if function_resource is None:
             return None
-        function_resource = self.get_resource(Function.resource_type)
         function_name = function_resource['PhysicalResourceId']
         return function_name
 
+    @property
+    def function_names(self):
+        """Physical names of all deployed AWS Lambda functions, keyed by their logical name
+        """
+        if self.resource_cache.get(self.cache_key) is None and not self.is_deployed():
+            return {}
+        resources = self.stack_resources().by_type(self.FUNCTION_TYPE)
+        return dict((resource['LogicalResourceId'], resource['PhysicalResourceId']) for resource in resources)
+
     def is_deployed(self):
         result = self.stack_exists(self.name)
         return result
 
     def add_s3_bucket(self, bucket_name, bucket_description=''):
+        from troposphere import Output, Ref
+        from troposphere.s3 import Bucket, Private
         self.log.info('Adding S3 Bucket %s' % bucket_name)
         bucket = Bucket(bucket_name, AccessControl=Private)
         self.template.add_resource(bucket)
         self.template.add_output(Output(bucket_name, Value=Ref(bucket), Description=bucket_description))
 
-    def deploy(self, dry=False):
+    def deploy(self, dry=False, replace=False, wait=False, callback=None, detach=False):
         """Deploys currently specified Cloudformation template (via troposphere)
 
-        If a Cloudformation stack already exists, then the deploy function will automatically handle
-        deletion of the stack and wait. After the Cloudformation stack is deleted, then the new stack
-        template is uploaded to Cloudformation.
+        If a Cloudformation stack already exists, then the stack is updated in place through a change set,
+        which is skipped if it does not contain any changes. With replace, the existing stack is deleted
+        instead and the new stack template is uploaded to Cloudformation once the deletion is done.
+
+        The template is rendered as minified JSON and sent inline, or uploaded to the bucket and passed as
+        TemplateURL when it exceeds the inline limit or template_upload is set in settings.json.
+
+        The hash of the last deployed template is kept in the state file. When it matches the rendered
+        template and get_template confirms the stack still runs it, nothing is sent to Cloudformation.
+        Otherwise the resources that changed since the last deploy are logged and kept in self.diff.
+
+        Every stack operation is recorded in the state file as it starts, see record_operation, so that a
+        deploy that does not wait can be followed later with resume. Without wait, a deploy still blocks while
+        the change set of an update is created and while the stack of a replace is deleted. A detached deploy
+        returns as soon as its operation is recorded: an update is sent with update_stack, without a change
+        set, and a replace only starts the deletion, resume creates the stack once the deletion is done.
+
+        With nested_stacks in settings.json, the functions and the resources that only serve them are moved
+        into nested stacks, see nested_groups and nest.
 
         Args:
             dry (bool): no changes are transmitted to AWS
+            replace (bool): delete and recreate an existing stack instead of updating it
+            wait (bool): block until the stack operation reaches a terminal state
+            callback (callable): called with every stack event while waiting
+            detach (bool): return once the stack operation is recorded, without polling the stack
         """
+        if wait and detach:
+            raise Exception('A deploy cannot both wait and detach')
         self.log.info('Deploying Cloudformation Template...')
-        template_body = self.template.to_json()
-        if self.stack_exists(self.name) and not dry:
+        template_body = sam.template.render(self.template)
+        self.size_report = sam.template.size_report(template_body)
+        for line in sam.template.format_size_report(self.size_report):
+            self.log.info(line)
+        resources = sam.template.resource_digests(template_body)
+        if self.settings.get('nested_stacks'):
+            template_body = self.nest(template_body, upload=not dry)
+        template_hash = sam.template.template_hash(template_body)
+        self.changes = []
+        stack_status = self.stack_status()
+        exists = self.is_existing(stack_status)
+        if stack_status == 'ROLLBACK_COMPLETE' and not replace:
+            self.log.warning('Cloudformation stack %s failed to create and cannot be updated, replacing...' % self.name)
+            replace = True
+        recorded = self.state.get(self.cache_key) if exists else {}
+        if exists and not replace and recorded.get('template_hash') == template_hash:
+            if self.deployed_template_hash() == template_hash:
+                self.log.info('Cloudformation stack %s is up to date' % self.name)
+                self.diff = []
+                return None
+            recorded = {}
+        baseline = {} if replace or not exists else recorded.get('resources')
+        # without a record of the last deploy, the change set is the only diff
+        self.diff = [] if baseline is None else sam.template.diff_resources(baseline, resources)
+        for line in sam.template.format_diff(self.diff):
+            self.log.info(line)
+        if exists and replace and not dry:
             self.log.info('Cloudformation stack exists, deleting...')
-            status = self.client.delete_stack(StackName=self.name)
-            while self.stack_exists(self.name):
-                self.log.info('Deleting Cloudformation stack, sleeping for 5 seconds...')
-                time.sleep(5)
-        self.log.info('Creating Cloudformation stack %s' % self.name)
+            since = datetime.datetime.now(tzutc())
+            tracker = self.tracker()
+            tracker.status() # resolve the stack ID, the stack name stops resolving once deleted
+            token = self.client_request_token()
+            status = self.client.delete_stack(StackName=self.name, ClientRequestToken=token)
+            self.record_operation('DELETE', stack_id=tracker.stack_id, token=token, since=since, then='CREATE' if detach else None)
+            self.resource_cache.invalidate(self.cache_key)
+            if detach:
+                return status
+            self.finish_operation(tracker.wait(callback=callback))
+            exists = False
         if dry:
-            self.log.warn('Running in dry mode, not deploying...')
+            self.log.warning('Running in dry mode, not deploying...')
+            return None
+        since = datetime.datetime.now(tzutc())
+        self.resource_cache.invalidate(self.cache_key)
+        if exists and detach:
+            status = self.start_update(template_body, since=since)
+        elif exists:
+            status = self.update_stack(template_body, since=since)
+        else:
+            self.log.info('Creating Cloudformation stack %s' % self.name)
+            token = self.client_request_token()
+            status = self.client.create_stack(
+                StackName=self.name,
+                Capabilities=['CAPABILITY_IAM'],
+                ClientRequestToken=token,
+                **self.template_source(template_body)
+            )
+            self.record_operation('CREATE', stack_id=status.get('StackId'), token=token, since=since)
+        self.state.update(self.cache_key, template_hash=template_hash, resources=resources)
+        if wait and status is not None:
+            self.finish_operation(self.wait(callback=callback, since=since))
+            # resources read while the stack was changing are stale
+            self.resource_cache.invalidate(self.cache_key)
+        return status
+
+    def template_source(self, template_body):
+        """TemplateBody argument of create_stack and create_change_set, or TemplateURL of the template uploaded to S3
+
+        Uploads are content-addressed by the template hash, an unchanged template is never uploaded again.
+        """
+        size = len(template_body.encode('utf-8'))
+        if size <= sam.template.TEMPLATE_BODY_LIMIT and not self.settings.get('template_upload'):
+            return {'TemplateBody': template_body}
+        return {'TemplateURL': self.upload_template(template_body)}
+
+    def upload_template(self, template_body, upload=True):
+        """Uploads a template to the bucket under its hash, unless it is already there
+
+        Args:
+            template_body (str): rendered Cloudformation template
+            upload (bool): only compute the URL, without sending anything to S3
+
+        Returns:
+            str: URL of the template
+        """
+        size = len(template_body.encode('utf-8'))
+        if size > sam.template.TEMPLATE_URL_LIMIT:
+            raise Exception('Template of stack %s is %d bytes, over the %d byte limit' % (self.name, size, sam.template.TEMPLATE_URL_LIMIT))
+        # a dry run only computes the URL, it does not pick a bucket for the next runs
+        if upload:
+            bucket = sam.bucket.Bucket.shared(self.settings, clients=self.clients)
+        else:
+            bucket = sam.bucket.Bucket(self.settings, clients=self.clients)
+        key = '%s/%s/%s.json' % (self.TEMPLATE_PREFIX, self.name, sam.template.template_hash(template_body))
+        if upload and not bucket.object_exists(key):
+            bucket.create_bucket()
+            self.log.info('Uploading template to s3://%s/%s' % (bucket.name, key))
+            bucket.put_object(key, template_body.encode('utf-8'))
+        return bucket.url(key)
+
+    def nested_groups(self):
+        """Functions of every nested stack, from the nested_stacks entry of settings.json
+
+        nested_stacks is either true, one nested stack per function, or a dict of group names to the
+        logical names of their functions. Functions left out of every group stay in the root stack.
+
+        Returns:
+            dict: group name to the list of logical names of its functions
+        """
+        config = self.settings.get('nested_stacks')
+        if isinstance(config, dict):
+            return dict((group, list(functions)) for group, functions in config.items())
+        return dict((name, [name]) for name in self.lambda_functions)
+
+    def nest(self, template_body, upload=True):
+        """Splits a rendered template into a root stack and one nested stack per group
+
+        Every nested template is uploaded content-addressed like template_source does, so an unchanged group
+        keeps its TemplateURL and Cloudformation leaves its nested stack alone.
+
+        Args:
+            template_body (str): rendered Cloudformation template
+            upload (bool): only compute the TemplateURL of the nested templates, without uploading them
+
+        Returns:
+            str: rendered root template
+        """
+        template = sam.template.load(template_body)
+        assignment = sam.nested.assign(template, self.nested_groups())
+        root, children = sam.nested.partition(template, assignment)
+        for group, child in children.items():
+            child_body = json.dumps(child, separators=(',', ':'))
+            self.log.info('Nested stack %s: %d resources, %d bytes' % (group, len(child['Resources']), len(child_body)))
+            url = self.upload_template(child_body, upload=upload)
+            root['Resources'][sam.nested.stack_name(group)]['Properties']['TemplateURL'] = url
+        return json.dumps(root, separators=(',', ':'))
+
+    def deployed_template_hash(self):
+        """Hash of the template the stack currently runs, None if it cannot be read
+        """
+        try:
+            response = self.client.get_template(StackName=self.name, TemplateStage='Original')
+        except ClientError as e:
+            self.log.info('Unable to read the template of stack %s: %s' % (self.name, e))
+            return None
+        return sam.template.template_hash(response['TemplateBody'])
+
+    def tracker(self, since=None, stack_name=None):
+        stack_name = self.name if stack_name is None else stack_name
+        return sam.tracker.StackTracker(self.client, stack_name, since=since, log=self.log)
+
+    @staticmethod
+    def client_request_token():
+        '''
+        Token of a stack operation, Cloudformation tags every event the operation causes with it
+        '''
+        return 'sapling-%s' % uuid.uuid4().hex
+
+    def record_operation(self, action, stack_id=None, token=None, since=None, then=None):
+        """Records a stack operation that was just started in the state file
+
+        Args:
+            action (str): CREATE, UPDATE or DELETE
+            stack_id (str): ID of the stack, which keeps resolving once the stack is deleted
+            token (str): ClientRequestToken of the operation
+            since (datetime.datetime): when the operation started, defaults to now
+            then (str): action left to do once the operation is complete, CREATE for a detached replace
+
+        Returns:
+            dict: the recorded operation
+        """
+        since = datetime.datetime.now(tzutc()) if since is None else since
+        operation = {
+            'action': action,
+            'stack_id': stack_id or self.name,
+            'token': token,
+            'started': since.isoformat(),
+            'status': None
+        }
+        if then is not None:
+            operation['then'] = then
+        self.state.update(self.cache_key, operation=operation)
+        return operation
+
+    def finish_operation(self, status):
+        """Records the terminal status of the last stack operation
+        """
+        operation = self.operation()
+        if operation is not None:
+            operation['status'] = status
+            self.state.update(self.cache_key, operation=operation)
+
+    def operation(self):
+        """Last stack operation recorded in the state file, None if there is none
+        """
+        return self.state.get(self.cache_key).get('operation')
+
+    def resume(self, wait=True, callback=None):
+        """Reattaches to the last recorded stack operation, replaying its events from the stack event history
+
+        Args:
+            wait (bool): block until the operation reaches a terminal state, otherwise only report its progress so far
+            callback (callable): called with every stack event of the operation
+
+        Returns:
+            str: the status of the stack, None if it does not exist or no operation was recorded
+        """
+        operation = self.operation()
+        if operation is None:
+            self.log.info('No operation of stack %s recorded' % self.name)
             return None
-        status = self.client.create_stack(StackName=self.name, TemplateBody=template_body, Capabilities=['CAPABILITY_IAM'])
+        tracker = self.tracker(since=isoparse(operation['started']), stack_name=operation['stack_id'])
+        if wait:
+            status = tracker.wait(callback=callback)
+        else:
+            status = tracker.status()
+            for event in tracker.new_events():
+                self.log.info(tracker.format_event(event))
+                if callback is not None:
+                    callback(event)
+        if tracker.is_terminal(status):
+            self.finish_operation(status)
+            # resources read while the stack was changing are stale
+            self.resource_cache.invalidate(self.cache_key)
+        return status
+
+    def wait(self, callback=None, since=None):
+        """Blocks until the stack reaches a terminal state, reporting its events as they happen
+
+        Args:
+            callback (callable): called with every new stack event
+            since (datetime.datetime): only report events from this point in time, defaults to now
+
+        Returns:
+            str: the terminal status of the stack, None if it does not exist
+        """
+        return self.tracker(since=since).wait(callback=callback)
+
+    def update_stack(self, template_body, since=None):
+        """Updates the existing Cloudformation stack in place through a change set
+
+        The resource-level changes are logged and kept in self.changes. An empty change set is deleted
+        without being executed.
+
+        Args:
+            template_body (str): rendered Cloudformation template
+            since (datetime.datetime): when the update started, recorded with the operation
+
+        Returns:
+            dict: the execute_change_set response, or None if there was nothing to update
+        """
+        change_set_name = 'sapling-%s' % uuid.uuid4().hex
+        self.log.info('Creating change set %s for Cloudformation stack %s' % (change_set_name, self.name))
+        response = self.client.create_change_set(
+            StackName=self.name,
+            ChangeSetName=change_set_name,
+            ChangeSetType='UPDATE',
+            Capabilities=['CAPABILITY_IAM'],
+            **self.template_source(template_body)
+        )
+        change_set = self.describe_change_set(change_set_name)
+        while change_set['Status'] in self.CHANGE_SET_PENDING:
+            self.log.info('Waiting for change set, sleeping for %s seconds...' % self.CHANGE_SET_POLL)
+            time.sleep(self.CHANGE_SET_POLL)
+            change_set = self.describe_change_set(change_set_name)
+
+        if change_set['Status'] == 'FAILED':
+            reason = change_set.get('StatusReason', '')
+            self.client.delete_change_set(StackName=self.name, ChangeSetName=change_set_name)
+            if any(message in reason for message in self.NO_CHANGES):
+                self.log.info('Cloudformation stack %s is up to date' % self.name)
+                return None
+            raise Exception('Change set %s failed: %s' % (change_set_name, reason))
+
+        self.changes = change_set['Changes']
+        for line in self.format_changes(self.changes):
+            self.log.info(line)
+        if not self.changes:
+            self.client.delete_change_set(StackName=self.name, ChangeSetName=change_set_name)
+            return None
+
+        token = self.client_request_token()
+        status = self.client.execute_change_set(StackName=self.name, ChangeSetName=change_set_name, ClientRequestToken=token)
+        self.record_operation('UPDATE', stack_id=response.get('StackId'), token=token, since=since)
+        return status
+
+    def start_update(self, template_body, since=None):
+        """Starts an update of the existing Cloudformation stack without a change set, nothing is polled
+
+        Args:
+            template_body (str): rendered Cloudformation template
+            since (datetime.datetime): when the update started, recorded with the operation
+
+        Returns:
+            dict: the update_stack response, or None if there was nothing to update
+        """
+        self.log.info('Updating Cloudformation stack %s' % self.name)
+        token = self.client_request_token()
+        try:
+            status = self.client.update_stack(
+                StackName=self.name,
+                Capabilities=['CAPABILITY_IAM'],
+                ClientRequestToken=token,
+                **self.template_source(template_body)
+            )
+        except ClientError as e:
+            if any(message in e.response['Error'].get('Message', '') for message in self.NO_CHANGES):
+                self.log.info('Cloudformation stack %s is up to date' % self.name)
+                return None
+            raise
+        self.record_operation('UPDATE', stack_id=status.get('StackId'), token=token, since=since)
         return status
 
+    def describe_change_set(self, change_set_name):
+        """Describes a change set, following pagination of its changes
+        """
+        response = self.client.describe_change_set(StackName=self.name, ChangeSetName=change_set_name)
+        changes = list(response.get('Changes', []))
+        while response.get('NextToken'):
+            response = self.client.describe_change_set(StackName=self.name, ChangeSetName=change_set_name, NextToken=response['NextToken'])
+            changes.extend(response.get('Changes', []))
+        response['Changes'] = changes
+        return response
+
+    @staticmethod
+    def format_changes(changes):
+        """Renders change set changes as one line per resource, e.g. Modify MyFunction (AWS::Lambda::Function)
+        """
+        lines = []
+        for change in changes:
+            resource = change.get('ResourceChange', {})
+            line = '%s %s (%s)' % (resource.get('Action'), resource.get('LogicalResourceId'), resource.get('ResourceType'))
+            if resource.get('Replacement') in ('True', 'Conditional'):
+                line += ' replacement: %s' % resource['Replacement']
+            lines.append(line)
+        return lines
+
+    def stack_status(self, stack_name=None):
+        """Looks up the status of a single Cloudformation stack
+
+        The stack is described directly by name. If describe_stacks is not permitted, the stack summaries
+        are scanned page by page instead, stopping at the first match.
+
+        Args:
+            stack_name (str): name of the stack, defaults to the name of this cloud
+
+        Returns:
+            str: the StackStatus, None if the stack does not exist
+        """
+        stack_name = self.name if stack_name is None else stack_name
+        try:
+            response = self.client.describe_stacks(StackName=stack_name)
+        except ClientError as e:
+            error = e.response['Error']
+            if 'does not exist' in error.get('Message', ''):
+                return None
+            self.log.warning('Unable to describe stack %s (%s), scanning stack summaries' % (stack_name, error.get('Code')))
+            return self._scan_stack_status(stack_name)
+        for stack in response['Stacks']:
+            if stack['StackName'] == stack_name or stack['StackId'] == stack_name:
+                return stack['StackStatus']
+        return None
+
+    def _scan_stack_status(self, stack_name):
+        paginator = self.client.get_paginator('list_stacks')
+        for page in paginator.paginate():
+            for stack in page['StackSummaries']:
+                if stack['StackName'] == stack_name and stack['StackStatus'] != 'DELETE_COMPLETE':
+                    return stack['StackStatus']
+        return None
+
+    @classmethod
+    def is_existing(cls, status):
+        return status is not None and status != 'DELETE_COMPLETE'
+
+    @classmethod
+    def is_ready(cls, status):
+        return status in cls.READY_STATUSES
+
     def stack_exists(self, stack_name):
-        stacks = self.client.list_stacks(StackStatusFilter=['CREATE_IN_PROGRESS', 'CREATE_FAILED', 'CREATE_COMPLETE', 'DELETE_IN_PROGRESS', 'DELETE_FAILED', 'ROLLBACK_COMPLETE', 'ROLLBACK_IN_PROGRESS', 'UPDATE_ROLLBACK_COMPLETE'])
-        for stack in stacks['StackSummaries']:
-            if stack['StackName'] == stack_name:
-                return True
-        return False
+        return self.is_existing(self.stack_status(stack_name))
 
     def stack_ready(self, stack_name):
-        stacks = self.client.list_stacks(StackStatusFilter=['CREATE_COMPLETE'])
-        for stack in stacks['StackSummaries']:
-            if stack['StackName'] == stack_name:
-                return True
-        return False
+        return self.is_ready(self.stack_status(stack_name))
+
+    def stack_resources(self):
+        """Resources of the deployed stack, served from the resource cache while it is fresh
+
+        The resources of nested stacks are listed along with the resources of the root stack.
+
+        Returns:
+            sam.cache.StackResources: resources indexed by ResourceType and LogicalResourceId
+        """
+        resources = self.resource_cache.get(self.cache_key)
+        if resources is not None:
+            return resources
+        summaries = []
+        stacks = [self.name]
+        while stacks:
+            stack_name = stacks.pop(0)
+            response = self.client.list_stack_resources(StackName=stack_name)
+            page = list(response['StackResourceSummaries'])
+            while response.get('NextToken'):
+                response = self.client.list_stack_resources(StackName=stack_name, NextToken=response['NextToken'])
+                page.extend(response['StackResourceSummaries'])
+            summaries.extend(page)
+            stacks.extend(
+                summary['PhysicalResourceId'] for summary in page
+                if summary['ResourceType'] == self.STACK_TYPE and summary.get('PhysicalResourceId')
+            )
+        return self.resource_cache.put(self.cache_key, summaries)
 
     def list_stack_resources(self):
-        response = self.client.list_stack_resources(StackName=self.name)
-        resources = response['StackResourceSummaries']
+        resources = self.stack_resources().resources
         return resources
 
     def get_resource(self, resource_type):
-        resources = self.list_stack_resources()
-        for resource in resources:
-            if resource['ResourceType'] == resource_type:
-                return resource
-        return None
+        resources = self.stack_resources().by_type(resource_type)
+        return resources[0] if resources else None
 
-    def add_lambda(self, lambda_name, lambda_role_name=None, lambda_handler='index.handler'):
+    def get_resource_by_logical_id(self, logical_id):
+        return self.stack_resources().by_logical_id(logical_id)
+
+    def add_lambda(self, lambda_name, lambda_role_name=None, lambda_handler='index.handler', memory_size=None, timeout=None,
+            layers=None, runtime=None, reserved_concurrency=None, architecture=None, provisioned_concurrency=None, alias=None):
+        """Adds an AWS Lambda function to the template
+
+        Functions added after the first one share its execution role, the first function is the one
+        the API Gateway proxies to.
+
+        With an alias or provisioned concurrency, a Version and an Alias pointing at it are added as well, the
+        provisioned concurrency is configured on the alias and the API Gateway invokes the alias.
+
+        Args:
+            lambda_name (str): logical name of the function
+            lambda_role_name (str): logical name of the execution role
+            lambda_handler (str): handler of the function
+            memory_size (int): memory of the function in MB, AWS default if None
+            timeout (int): timeout of the function in seconds, AWS default if None
+            layers (list): ARNs of the layer versions to attach to the function
+            runtime (str): runtime of the function, defaults to RUNTIME
+            reserved_concurrency (int): concurrent executions reserved for the function
+            architecture (str): instruction set of the function, x86_64 or arm64
+            provisioned_concurrency (int): pre-initialized execution environments kept warm on the alias
+            alias (str): name of the alias, defaults to ALIAS_NAME if provisioned concurrency is set
+        """
+        from troposphere import GetAtt, Join
+        from troposphere.awslambda import Code, Function
         self.log.info('Adding AWS Lambda Function %s with handler %s' % (lambda_name, lambda_handler))
-        if lambda_role_name is None:
-            self.lambda_role = self.create_lambda_role()
-        else:
-            self.lambda_role = self.create_lambda_role(lambda_role_name)
-        self.template.add_resource(self.lambda_role)
+        if self.lambda_role is None:
+            if lambda_role_name is None:
+                self.lambda_role = self.create_lambda_role()
+            else:
+                self.lambda_role = self.create_lambda_role(lambda_role_name)
+            self.template.add_resource(self.lambda_role)
 
         code = Code(ZipFile=Join('\n', [
             'import json',
@@ -118,16 +609,80 @@ class Cloud(object):
             '\t}',
             '\treturn response'
         ])) # add default function, update later through upload
-        self.lambda_function = Function(
+        properties = {}
+        if memory_size is not None:
+            properties['MemorySize'] = memory_size
+        if timeout is not None:
+            properties['Timeout'] = timeout
+        if layers:
+            properties['Layers'] = layers
+        if reserved_concurrency is not None:
+            properties['ReservedConcurrentExecutions'] = reserved_concurrency
+        if architecture is not None:
+            properties['Architectures'] = [architecture]
+        function = Function(
             lambda_name,
             Code=code,
             Handler=lambda_handler,
-            Runtime='python3.6',
-            Role=GetAtt(self.lambda_role, 'Arn')
+            Runtime=self.RUNTIME if runtime is None else runtime,
+            Role=GetAtt(self.lambda_role, 'Arn'),
+            **properties
+        )
+        self.template.add_resource(function)
+        self.lambda_functions[lambda_name] = function
+        if self.lambda_function is None:
+            self.lambda_function = function
+
+        if alias is not None or provisioned_concurrency:
+            self.add_lambda_alias(function, self.ALIAS_NAME if alias is None else alias, provisioned_concurrency)
+        return function
+
+    def add_lambda_alias(self, function, alias_name, provisioned_concurrency=None):
+        """Adds a Version of the function and an Alias pointing at it, with optional provisioned concurrency
+
+        The logical ID of the Version carries a digest of the function and alias configuration. A stack update
+        that changes either publishes a new version of the current code, instead of pointing the alias back at
+        the version the stack was created with. Code updates publish their versions through publish_alias.
+        """
+        from troposphere import GetAtt, Ref
+        from troposphere.awslambda import Alias, ProvisionedConcurrencyConfiguration, Version
+        digest = sam.template.template_hash({
+            'Function': function.to_dict(),
+            'Alias': {'Name': alias_name, 'ProvisionedConcurrency': provisioned_concurrency}
+        })
+        version = Version('%sVersion%s' % (function.title, digest[:10]), FunctionName=Ref(function))
+        self.template.add_resource(version)
+        properties = {}
+        if provisioned_concurrency:
+            properties['ProvisionedConcurrencyConfig'] = ProvisionedConcurrencyConfiguration(
+                ProvisionedConcurrentExecutions=provisioned_concurrency
+            )
+        alias = Alias(
+            '%sAlias' % function.title,
+            FunctionName=Ref(function),
+            FunctionVersion=GetAtt(version, 'Version'),
+            Name=alias_name,
+            **properties
         )
-        self.template.add_resource(self.lambda_function)
+        self.template.add_resource(alias)
+        self.lambda_aliases[function.title] = alias
+        return alias
+
+    def function_target(self, function=None):
+        """ARN to invoke a function through, its alias if it has one
+
+        Args:
+            function (troposphere.awslambda.Function): defaults to the API Gateway function
+        """
+        from troposphere import GetAtt, Ref
+        function = self.lambda_function if function is None else function
+        alias = self.lambda_aliases.get(function.title)
+        if alias is not None:
+            return Ref(alias)
+        return GetAtt(function, 'Arn')
 
     def create_lambda_role(self, lambda_role_name='LambdaExecutionRole'):
+        from troposphere.iam import Policy, Role
         self.log.info('Creating AWS Lambda Role %s' % lambda_role_name)
         role = Role(lambda_role_name,
                 Path='/',
@@ -178,72 +733,113 @@ class Cloud(object):
             )
         return role
 
-    def add_api_gateway(self, apigateway_name):
+    @staticmethod
+    def cache_key_parameter(parameter):
+        """Method request parameter of a cache key, e.g. path.proxy or querystring.page
+        """
+        return parameter if parameter.startswith('method.request.') else 'method.request.%s' % parameter
+
+    @staticmethod
+    def route_name(route_key):
+        """Logical name fragment of a route path or HTTP API route key, e.g. GetItemsIdParam for GET /items/{id}
+
+        A path parameter ends with Param, a greedy one such as {proxy+} with Greedy, so that /items/{id}
+        and /items/id get different names.
+        """
+        words = []
+        for segment in re.split(r'[\s/]+', route_key):
+            parameter = re.match(r'^\{(.*?)(\+?)\}$', segment)
+            if parameter:
+                segment = parameter.group(1)
+            words.extend(word[:1].upper() + word[1:].lower() for word in re.findall(r'[A-Za-z0-9]+', segment))
+            if parameter:
+                words.append('Greedy' if parameter.group(2) else 'Param')
+        return ''.join(words) or 'Root'
+
+    def unique_route_name(self, route_key):
+        """route_name of a route key, with a hash of the key appended when another key of the template has that name
+        """
+        name = self.route_name(route_key)
+        if self.route_keys.setdefault(name, route_key) != route_key:
+            name = '%s%s' % (name, hashlib.sha256(route_key.encode('utf-8')).hexdigest()[:8])
+            self.route_keys.setdefault(name, route_key)
+        return name
+
+    @staticmethod
+    def resource_path(path):
+        """ResourcePath of a method setting, the slashes of the path encoded as ~1, e.g. /~1items~1{id}
+        """
+        return '/' + ''.join('~1%s' % segment for segment in path.split('/') if segment)
+
+    def routes(self, routes):
+        """Normalizes a route table, the routes section of api_gateway in settings.json
+
+        Every route has a path, an HTTP method (ANY by default) and the logical name of the function it invokes
+        (the first function by default), and optionally its own cache and throttling settings.
+
+        Returns:
+            list: routes with the path normalized to /a/b, the method upper case and the function resolved
+        """
+        table = []
+        for route in routes:
+            function_name = route.get('function')
+            function = self.lambda_function if function_name is None else self.lambda_functions.get(function_name)
+            if function is None:
+                raise Exception('Function %s of route %s not found' % (function_name, route['path']))
+            path = '/' + '/'.join(segment for segment in route['path'].split('/') if segment)
+            table.append(dict(route, path=path, method=route.get('method', 'ANY').upper(), function=function))
+        return table
+
+    def add_api_gateway(self, apigateway_name, cache=None, throttling=None, minimum_compression_size=None, routes=None):
+        """Adds a REST API invoking the AWS Lambda functions
+
+        Without routes, every path of the {proxy+} resource is proxied to the first function. With a route table,
+        a Resource is added per path segment, shared by the routes with a common prefix, and a Method per route
+        invokes the function of the route.
+
+        A cache cluster and throttling are configured on the stage. In the {proxy+} case, the cached methods,
+        GET by default, and the methods with their own throttling are added next to the ANY method, which API
+        Gateway only uses for the other HTTP methods, since caching and method settings apply to a method and
+        not to ANY. A route is cached if its method is one of the cached methods, unless its cache is false.
+
+        Args:
+            apigateway_name (str): logical name of the REST API
+            cache (dict): stage cache with the size (GB, e.g. "0.5"), ttl (seconds), encrypted, methods (HTTP
+                methods to cache) and key_parameters (e.g. querystring.page, path.proxy by default) keys
+            throttling (dict): stage throttling with the rate (requests per second) and burst keys, and a
+                methods map of HTTP methods to their own rate and burst
+            minimum_compression_size (int): smallest response in bytes that is compressed, no compression if None
+            routes (list): path, method, function and the optional cache (true, false or a dict overriding ttl,
+                key_parameters and encrypted) and throttling (rate and burst) of every route, the path parameters
+                of a route are always part of its cache key
+        """
+        from troposphere import Ref
+        from troposphere.apigateway import ApiKey, Deployment, RestApi
+        from troposphere.apigateway import Stage, StageKey
         self.log.info('Adding API Gateway %s' % apigateway_name)
         assert(self.lambda_function is not None)
+        cache = {} if cache is None else cache
+        throttling = {} if throttling is None else throttling
         # define all value used by api gateway
-        lambda_method_name = '%sLambdaMethod' % apigateway_name
-        lambda_permission_name = '%sLambdaPermission' % apigateway_name
-        resource_name = '%sResource' % apigateway_name
-        deployment_name = '%sDeployment' % self.stage_name
         apikey_name = '%sApiKey' % apigateway_name
 
         # start creating api gateway template
         self.apigateway = RestApi(apigateway_name, Name=apigateway_name)
+        if minimum_compression_size is not None:
+            self.apigateway.MinimumCompressionSize = minimum_compression_size
         self.template.add_resource(self.apigateway)
 
-        resource = Resource(
-            resource_name,
-            RestApiId=Ref(self.apigateway),
-            PathPart='{proxy+}',
-            ParentId=GetAtt(apigateway_name, 'RootResourceId')
-        )
-        self.template.add_resource(resource)
-
-        permission = Permission(
-            lambda_permission_name,
-            Action='lambda:invokeFunction',
-            FunctionName=GetAtt(self.lambda_function, 'Arn'),
-            Principal='apigateway.amazonaws.com',
-            SourceArn=Join("", [
-                'arn:aws:execute-api:',
-                Ref('AWS::Region'), ':',
-                Ref('AWS::AccountId'), ':',
-                Ref(self.apigateway), '/*'
-            ])
-        )
-        self.template.add_resource(permission)
-
-        method = Method(
-            lambda_method_name,
-            DependsOn=lambda_permission_name,
-            RestApiId=Ref(self.apigateway),
-            ResourceId=Ref(resource),
-            HttpMethod='ANY',
-            AuthorizationType='NONE',
-            Integration=Integration(
-                Type='AWS_PROXY',
-                IntegrationHttpMethod='POST',
-                Uri=Join("", [
-                    'arn:aws:apigateway:',
-                    Ref('AWS::Region'),
-                    ':lambda:path/2015-03-31/functions/',
-                    GetAtt(self.lambda_function, 'Arn'),
-                    '/invocations'
-                ])
-            ),
-            MethodResponses=[
-                MethodResponse(
-                    StatusCode='200'
-                )
-            ]
-        )
-        self.template.add_resource(method)
+        if routes:
+            method_names, method_settings = self._add_routes(apigateway_name, routes, cache, throttling)
+        else:
+            method_names, method_settings = self._add_proxy(apigateway_name, cache, throttling)
+        if throttling.get('rate') is not None or throttling.get('burst') is not None:
+            method_settings.insert(0, self._method_setting('/*', '*', throttling))
 
-        # create a deployment
+        # a deployment is a snapshot of the API, a new one is only created when its logical ID changes
         deployment = Deployment(
-            deployment_name,
-            DependsOn=lambda_method_name,
+            '%sDeployment%s' % (self.stage_name, self.api_digest()[:10]),
+            DependsOn=method_names if len(method_names) > 1 else method_names[0],
             RestApiId=Ref(self.apigateway)
         )
         self.template.add_resource(deployment)
@@ -254,6 +850,11 @@ class Cloud(object):
             RestApiId=Ref(self.apigateway),
             DeploymentId=Ref(deployment)
         )
+        if cache or any(setting.properties.get('CachingEnabled') for setting in method_settings):
+            stage.CacheClusterEnabled = True
+            stage.CacheClusterSize = str(cache.get('size', '0.5'))
+        if method_settings:
+            stage.MethodSettings = method_settings
         self.template.add_resource(stage)
 
         key = ApiKey(
@@ -264,3 +865,282 @@ class Cloud(object):
             )]
         )
         self.template.add_resource(key)
+
+    def api_digest(self):
+        """SHA-256 of the Resources and Methods of the REST API in the template
+
+        Stack updates leave a Deployment alone unless its logical ID changes, so the ID carries this digest
+        and every change of a path or method deploys the API again.
+        """
+        api_resources = dict(
+            (name, resource.to_dict()) for name, resource in self.template.resources.items()
+            if resource.resource_type in ('AWS::ApiGateway::Resource', 'AWS::ApiGateway::Method')
+        )
+        return sam.template.template_hash(api_resources)
+
+    def _add_proxy(self, apigateway_name, cache, throttling):
+        from troposphere import GetAtt, Ref
+        from troposphere.apigateway import Resource
+        lambda_method_name = '%sLambdaMethod' % apigateway_name
+        resource = Resource(
+            '%sResource' % apigateway_name,
+            RestApiId=Ref(self.apigateway),
+            PathPart='{proxy+}',
+            ParentId=GetAtt(apigateway_name, 'RootResourceId')
+        )
+        self.template.add_resource(resource)
+        permission_name = self._invoke_permission(apigateway_name, self.lambda_function)
+        self.template.add_resource(self._proxy_method(lambda_method_name, 'ANY', Ref(resource), permission_name))
+
+        cached_methods = [http_method.upper() for http_method in cache.get('methods', ['GET'])] if cache else []
+        throttled_methods = dict((http_method.upper(), limits) for http_method, limits in throttling.get('methods', {}).items())
+        # the greedy path is the cache key by default, or every path would share one cache entry
+        key_parameters = [self.cache_key_parameter(parameter) for parameter in cache.get('key_parameters', ['path.proxy'])]
+        method_names = [lambda_method_name]
+        method_settings = []
+        for http_method in sorted(set(cached_methods) | set(throttled_methods)):
+            method_name = '%s%sMethod' % (apigateway_name, http_method.title())
+            cached = http_method in cached_methods
+            self.template.add_resource(self._proxy_method(
+                method_name, http_method, Ref(resource), permission_name,
+                cache_key_parameters=key_parameters if cached else None
+            ))
+            method_names.append(method_name)
+            setting = self._method_setting('/~1{proxy+}', http_method, throttled_methods.get(http_method, throttling))
+            if cached:
+                self._enable_caching(setting, cache)
+            method_settings.append(setting)
+        return method_names, method_settings
+
+    def _add_routes(self, apigateway_name, routes, cache, throttling):
+        from troposphere import GetAtt, Ref
+        from troposphere.apigateway import Resource
+        resources = {}
+
+        def resource_id(path):
+            if path == '/':
+                return GetAtt(apigateway_name, 'RootResourceId')
+            if path not in resources:
+                parent, part = path.rsplit('/', 1)
+                # routes sharing a prefix share its resource
+                parent_id = resource_id(parent or '/')
+                resource = Resource('%s%sResource' % (apigateway_name, self.unique_route_name(path)), RestApiId=Ref(self.apigateway), PathPart=part, ParentId=parent_id)
+                self.template.add_resource(resource)
+                resources[path] = resource
+            return Ref(resources[path])
+
+        cached_methods = [http_method.upper() for http_method in cache.get('methods', ['GET'])] if cache else []
+        throttled_methods = dict((http_method.upper(), limits) for http_method, limits in throttling.get('methods', {}).items())
+        method_names = []
+        method_settings = []
+        for route in self.routes(routes):
+            path, http_method = route['path'], route['method']
+            method_name = '%s%s%sMethod' % (apigateway_name, self.unique_route_name(path), http_method.title())
+            if method_name in self.template.resources:
+                raise Exception('Route %s %s is defined twice' % (http_method, path))
+            route_cache = route.get('cache', http_method in cached_methods)
+            route_cache = dict(cache, **({} if route_cache is True else route_cache)) if route_cache else None
+            path_parameters = [
+                'method.request.path.%s' % segment.strip('{}+') for segment in path.split('/') if segment.startswith('{')
+            ]
+            key_parameters = None
+            if route_cache is not None:
+                # the path parameters tell the cached entries apart, the configured keys refine them
+                key_parameters = list(path_parameters)
+                for parameter in route_cache.get('key_parameters', []):
+                    parameter = self.cache_key_parameter(parameter)
+                    if parameter not in key_parameters:
+                        key_parameters.append(parameter)
+            self.template.add_resource(self._proxy_method(
+                method_name, http_method, resource_id(path), self._invoke_permission(apigateway_name, route['function']),
+                function=route['function'], path_parameters=path_parameters, cache_key_parameters=key_parameters
+            ))
+            method_names.append(method_name)
+
+            limits = route.get('throttling', throttled_methods.get(http_method))
+            if route_cache is not None or limits is not None:
+                # method settings address ANY as *
+                setting = self._method_setting(self.resource_path(path), '*' if http_method == 'ANY' else http_method, limits or throttling)
+                if route_cache is not None:
+                    self._enable_caching(setting, route_cache)
+                method_settings.append(setting)
+        return method_names, method_settings
+
+    def _invoke_permission(self, api_name, function):
+        """Permission of the API to invoke a function, added once per function
+
+        Returns:
+            str: logical name of the permission
+        """
+        from troposphere import Join, Ref
+        from troposphere.awslambda import Permission
+        if function is self.lambda_function:
+            permission_name = '%sLambdaPermission' % api_name
+        else:
+            permission_name = '%s%sPermission' % (api_name, function.title)
+        if permission_name not in self.template.resources:
+            self.template.add_resource(Permission(
+                permission_name,
+                Action='lambda:invokeFunction',
+                FunctionName=self.function_target(function),
+                Principal='apigateway.amazonaws.com',
+                SourceArn=Join("", [
+                    'arn:aws:execute-api:',
+                    Ref('AWS::Region'), ':',
+                    Ref('AWS::AccountId'), ':',
+                    Ref(self.apigateway), '/*'
+                ])
+            ))
+        return permission_name
+
+    def add_http_api(self, api_name, routes=None, throttling=None):
+        """Adds an HTTP API (API Gateway v2) invoking the AWS Lambda functions
+
+        HTTP APIs cost less and add less latency per request than REST APIs, but have no cache, API keys or
+        usage plans. The integrations use payload format 2.0 and the stage deploys every change on its own.
+
+        Args:
+            api_name (str): logical name of the HTTP API
+            routes (list): route keys such as "GET /items/{id}" invoking the first function, or routes with a path,
+                method, function and optional throttling as in add_api_gateway, a single $default route catching
+                every request if None
+            throttling (dict): rate (requests per second) and burst of the stage, and a routes map of route
+                keys to their own rate and burst
+        """
+        from troposphere import Join, Ref
+        from troposphere.apigatewayv2 import Api, Route, Stage
+        self.log.info('Adding HTTP API %s' % api_name)
+        assert(self.lambda_function is not None)
+        routes = ['$default'] if not routes else routes
+        throttling = {} if throttling is None else throttling
+        route_settings = dict(throttling.get('routes', {}))
+
+        self.apigateway = Api(api_name, Name=api_name, ProtocolType='HTTP')
+        self.template.add_resource(self.apigateway)
+
+        table = [{'key': route, 'function': self.lambda_function} for route in routes if isinstance(route, str)]
+        for route in self.routes([route for route in routes if not isinstance(route, str)]):
+            if route.get('cache'):
+                self.log.warning('HTTP APIs have no cache, ignoring the cache of route %s %s' % (route['method'], route['path']))
+            route['key'] = '%s %s' % (route['method'], route['path'])
+            if route.get('throttling'):
+                route_settings[route['key']] = route['throttling']
+            table.append(route)
+
+        route_names = []
+        for route in table:
+            self._invoke_permission(api_name, route['function'])
+            integration_name = self._http_integration(api_name, route['function'])
+            route_name = '%s%sRoute' % (api_name, self.unique_route_name(route['key']))
+            if route_name in self.template.resources:
+                raise Exception('Route %s is defined twice' % route['key'])
+            self.template.add_resource(Route(
+                route_name,
+                ApiId=Ref(self.apigateway),
+                RouteKey=route['key'],
+                Target=Join('/', ['integrations', Ref(integration_name)])
+            ))
+            route_names.append(route_name)
+
+        stage = Stage(
+            '%sStage' % api_name,
+            DependsOn=route_names,
+            ApiId=Ref(self.apigateway),
+            StageName='$default',
+            AutoDeploy=True
+        )
+        if throttling.get('rate') is not None or throttling.get('burst') is not None:
+            stage.DefaultRouteSettings = self._route_settings(throttling)
+        if route_settings:
+            stage.RouteSettings = dict(
+                (route_key, self._route_settings(limits).to_dict()) for route_key, limits in route_settings.items()
+            )
+        self.template.add_resource(stage)
+
+    def _http_integration(self, api_name, function):
+        """Lambda proxy integration of an HTTP API with a function, added once per function
+
+        Returns:
+            str: logical name of the integration
+        """
+        from troposphere import Ref
+        from troposphere.apigatewayv2 import Integration
+        if function is self.lambda_function:
+            integration_name = '%sLambdaIntegration' % api_name
+        else:
+            integration_name = '%s%sIntegration' % (api_name, function.title)
+        if integration_name not in self.template.resources:
+            self.template.add_resource(Integration(
+                integration_name,
+                ApiId=Ref(self.apigateway),
+                IntegrationType='AWS_PROXY',
+                IntegrationUri=self.function_target(function),
+                PayloadFormatVersion='2.0'
+            ))
+        return integration_name
+
+    @staticmethod
+    def _route_settings(limits):
+        from troposphere.apigatewayv2 import RouteSettings
+        settings = RouteSettings()
+        if limits.get('rate') is not None:
+            settings.ThrottlingRateLimit = float(limits['rate'])
+        if limits.get('burst') is not None:
+            settings.ThrottlingBurstLimit = int(limits['burst'])
+        return settings
+
+    def _proxy_method(self, method_name, http_method, resource_id, permission_name, function=None, path_parameters=None, cache_key_parameters=None):
+        from troposphere import Join, Ref
+        from troposphere.apigateway import Integration, Method, MethodResponse
+        integration = Integration(
+            Type='AWS_PROXY',
+            IntegrationHttpMethod='POST',
+            Uri=Join("", [
+                'arn:aws:apigateway:',
+                Ref('AWS::Region'),
+                ':lambda:path/2015-03-31/functions/',
+                self.function_target(function),
+                '/invocations'
+            ])
+        )
+        method = Method(
+            method_name,
+            DependsOn=permission_name,
+            RestApiId=Ref(self.apigateway),
+            ResourceId=resource_id,
+            HttpMethod=http_method,
+            AuthorizationType='NONE',
+            Integration=integration,
+            MethodResponses=[
+                MethodResponse(
+                    StatusCode='200'
+                )
+            ]
+        )
+        # a cache key must be a declared request parameter, path parameters are always present
+        request_parameters = dict((parameter, True) for parameter in path_parameters or [])
+        for parameter in cache_key_parameters or []:
+            request_parameters.setdefault(parameter, parameter.startswith('method.request.path.'))
+        if request_parameters:
+            method.RequestParameters = request_parameters
+        if cache_key_parameters:
+            integration.CacheKeyParameters = cache_key_parameters
+        return method
+
+    @staticmethod
+    def _method_setting(resource_path, http_method, limits):
+        from troposphere.apigateway import MethodSetting
+        setting = MethodSetting(ResourcePath=resource_path, HttpMethod=http_method)
+        if limits.get('rate') is not None:
+            setting.ThrottlingRateLimit = float(limits['rate'])
+        if limits.get('burst') is not None:
+            setting.ThrottlingBurstLimit = int(limits['burst'])
+        return setting
+
+    @staticmethod
+    def _enable_caching(setting, cache):
+        setting.CachingEnabled = True
+        if cache.get('ttl') is not None:
+            setting.CacheTtlInSeconds = cache['ttl']
+        if cache.get('encrypted'):
+            setting.CacheDataEncrypted = True
@@ -0,0 +1,182 @@
+import hashlib
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import threading
+
+import sam.awslambda
+import sam.bucket
+import sam.clients
+import sam.cloud
+import sam.package
+
+class Layer(object):
+    """
+    Content-addressed AWS Lambda layer holding the dependencies of the application
+
+    The dependencies listed in a requirements file are installed once into a layer, which is identified by
+    the SHA-256 of the requirements, the runtime and the architecture. A new layer version is only published
+    when that hash changes, so code uploads no longer carry the vendored dependencies. The wheels are the
+    ones of the Lambda runtime and architecture, not of the machine building the layer.
+    """
+    BUILD_DIR = 'build'
+    REQUIREMENTS = 'requirements.txt'
+    ARCHITECTURE = 'x86_64'
+    PLATFORMS = {'x86_64': 'manylinux2014_x86_64', 'arm64': 'manylinux2014_aarch64'}
+    DESCRIPTION_PREFIX = 'sha256:'
+    # the layer of several deployment targets is built once, by whichever target needs it first
+    BUILD_LOCK = threading.Lock()
+
+    def __init__(self, settings, session=None, clients=None):
+        """Constructor for the Layer class
+
+        Args:
+            settings (dict): application settings, the layer entry is either true or a dict with the optional
+                requirements, name, runtime, architecture and pip_args keys, the runtime and architecture
+                default to the ones of the functions
+            session (boto3.session.Session): specifies the boto session, only important for testing purposes
+            clients (sam.clients.ClientRegistry): shared clients, created from session if None
+        """
+        self.log = logging.getLogger(settings['name'])
+        self.clients = sam.clients.ClientRegistry(settings, session=session) if clients is None else clients
+        self.client = self.clients.client('lambda')
+        self.settings = settings
+
+        config = settings['layer'] if isinstance(settings.get('layer'), dict) else {}
+        self.requirements = config.get('requirements', self.REQUIREMENTS)
+        self.name = config.get('name', '%sDependencies' % settings['name'])
+        self.runtime = config.get('runtime', settings.get('runtime') or sam.cloud.Cloud.RUNTIME)
+        self.architecture = config.get('architecture', settings.get('architecture') or self.ARCHITECTURE)
+        if self.architecture not in self.PLATFORMS:
+            raise Exception('Unsupported layer architecture %s' % self.architecture)
+        if not self.runtime.startswith('python'):
+            raise Exception('Unsupported layer runtime %s' % self.runtime)
+        self.pip_args = config.get('pip_args', [])
+        self.build_dir = self.BUILD_DIR
+
+    def digest(self):
+        '''
+        Hash of the requirements file, the runtime and the architecture, which identifies the layer content
+        '''
+        if not os.path.isfile(self.requirements):
+            raise FileNotFoundError('%s not found' % self.requirements)
+        sha = hashlib.sha256()
+        sha.update(self.runtime.encode('utf-8'))
+        if self.architecture != self.ARCHITECTURE:
+            # layers published before the architecture was hashed keep their digest
+            sha.update(self.architecture.encode('utf-8'))
+        with open(self.requirements, 'rb') as f:
+            sha.update(f.read())
+        return sha.hexdigest()
+
+    def archive(self, digest=None):
+        digest = self.digest() if digest is None else digest
+        return os.path.join(self.build_dir, 'layer-%s.zip' % digest[:16])
+
+    def build(self, digest=None):
+        '''
+        Installs the requirements into python/ and zips them, unless the archive for this digest already exists
+
+        Returns:
+            str: location of the layer archive
+        '''
+        archive = self.archive(digest)
+        with self.BUILD_LOCK:
+            if os.path.isfile(archive):
+                self.log.info('%s is up to date' % archive)
+                return archive
+            self._build(archive)
+        return archive
+
+    def _build(self, archive):
+        target = os.path.join(self.build_dir, 'layer')
+        if os.path.isdir(target):
+            shutil.rmtree(target)
+        os.makedirs(target)
+        self.log.info('Installing %s into %s for %s on %s' % (self.requirements, target, self.runtime, self.architecture))
+        subprocess.check_call(self.pip_command(os.path.join(target, 'python')))
+
+        sam.package.write_archive(archive, sam.package.walk(target))
+
+    def pip_command(self, target):
+        '''
+        pip install of the requirements into target, restricted to the binary wheels of the Lambda runtime
+        '''
+        return [
+            sys.executable, '-m', 'pip', 'install', '--quiet',
+            '--platform', self.PLATFORMS[self.architecture],
+            '--implementation', 'cp',
+            '--python-version', self.runtime[len('python'):],
+            '--only-binary=:all:',
+            '-r', self.requirements,
+            '-t', target
+        ] + list(self.pip_args)
+
+    def find_version(self, digest):
+        '''
+        Looks up an already published version of the layer with the same content
+
+        Returns:
+            str: the LayerVersionArn, None if no version matches
+        '''
+        description = self.DESCRIPTION_PREFIX + digest
+        kwargs = {'LayerName': self.name}
+        while True:
+            response = self.client.list_layer_versions(**kwargs)
+            for version in response['LayerVersions']:
+                if version.get('Description') == description:
+                    return version['LayerVersionArn']
+            if not response.get('NextMarker'):
+                return None
+            kwargs['Marker'] = response['NextMarker']
+
+    def publish(self, force=False):
+        '''
+        Publishes a new version of the layer if its dependencies changed
+
+        The digest and LayerVersionArn of the last publish are kept in settings as layer_hash and layer_arn.
+
+        Args:
+            force (bool): publish even if a version with the same content exists
+
+        Returns:
+            str: the LayerVersionArn to attach to the functions
+        '''
+        digest = self.digest()
+        if not force:
+            if self.settings.get('layer_hash') == digest and self.settings.get('layer_arn'):
+                return self.settings['layer_arn']
+            arn = self.find_version(digest)
+            if arn is not None:
+                self.log.info('Layer %s is up to date' % self.name)
+                self._remember(digest, arn)
+                return arn
+
+        archive = self.build(digest)
+        threshold = self.settings.get('s3_upload_threshold', sam.awslambda.Lambda.DIRECT_UPLOAD_LIMIT)
+        if os.path.getsize(archive) <= threshold:
+            with open(archive, 'rb') as f:
+                content = {'ZipFile': f.read()}
+        else:
+            bucket = sam.bucket.Bucket.shared(self.settings, clients=self.clients)
+            bucket.create_bucket()
+            key = 'layers/%s/%s.zip' % (self.name, digest)
+            bucket.upload_file(archive, key)
+            content = {'S3Bucket': bucket.name, 'S3Key': key}
+
+        self.log.info('Publishing layer %s' % self.name)
+        response = self.client.publish_layer_version(
+            LayerName=self.name,
+            Description=self.DESCRIPTION_PREFIX + digest,
+            Content=content,
+            CompatibleRuntimes=[self.runtime],
+            CompatibleArchitectures=[self.architecture]
+        )
+        self._remember(digest, response['LayerVersionArn'])
+        return response['LayerVersionArn']
+
+    def _remember(self, digest, arn):
+        self.settings['layer_hash'] = digest
+        self.settings['layer_arn'] = arn
@@ -0,0 +1,311 @@
+import base64
+import concurrent.futures
+import importlib
+import json
+import logging
+import os
+import sys
+import time
+import uuid
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+BINARY_CONTENT_TYPES = ('application/octet-stream', 'image/', 'audio/', 'video/', 'application/zip', 'application/pdf')
+INTERNAL_ERROR = (502, [('Content-Type', 'application/json')], b'{"message": "Internal server error"}')
+
+def _is_binary(headers):
+    content_type = headers.get('content-type', headers.get('Content-Type', ''))
+    return any(content_type.startswith(prefix) for prefix in BINARY_CONTENT_TYPES)
+
+def _encode_body(body, headers):
+    if not body:
+        return None, False
+    if _is_binary(headers):
+        return base64.b64encode(body).decode('ascii'), True
+    try:
+        return body.decode('utf-8'), False
+    except UnicodeDecodeError:
+        return base64.b64encode(body).decode('ascii'), True
+
+def _header_list(headers):
+    # headers are a dict, or (name, value) tuples when a header is repeated
+    if headers is None:
+        return []
+    return list(headers.items()) if isinstance(headers, dict) else list(headers)
+
+def proxy_event(method, path, headers=None, query=None, body=b'', stage='v1', resource='/{proxy+}', source_ip='127.0.0.1'):
+    '''
+    Builds the event API Gateway sends to a Lambda proxy integration (AWS_PROXY) of the {proxy+} resource
+
+    Args:
+        method (str): HTTP method of the request
+        path (str): path of the request, without the stage
+        headers (list): (name, value) tuples of the request headers, or a dict
+        query (list): (name, value) tuples of the query string
+        body (bytes): request body, base64 encoded in the event if it is binary
+        stage (str): name of the stage
+        resource (str): resource path the request matched
+        source_ip (str): address of the caller
+    '''
+    multi_headers = {}
+    for name, value in _header_list(headers):
+        multi_headers.setdefault(name, []).append(value)
+    # like API Gateway, the single value map holds the last value of a repeated header
+    headers = dict((name, values[-1]) for name, values in multi_headers.items())
+    query = [] if query is None else list(query)
+    multi_query = {}
+    for name, value in query:
+        multi_query.setdefault(name, []).append(value)
+    encoded_body, is_base64 = _encode_body(body, headers)
+    proxy = path.lstrip('/')
+    now = time.time()
+
+    return {
+        'resource': resource,
+        'path': path,
+        'httpMethod': method,
+        'headers': headers or None,
+        'multiValueHeaders': multi_headers or None,
+        'queryStringParameters': dict((name, values[-1]) for name, values in multi_query.items()) or None,
+        'multiValueQueryStringParameters': multi_query or None,
+        'pathParameters': {'proxy': proxy} if proxy else None,
+        'stageVariables': None,
+        'requestContext': {
+            'resourcePath': resource,
+            'httpMethod': method,
+            'path': '/%s%s' % (stage, path),
+            'stage': stage,
+            'requestId': str(uuid.uuid4()),
+            'requestTimeEpoch': int(now * 1000),
+            'protocol': 'HTTP/1.1',
+            'identity': {'sourceIp': source_ip, 'userAgent': headers.get('User-Agent')}
+        },
+        'body': encoded_body,
+        'isBase64Encoded': is_base64
+    }
+
+def http_event(method, path, headers=None, query=None, body=b'', route_key='$default', stage='$default', source_ip='127.0.0.1'):
+    '''
+    Builds the event an HTTP API (API Gateway v2) sends to a Lambda integration with payload format 2.0
+
+    Repeated headers and query string parameters are joined with commas, cookies are passed separately.
+
+    Args:
+        method (str): HTTP method of the request
+        path (str): path of the request
+        headers (list): (name, value) tuples of the request headers, or a dict
+        query (list): (name, value) tuples of the query string
+        body (bytes): request body, base64 encoded in the event if it is binary
+        route_key (str): route the request matched
+        stage (str): name of the stage
+        source_ip (str): address of the caller
+    '''
+    cookies = []
+    joined = {}
+    for name, value in _header_list(headers):
+        name = name.lower()
+        if name == 'cookie':
+            cookies.extend(cookie.strip() for cookie in value.split(';') if cookie.strip())
+        else:
+            joined[name] = value if name not in joined else '%s,%s' % (joined[name], value)
+    headers = joined
+    query = [] if query is None else list(query)
+    parameters = {}
+    for name, value in query:
+        parameters[name] = value if name not in parameters else '%s,%s' % (parameters[name], value)
+    encoded_body, is_base64 = _encode_body(body, headers)
+    now = time.time()
+
+    event = {
+        'version': '2.0',
+        'routeKey': route_key,
+        'rawPath': path,
+        'rawQueryString': urlencode(query),
+        'headers': headers,
+        'requestContext': {
+            'accountId': '000000000000',
+            'apiId': 'local',
+            'domainName': headers.get('host', 'localhost'),
+            'http': {
+                'method': method,
+                'path': path,
+                'protocol': 'HTTP/1.1',
+                'sourceIp': source_ip,
+                'userAgent': headers.get('user-agent')
+            },
+            'requestId': str(uuid.uuid4()),
+            'routeKey': route_key,
+            'stage': stage,
+            'time': time.strftime('%d/%b/%Y:%H:%M:%S +0000', time.gmtime(now)),
+            'timeEpoch': int(now * 1000)
+        },
+        'isBase64Encoded': is_base64
+    }
+    # absent values are left out of the event instead of being null
+    if cookies:
+        event['cookies'] = cookies
+    if parameters:
+        event['queryStringParameters'] = parameters
+    if encoded_body is not None:
+        event['body'] = encoded_body
+    return event
+
+def translate_response(result, payload_format='1.0'):
+    '''
+    Turns the statusCode/headers/body/isBase64Encoded result of a proxy integration into HTTP
+
+    With payload format 2.0, a result without statusCode is returned as a 200 JSON response and cookies
+    become Set-Cookie headers.
+
+    Returns:
+        (int, list, bytes): status code, (name, value) header tuples and body
+    '''
+    if payload_format == '2.0' and not (isinstance(result, dict) and 'statusCode' in result):
+        result = {'statusCode': 200, 'headers': {'Content-Type': 'application/json'}, 'body': json.dumps(result)}
+    if not isinstance(result, dict):
+        return INTERNAL_ERROR
+    headers = []
+    for name, value in (result.get('headers') or {}).items():
+        headers.append((name, str(value)))
+    for name, values in (result.get('multiValueHeaders') or {}).items():
+        for value in values:
+            headers.append((name, str(value)))
+    for cookie in result.get('cookies') or []:
+        headers.append(('Set-Cookie', cookie))
+    body = result.get('body') or ''
+    if result.get('isBase64Encoded'):
+        body = base64.b64decode(body)
+    elif not isinstance(body, bytes):
+        body = body.encode('utf-8')
+    return int(result.get('statusCode', 200)), headers, body
+
+class LocalContext(object):
+    """
+    Minimal stand-in for the context object AWS Lambda passes to handlers
+    """
+    def __init__(self, function_name, memory_size=128, timeout=3):
+        self.function_name = function_name
+        self.function_version = '$LATEST'
+        self.memory_limit_in_mb = memory_size
+        self.aws_request_id = str(uuid.uuid4())
+        self.invoked_function_arn = 'arn:aws:lambda:local:000000000000:function:%s' % function_name
+        self.log_group_name = '/aws/lambda/%s' % function_name
+        self.log_stream_name = 'local'
+        self._deadline = time.time() + timeout
+
+    def get_remaining_time_in_millis(self):
+        return max(0, int((self._deadline - time.time()) * 1000))
+
+# handler of the worker process, imported once per process so invocations are warm
+_handler = None
+_function_name = None
+
+def load_handler(source_dir, handler):
+    '''
+    Imports the module.function handler from source_dir
+    '''
+    module_name, function_name = handler.rsplit('.', 1)
+    source_dir = os.path.abspath(source_dir)
+    if source_dir not in sys.path:
+        sys.path.insert(0, source_dir)
+    module = importlib.import_module(module_name)
+    return getattr(module, function_name)
+
+def _init_worker(source_dir, handler):
+    global _handler, _function_name
+    _handler = load_handler(source_dir, handler)
+    _function_name = handler
+
+def _invoke(event):
+    return _handler(event, LocalContext(_function_name))
+
+class Invoker(object):
+    """
+    Pool of warm worker processes, each importing the handler once and reusing it for every invocation
+    """
+    def __init__(self, source_dir, handler, workers=None):
+        self.source_dir = source_dir
+        self.handler = handler
+        self.executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_worker,
+            initargs=(source_dir, handler)
+        )
+
+    def invoke(self, event):
+        return self.executor.submit(_invoke, event).result()
+
+    def shutdown(self):
+        self.executor.shutdown()
+
+class ProxyRequestHandler(BaseHTTPRequestHandler):
+    """
+    Converts every HTTP request into an API Gateway proxy event for the ANY method of the {proxy+} resource,
+    or into an HTTP API event of the $default route with payload format 2.0
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def _handle(self):
+        url = urlsplit(self.path)
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        build = http_event if self.server.payload_format == '2.0' else proxy_event
+        event = build(
+            self.command,
+            url.path,
+            headers=self.headers.items(),
+            query=parse_qsl(url.query, keep_blank_values=True),
+            body=body,
+            stage=self.server.stage,
+            source_ip=self.client_address[0]
+        )
+        try:
+            result = self.server.invoker.invoke(event)
+            status, headers, body = translate_response(result, payload_format=self.server.payload_format)
+        except Exception as e:
+            self.server.log.exception('Handler failed: %s' % e)
+            status, headers, body = INTERNAL_ERROR
+
+        self.send_response(status)
+        for name, value in headers:
+            if name.lower() not in ('content-length', 'connection'):
+                self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = do_HEAD = do_OPTIONS = _handle
+
+    def log_message(self, format, *args):
+        self.server.log.info('%s - %s' % (self.address_string(), format % args))
+
+class LocalServer(ThreadingHTTPServer):
+    """
+    Local HTTP server emulating the API Gateway proxy in front of the handler in lambda/
+    """
+    daemon_threads = True
+
+    def __init__(self, source_dir, handler, host='127.0.0.1', port=8000, workers=None, stage='v1', log=None, payload_format='1.0'):
+        """Constructor for the LocalServer class
+
+        Args:
+            source_dir (str): directory the handler is imported from
+            handler (str): module.function of the handler
+            host (str): address to listen on
+            port (int): port to listen on, 0 picks a free port
+            workers (int): number of worker processes, defaults to the number of CPUs
+            stage (str): stage name reported in the events
+            log (logging.Logger): logger to report to, defaults to the module logger
+            payload_format (str): 1.0 for REST API proxy events, 2.0 for HTTP API events
+        """
+        self.log = logging.getLogger(__name__) if log is None else log
+        self.stage = stage
+        self.payload_format = payload_format
+        self.invoker = Invoker(source_dir, handler, workers=workers)
+        ThreadingHTTPServer.__init__(self, (host, port), ProxyRequestHandler)
+
+    def server_close(self):
+        ThreadingHTTPServer.server_close(self)
+        self.invoker.shutdown()
@@ -0,0 +1,247 @@
+import collections
+import re
+
+STACK_TYPE = 'AWS::CloudFormation::Stack'
+
+# shared by every group, these stay in the root stack
+ROOT_TYPES = (
+    'AWS::IAM::Role',
+    'AWS::S3::Bucket',
+    'AWS::ApiGateway::RestApi',
+    'AWS::ApiGateway::Deployment',
+    'AWS::ApiGateway::Stage',
+    'AWS::ApiGateway::ApiKey',
+    'AWS::ApiGatewayV2::Api',
+    'AWS::ApiGatewayV2::Stage',
+    STACK_TYPE
+)
+
+def stack_name(group):
+    return '%sStack' % re.sub(r'[^A-Za-z0-9]', '', group)
+
+def _target(value):
+    '''
+    (logical ID, attribute) a Ref or Fn::GetAtt points at, None for any other value
+    '''
+    if not isinstance(value, dict) or len(value) != 1:
+        return None
+    if 'Ref' in value and isinstance(value['Ref'], str):
+        return value['Ref'], None
+    if 'Fn::GetAtt' in value:
+        target = value['Fn::GetAtt']
+        if isinstance(target, str):
+            target = target.split('.', 1)
+        return target[0], target[1]
+    return None
+
+def references(value):
+    '''
+    Yields the (logical ID, attribute) of every Ref and Fn::GetAtt in a template fragment
+    '''
+    target = _target(value)
+    if target is not None:
+        yield target
+    elif isinstance(value, dict):
+        for item in value.values():
+            for reference in references(item):
+                yield reference
+    elif isinstance(value, list):
+        for item in value:
+            for reference in references(item):
+                yield reference
+
+def _rewrite(value, replace):
+    target = _target(value)
+    if target is not None:
+        replacement = replace(*target)
+        return value if replacement is None else replacement
+    if isinstance(value, dict):
+        return collections.OrderedDict((key, _rewrite(item, replace)) for key, item in value.items())
+    if isinstance(value, list):
+        return [_rewrite(item, replace) for item in value]
+    return value
+
+def _depends_on(resource):
+    depends_on = resource.get('DependsOn', [])
+    return [depends_on] if isinstance(depends_on, str) else list(depends_on)
+
+def assign(template, groups):
+    '''
+    Assigns the resources of a template to groups, starting from the functions of each group
+
+    A resource joins a group when every grouped resource it references or depends on is in that group, an API
+    Gateway resource (a path part) joins the group of the methods using it. Resources of ROOT_TYPES and the
+    ones shared by several groups stay in the root stack, and so do the parent path parts of an API Gateway
+    resource that stays in the root stack, or the root stack and the nested stack would depend on each other.
+
+    Args:
+        template (dict): rendered template
+        groups (dict): group name to the logical IDs of its functions
+
+    Returns:
+        dict: logical ID to group name of the resources that move to a nested stack
+    '''
+    resources = template.get('Resources', {})
+    assignment = {}
+    for group, logical_ids in groups.items():
+        for logical_id in logical_ids:
+            if logical_id not in resources:
+                raise Exception('Resource %s of nested stack %s not found' % (logical_id, group))
+            assignment[logical_id] = group
+
+    outgoing = dict(
+        (logical_id, set(target for target, attribute in references(resource)) | set(_depends_on(resource)))
+        for logical_id, resource in resources.items()
+    )
+    changed = True
+    while changed:
+        changed = False
+        for logical_id, resource in resources.items():
+            if logical_id in assignment or resource.get('Type') in ROOT_TYPES:
+                continue
+            forward = set(assignment[target] for target in outgoing[logical_id] if target in assignment)
+            if resource.get('Type') == 'AWS::ApiGateway::Resource':
+                forward |= set(assignment[other] for other, targets in outgoing.items() if logical_id in targets and other in assignment)
+            if len(forward) == 1:
+                assignment[logical_id] = forward.pop()
+                changed = True
+
+    changed = True
+    while changed:
+        changed = False
+        for logical_id in resources:
+            if logical_id in assignment:
+                continue
+            for target in outgoing[logical_id]:
+                if target in assignment and resources[target].get('Type') == 'AWS::ApiGateway::Resource':
+                    del assignment[target]
+                    changed = True
+    return assignment
+
+def _cycle(resources):
+    '''
+    Logical IDs of a dependency cycle between the resources of a template, None if there is none
+    '''
+    edges = dict(
+        (logical_id, sorted(set(target for target, attribute in references(resource) if target in resources) | set(_depends_on(resource))))
+        for logical_id, resource in resources.items()
+    )
+    visited = set()
+    for start in resources:
+        if start in visited:
+            continue
+        # iterative depth first search, path holds the resources being visited
+        path = [start]
+        on_path = set([start])
+        pending = [iter(edges[start])]
+        visited.add(start)
+        while pending:
+            target = next(pending[-1], None)
+            if target is None:
+                pending.pop()
+                on_path.discard(path.pop())
+            elif target in on_path:
+                return path[path.index(target):] + [target]
+            elif target not in visited and target in edges:
+                visited.add(target)
+                path.append(target)
+                on_path.add(target)
+                pending.append(iter(edges[target]))
+    return None
+
+def partition(template, assignment):
+    '''
+    Moves the assigned resources of a template into one nested stack template per group
+
+    References that cross a stack boundary are rewired: a nested stack receives the values it needs from
+    the root stack as parameters, and exposes the values other stacks need as outputs, read with
+    Fn::GetAtt Stack.Outputs.Name. Dependencies on resources of another stack become dependencies of
+    the nested stack resource. The TemplateURL of every nested stack resource is left for the caller.
+    An assignment that makes the root stack and a nested stack depend on each other is refused.
+
+    Args:
+        template (dict): rendered template
+        assignment (dict): logical ID to group name, see assign
+
+    Returns:
+        (dict, OrderedDict): root template and the nested stack template of every group
+    '''
+    resources = template.get('Resources', {})
+    groups = sorted(set(assignment.values()))
+    root = collections.OrderedDict((key, value) for key, value in template.items() if key not in ('Resources', 'Outputs'))
+    root['Resources'] = collections.OrderedDict()
+    children = collections.OrderedDict()
+    for group in groups:
+        children[group] = collections.OrderedDict([
+            ('AWSTemplateFormatVersion', template.get('AWSTemplateFormatVersion', '2010-09-09')),
+            ('Parameters', collections.OrderedDict()),
+            ('Resources', collections.OrderedDict()),
+            ('Outputs', collections.OrderedDict())
+        ])
+    parameters = dict((group, collections.OrderedDict()) for group in groups)
+    dependencies = dict((group, set()) for group in groups)
+
+    def value_in_root(logical_id, attribute):
+        home = assignment.get(logical_id)
+        local = {'Ref': logical_id} if attribute is None else {'Fn::GetAtt': [logical_id, attribute]}
+        if home is None:
+            return local
+        name = logical_id + (re.sub(r'[^A-Za-z0-9]', '', attribute) if attribute else 'Ref')
+        children[home]['Outputs'][name] = {'Value': local}
+        return {'Fn::GetAtt': [stack_name(home), 'Outputs.%s' % name]}
+
+    def replacer(group):
+        def replace(logical_id, attribute):
+            if logical_id not in resources and logical_id not in template.get('Parameters', {}):
+                return None # pseudo parameter such as AWS::Region
+            if assignment.get(logical_id) == group:
+                return None
+            value = value_in_root(logical_id, attribute)
+            if group is None:
+                return value
+            name = logical_id + (re.sub(r'[^A-Za-z0-9]', '', attribute) if attribute else 'Ref')
+            children[group]['Parameters'][name] = {'Type': 'String'}
+            parameters[group][name] = value
+            return {'Ref': name}
+        return replace
+
+    for logical_id, resource in resources.items():
+        group = assignment.get(logical_id)
+        resource = _rewrite(resource, replacer(group))
+        depends_on = []
+        for dependency in _depends_on(resource):
+            home = assignment.get(dependency)
+            if home == group:
+                depends_on.append(dependency)
+            elif group is None:
+                depends_on.append(stack_name(home))
+            else:
+                dependencies[group].add(dependency if home is None else stack_name(home))
+        if depends_on:
+            resource['DependsOn'] = sorted(set(depends_on))
+        else:
+            resource.pop('DependsOn', None)
+        if group is None:
+            root['Resources'][logical_id] = resource
+        else:
+            children[group]['Resources'][logical_id] = resource
+
+    if template.get('Outputs'):
+        root['Outputs'] = _rewrite(template['Outputs'], replacer(None))
+
+    for group in groups:
+        stack = collections.OrderedDict([('Type', STACK_TYPE), ('Properties', collections.OrderedDict([('TemplateURL', None)]))])
+        if parameters[group]:
+            stack['Properties']['Parameters'] = parameters[group]
+        depends_on = sorted(dependencies[group] - set([stack_name(group)]))
+        if depends_on:
+            stack['DependsOn'] = depends_on
+        root['Resources'][stack_name(group)] = stack
+        for key in ('Parameters', 'Outputs'):
+            if not children[group][key]:
+                del children[group][key]
+
+    cycle = _cycle(root['Resources'])
+    if cycle is not None:
+        raise Exception('Nested stacks depend on each other: %s' % ' -> '.join(cycle))
+    return root, children
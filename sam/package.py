@@ -0,0 +1,395 @@
+import base64
+import collections
+import concurrent.futures
+import fnmatch
+import hashlib
+import itertools
+import json
+import logging
+import os
+import re
+import shutil
+import stat
+import struct
+import subprocess
+import sys
+import tempfile
+import zipfile
+import zlib
+
+ZIP_EPOCH = (1980, 1, 1, 0, 0, 0)
+ZIP_MAX_ENTRIES = 0xffff
+ZIP_MAX_SIZE = 0xffffffff
+ZIP_UTF8_FLAG = 0x800
+
+# stored without recompression
+STORED_EXTENSIONS = ('.whl', '.zip', '.egg', '.jar', '.gz', '.tgz', '.bz2', '.xz', '.zst', '.png', '.jpg', '.jpeg', '.gif', '.webp', '.woff', '.woff2')
+
+# path components dropped by the strip stage, nothing in them is needed to run the code
+STRIP_PATTERNS = ('__pycache__', '*.pyc', '*.pyo', 'tests', 'test', '*.dist-info', '*.egg-info', 'docs', 'doc', 'examples', '*.md', '*.rst')
+
+# compiles the staging directory into hash-based .pyc files the target interpreter never revalidates
+COMPILE_SCRIPT = '''import compileall, py_compile, sys
+ok = compileall.compile_dir(sys.argv[1], ddir=sys.argv[2], quiet=1, invalidation_mode=py_compile.PycInvalidationMode.UNCHECKED_HASH)
+sys.exit(0 if ok else 1)
+'''
+
+def _sha256(path):
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(Package.CHUNK_SIZE), b''):
+            sha.update(chunk)
+    return sha
+
+def file_sha256(path):
+    '''
+    Computes the hex encoded SHA-256 of a file
+    '''
+    return _sha256(path).hexdigest()
+
+def code_sha256(path):
+    '''
+    Computes the base64 encoded SHA-256 of a file, the same digest AWS Lambda reports as CodeSha256
+    '''
+    return base64.b64encode(_sha256(path).digest()).decode('ascii')
+
+def walk(source_dir):
+    '''
+    Yields (name, path) tuples for every file under source_dir, name being the relative path with forward slashes
+    '''
+    for root, dirs, files in os.walk(source_dir):
+        dirs.sort()
+        for filename in sorted(files):
+            path = os.path.join(root, filename)
+            yield os.path.relpath(path, source_dir).replace(os.sep, '/'), path
+
+def _dos_time(date_time):
+    year, month, day, hour, minute, second = date_time
+    return (hour << 11) | (minute << 5) | (second // 2), ((year - 1980) << 9) | (month << 5) | day
+
+def _compress(path, compression_level, store):
+    """Reads and compresses one archive entry, run on the worker pool (zlib releases the GIL)
+
+    Returns:
+        (int, int, int, int, bytes): zip compression method, CRC-32, uncompressed size, file mode and payload
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    mode = 0o755 if os.stat(path).st_mode & stat.S_IXUSR else 0o644
+    crc = zlib.crc32(data) & 0xffffffff
+    if store or compression_level == 0:
+        return zipfile.ZIP_STORED, crc, len(data), mode, data
+    compressor = zlib.compressobj(compression_level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    return zipfile.ZIP_DEFLATED, crc, len(data), mode, compressor.compress(data) + compressor.flush()
+
+def is_compressed(name):
+    '''
+    Whether a file is already compressed, deflating it again costs time and saves next to nothing
+    '''
+    return name.lower().endswith(STORED_EXTENSIONS)
+
+def write_archive(archive, entries, compression_level=6, workers=None):
+    '''
+    Writes a reproducible zip file: entries are sorted by name, timestamps are pinned to the zip epoch,
+    permissions are normalized and the compression level is fixed, so the same inputs always produce
+    byte-for-byte the same archive.
+
+    The entries are deflated in parallel on a thread pool and written in name order, with a bounded number of
+    entries in flight. Already compressed files (see STORED_EXTENSIONS) are stored.
+
+    Args:
+        archive (str): location of the zip file to write
+        entries (iterable): (name, path) tuples, name being the path inside the archive
+        compression_level (int): deflate level, 0-9, 0 stores every entry
+        workers (int): compression threads, defaults to the number of CPUs
+    '''
+    workers = workers or os.cpu_count() or 1
+    entries = sorted(entries)
+    if len(entries) > ZIP_MAX_ENTRIES:
+        raise ValueError('%s would hold %d entries, zip64 archives are not supported' % (archive, len(entries)))
+    dos_time, dos_date = _dos_time(ZIP_EPOCH)
+    central_directory = []
+    with open(archive, 'wb') as f, concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        submit = lambda name, path: (name, executor.submit(_compress, path, compression_level, is_compressed(name)))
+        queue = iter(entries)
+        pending = collections.deque(submit(name, path) for name, path in itertools.islice(queue, workers * 4))
+        while pending:
+            name, future = pending.popleft()
+            pending.extend(submit(name, path) for name, path in itertools.islice(queue, 1))
+            method, crc, size, mode, payload = future.result()
+            if size > ZIP_MAX_SIZE or len(payload) > ZIP_MAX_SIZE or f.tell() > ZIP_MAX_SIZE:
+                raise ValueError('%s exceeds 4 GiB, zip64 archives are not supported' % archive)
+            filename = name.encode('utf-8')
+            flags = 0 if max(filename) < 0x80 else ZIP_UTF8_FLAG
+            offset = f.tell()
+            f.write(struct.pack(
+                '<IHHHHHIIIHH', 0x04034b50, 20, flags, method, dos_time, dos_date, crc, len(payload), size, len(filename), 0
+            ))
+            f.write(filename)
+            f.write(payload)
+            external_attr = (stat.S_IFREG | mode) << 16 # unix mode, made by unix below
+            central_directory.append(struct.pack(
+                '<IHHHHHHIIIHHHHHII', 0x02014b50, (3 << 8) | 20, 20, flags, method, dos_time, dos_date, crc,
+                len(payload), size, len(filename), 0, 0, 0, 0, external_attr, offset
+            ) + filename)
+
+        start = f.tell()
+        for record in central_directory:
+            f.write(record)
+        f.write(struct.pack(
+            '<IHHHHIIH', 0x06054b50, 0, 0, len(central_directory), len(central_directory), f.tell() - start, start, 0
+        ))
+
+def breakdown(archive):
+    '''
+    Sizes of an archive per top-level package or module, largest compressed size first
+
+    Returns:
+        list: (name, files, uncompressed bytes, compressed bytes) tuples
+    '''
+    totals = {}
+    with zipfile.ZipFile(archive) as z:
+        for info in z.infolist():
+            name = info.filename.split('/', 1)[0]
+            files, size, compressed = totals.get(name, (0, 0, 0))
+            totals[name] = (files + 1, size + info.file_size, compressed + info.compress_size)
+    return sorted(((name,) + total for name, total in totals.items()), key=lambda entry: (-entry[3], entry[0]))
+
+def runtime_version(runtime):
+    '''
+    (major, minor) of a Lambda runtime name such as python3.9, None if it is not a Python runtime
+    '''
+    match = re.match(r'^python(\d+)\.(\d+)$', runtime or '')
+    return None if match is None else (int(match.group(1)), int(match.group(2)))
+
+class Package(object):
+    """
+    Incremental packaging of the lambda/ directory into lambda.zip
+
+    A manifest of every file's path, mtime, size and content hash is kept next to the archive, the
+    archive is only rebuilt when the manifest of the source directory no longer matches it.
+
+    The files are selected with include and exclude globs and can go through optional stages before
+    they are zipped: strip drops caches, tests, package metadata and docs, strip_binaries removes the
+    debug symbols of native .so files and compile precompiles .pyc files for the target runtime.
+    """
+    MANIFEST_SUFFIX = '.manifest'
+    CHUNK_SIZE = 1024 * 1024
+    TASK_ROOT = '/var/task'
+    STRIP_COMMAND = ('strip', '--strip-unneeded')
+
+    def __init__(self, source_dir, archive='lambda.zip', log=None, compression_level=6, config=None, runtime=None):
+        """Constructor for the Package class
+
+        Args:
+            source_dir (str): directory whose contents are packaged
+            archive (str): location of the zip file to build
+            log (logging.Logger): logger to report to, defaults to the module logger
+            compression_level (int): deflate level used for the archive, 0-9
+            config (dict): packaging pipeline, with the optional include and exclude glob lists, the
+                strip, strip_binaries and compile flags, python, the interpreter to compile with,
+                compression_level and workers, the number of compression threads
+            runtime (str): Lambda runtime the .pyc files are compiled for, e.g. python3.9
+        """
+        self.source_dir = source_dir
+        self.archive = archive
+        self.log = logging.getLogger(__name__) if log is None else log
+        config = {} if config is None else config
+        self.compression_level = config.get('compression_level', compression_level)
+        self.workers = config.get('workers')
+        self.include = list(config.get('include', []))
+        self.exclude = list(config.get('exclude', []))
+        self.strip = bool(config.get('strip', False))
+        self.strip_binaries = bool(config.get('strip_binaries', False))
+        self.compile = bool(config.get('compile', False))
+        self.python = config.get('python')
+        self.runtime = runtime
+
+    @property
+    def config(self):
+        """Settings that change the archive contents, a change forces a rebuild
+        """
+        return {
+            'compression_level': self.compression_level,
+            'include': self.include,
+            'exclude': self.exclude,
+            'strip': self.strip,
+            'strip_binaries': self.strip_binaries,
+            'compile': self.compile,
+            'runtime': self.runtime if self.compile else None,
+            'python': self.python if self.compile else None
+        }
+
+    @property
+    def manifest_path(self):
+        return self.archive + self.MANIFEST_SUFFIX
+
+    def is_selected(self, name):
+        """Whether a file, by its path relative to the source directory, goes into the archive
+        """
+        if self.include and not any(fnmatch.fnmatch(name, pattern) for pattern in self.include):
+            return False
+        if any(fnmatch.fnmatch(name, pattern) for pattern in self.exclude):
+            return False
+        if self.strip:
+            for part in name.split('/'):
+                if any(fnmatch.fnmatch(part, pattern) for pattern in STRIP_PATTERNS):
+                    return False
+        return True
+
+    def _walk(self):
+        return ((name, path) for name, path in walk(self.source_dir) if self.is_selected(name))
+
+    def _interpreter(self):
+        """Python executable matching the runtime the .pyc files are compiled for, None if there is none
+        """
+        if self.python is not None:
+            return self.python
+        version = runtime_version(self.runtime)
+        if version is None or version == tuple(sys.version_info[:2]):
+            return sys.executable
+        return shutil.which('python%d.%d' % version)
+
+    def _compile(self, staging_dir):
+        version = runtime_version(self.runtime)
+        if version is not None and version < (3, 7):
+            self.log.warning('Hash-based .pyc files need python3.7 or later, not compiling for %s' % self.runtime)
+            return False
+        interpreter = self._interpreter()
+        if interpreter is None:
+            self.log.warning('No interpreter found for %s, not compiling' % self.runtime)
+            return False
+        try:
+            subprocess.check_call([interpreter, '-c', COMPILE_SCRIPT, staging_dir, self.TASK_ROOT], stdout=subprocess.DEVNULL)
+        except (OSError, subprocess.CalledProcessError) as e:
+            self.log.warning('Compiling with %s failed: %s' % (interpreter, e))
+            return False
+        return True
+
+    def _strip_binaries(self, staging_dir):
+        ok = True
+        for name, path in walk(staging_dir):
+            if not name.endswith('.so') and '.so.' not in name:
+                continue
+            try:
+                subprocess.check_call(list(self.STRIP_COMMAND) + [path])
+            except (OSError, subprocess.CalledProcessError) as e:
+                self.log.warning('Stripping %s failed: %s' % (name, e))
+                ok = False
+        return ok
+
+    def _stage(self, staging_dir):
+        """Copies the selected files into staging_dir and runs the strip_binaries and compile stages on them
+
+        Returns:
+            bool: False if a stage failed, the staged files are then usable but not fully processed
+        """
+        for name, path in self._walk():
+            target = os.path.join(staging_dir, *name.split('/'))
+            directory = os.path.dirname(target)
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            shutil.copy2(path, target)
+        ok = True
+        if self.strip_binaries:
+            ok = self._strip_binaries(staging_dir) and ok
+        if self.compile:
+            ok = self._compile(staging_dir) and ok
+        return ok
+
+    def load_manifest(self):
+        if not os.path.isfile(self.manifest_path):
+            return None
+        with open(self.manifest_path, 'r') as f:
+            try:
+                return json.load(f)
+            except ValueError:
+                self.log.warning('Manifest %s is corrupt, ignoring' % self.manifest_path)
+                return None
+
+    def save_manifest(self, manifest):
+        with open(self.manifest_path, 'w') as f:
+            json.dump(manifest, f, sort_keys=True)
+
+    def scan(self, previous=None):
+        """Builds the manifest of the source directory
+
+        Content hashes from a previous manifest are reused for files whose mtime and size did not change,
+        so an unchanged tree is scanned without reading any file contents.
+
+        Args:
+            previous (dict): manifest of the last build
+        """
+        previous_files = {} if previous is None else previous.get('files', {})
+        files = {}
+        for name, path in self._walk():
+            info = os.stat(path)
+            entry = {'mtime': info.st_mtime, 'size': info.st_size}
+            old = previous_files.get(name)
+            if old is not None and old['mtime'] == entry['mtime'] and old['size'] == entry['size']:
+                entry['sha256'] = old['sha256']
+            else:
+                entry['sha256'] = file_sha256(path)
+            files[name] = entry
+        return {'files': files, 'config': self.config}
+
+    def is_stale(self):
+        """Checks whether the archive needs to be rebuilt
+
+        Returns:
+            (bool, dict): staleness and the current manifest of the source directory
+        """
+        previous = self.load_manifest()
+        current = self.scan(previous)
+        if previous is None or not os.path.isfile(self.archive):
+            return True, current
+        if previous.get('config') != current['config']:
+            return True, current
+        old_hashes = dict((name, entry['sha256']) for name, entry in previous['files'].items())
+        new_hashes = dict((name, entry['sha256']) for name, entry in current['files'].items())
+        return old_hashes != new_hashes, current
+
+    def build(self, force=False):
+        """Creates the archive if the source directory changed since the last build
+
+        Args:
+            force (bool): rebuild the archive even if it is up to date
+
+        Returns:
+            bool: True if the archive was (re)built
+        """
+        stale, manifest = self.is_stale()
+        if not stale and not force:
+            self.log.info('%s is up to date' % self.archive)
+            # refresh mtimes so that the next scan does not need to rehash touched files
+            self.save_manifest(manifest)
+            return False
+
+        self.log.info('Creating %s' % self.archive)
+        # the manifest vouches for the archive, it is only written once every stage succeeded
+        if os.path.isfile(self.manifest_path):
+            os.remove(self.manifest_path)
+        ok = True
+        if self.compile or self.strip_binaries:
+            staging_dir = tempfile.mkdtemp(prefix='sapling-')
+            try:
+                ok = self._stage(staging_dir)
+                write_archive(self.archive, walk(staging_dir), compression_level=self.compression_level, workers=self.workers)
+            finally:
+                shutil.rmtree(staging_dir)
+        else:
+            write_archive(self.archive, self._walk(), compression_level=self.compression_level, workers=self.workers)
+        if ok:
+            self.save_manifest(manifest)
+        else:
+            self.log.warning('%s was built without every stage, it is rebuilt on the next run' % self.archive)
+        return True
+
+    def breakdown(self):
+        return breakdown(self.archive)
+
+    def sha256(self):
+        '''
+        Returns the CodeSha256 of the archive, as reported by AWS Lambda once uploaded
+        '''
+        return code_sha256(self.archive)
@@ -0,0 +1,58 @@
+import json
+import logging
+import os
+import threading
+
+class StateFile(object):
+    """
+    Local deployment state of the stacks, keyed like the resource cache, optionally persisted to a JSON file
+    so that successive CLI runs can reuse it
+
+    Unlike the resource cache, entries never expire: they record what was last deployed from this machine.
+    """
+    def __init__(self, path=None):
+        """Constructor for the StateFile class
+
+        Args:
+            path (str): JSON file to persist the state to, only kept in memory if None
+        """
+        self.log = logging.getLogger(__name__)
+        self.path = path
+        self._stacks = {}
+        self._lock = threading.RLock()
+        self._load()
+
+    def _load(self):
+        if self.path is None or not os.path.isfile(self.path):
+            return
+        try:
+            with open(self.path, 'r') as f:
+                self._stacks = json.load(f).get('stacks', {})
+        except ValueError:
+            self.log.warning('State file %s is corrupt, ignoring' % self.path)
+            self._stacks = {}
+
+    def _save(self):
+        if self.path is None:
+            return
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        with open(self.path, 'w') as f:
+            json.dump({'stacks': self._stacks}, f, sort_keys=True)
+
+    def get(self, key):
+        """State of a stack, an empty dict if nothing was recorded
+        """
+        with self._lock:
+            return dict(self._stacks.get(key, {}))
+
+    def update(self, key, **values):
+        with self._lock:
+            self._stacks.setdefault(key, {}).update(values)
+            self._save()
+
+    def clear(self, key):
+        with self._lock:
+            self._stacks.pop(key, None)
+            self._save()
@@ -0,0 +1,104 @@
+import hashlib
+import json
+
+# Cloudformation quotas
+TEMPLATE_BODY_LIMIT = 51200
+TEMPLATE_URL_LIMIT = 1024 * 1024
+RESOURCE_LIMIT = 500
+OUTPUT_LIMIT = 200
+PARAMETER_LIMIT = 200
+
+def render(template):
+    '''
+    Minified JSON of a troposphere template
+    '''
+    return template.to_json(indent=None, separators=(',', ':'))
+
+def load(template):
+    '''
+    Template as a dict, from a rendered JSON string or the TemplateBody returned by get_template
+    '''
+    return json.loads(template) if isinstance(template, (str, bytes)) else template
+
+def canonical(template):
+    '''
+    Canonical JSON of a template: keys sorted, no whitespace, so formatting does not change its hash
+    '''
+    return json.dumps(load(template), sort_keys=True, separators=(',', ':'))
+
+def template_hash(template, parameters=None):
+    '''
+    SHA-256 of the canonical template and its parameters
+    '''
+    sha = hashlib.sha256(canonical(template).encode('utf-8'))
+    if parameters:
+        sha.update(canonical(sorted(parameters.items())).encode('utf-8'))
+    return sha.hexdigest()
+
+def resource_digests(template):
+    '''
+    Type and content hash of every resource of a template, keyed by logical ID
+    '''
+    resources = load(template).get('Resources', {})
+    return dict(
+        (logical_id, {'Type': resource.get('Type'), 'sha256': hashlib.sha256(canonical(resource).encode('utf-8')).hexdigest()})
+        for logical_id, resource in resources.items()
+    )
+
+def diff_resources(old, new):
+    '''
+    Structural diff of two resource_digests results
+
+    Returns:
+        list: (action, logical ID, resource type) tuples sorted by logical ID, action being Add, Modify or Remove
+    '''
+    old = {} if old is None else old
+    diff = []
+    for logical_id in sorted(set(old) | set(new)):
+        if logical_id not in old:
+            diff.append(('Add', logical_id, new[logical_id]['Type']))
+        elif logical_id not in new:
+            diff.append(('Remove', logical_id, old[logical_id]['Type']))
+        elif old[logical_id] != new[logical_id]:
+            diff.append(('Modify', logical_id, new[logical_id]['Type']))
+    return diff
+
+def format_diff(diff):
+    symbols = {'Add': '+', 'Modify': '~', 'Remove': '-'}
+    return ['%s %s (%s)' % (symbols[action], logical_id, resource_type) for action, logical_id, resource_type in diff]
+
+def size_report(template_body, top=5):
+    '''
+    Size of a rendered template against the Cloudformation quotas
+
+    Returns:
+        dict: bytes, resources, outputs and parameters of the template, with the largest resources
+            as (logical ID, resource type, bytes) tuples
+    '''
+    template = load(template_body)
+    resources = template.get('Resources', {})
+    largest = sorted(
+        ((logical_id, resource.get('Type'), len(canonical(resource))) for logical_id, resource in resources.items()),
+        key=lambda entry: (-entry[2], entry[0])
+    )
+    return {
+        'bytes': len(template_body.encode('utf-8')) if isinstance(template_body, str) else len(canonical(template)),
+        'resources': len(resources),
+        'outputs': len(template.get('Outputs', {})),
+        'parameters': len(template.get('Parameters', {})),
+        'largest': largest[:top]
+    }
+
+def format_size_report(report):
+    lines = [
+        'template: %d bytes, %d%% of the %d byte inline limit, %d%% of the %d byte S3 limit' % (
+            report['bytes'], 100 * report['bytes'] // TEMPLATE_BODY_LIMIT, TEMPLATE_BODY_LIMIT,
+            100 * report['bytes'] // TEMPLATE_URL_LIMIT, TEMPLATE_URL_LIMIT
+        ),
+        'resources: %d of %d, outputs: %d of %d, parameters: %d of %d' % (
+            report['resources'], RESOURCE_LIMIT, report['outputs'], OUTPUT_LIMIT, report['parameters'], PARAMETER_LIMIT
+        )
+    ]
+    for logical_id, resource_type, size in report['largest']:
+        lines.append('  %8d %s (%s)' % (size, logical_id, resource_type))
+    return lines
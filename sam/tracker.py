@@ -0,0 +1,126 @@
+import datetime
+import logging
+import random
+import time
+
+from botocore.exceptions import ClientError
+from dateutil.tz import tzutc
+
+def _utc(timestamp):
+    return timestamp.replace(tzinfo=tzutc()) if timestamp.tzinfo is None else timestamp
+
+class StackTracker(object):
+    """
+    Follows a single Cloudformation stack until it reaches a terminal state
+
+    The stack is polled with describe_stacks, backing off exponentially with jitter while nothing happens,
+    and its events are streamed incrementally from describe_stack_events using the last seen event ID.
+    """
+    MIN_DELAY = 1
+    MAX_DELAY = 30
+    BACKOFF = 1.5
+    TIMEOUT = 3600
+
+    def __init__(self, client, stack_name, since=None, log=None, min_delay=None, max_delay=None, timeout=None):
+        """Constructor for the StackTracker class
+
+        Args:
+            client (botocore.client.CloudFormation): cloudformation client
+            stack_name (str): name or ID of the stack to follow
+            since (datetime.datetime): only report events from this point in time, defaults to now
+            log (logging.Logger): logger to report to, defaults to the module logger
+            min_delay (float): seconds between polls while the stack is making progress
+            max_delay (float): upper bound of the seconds between polls
+            timeout (float): seconds after which waiting is abandoned
+        """
+        self.client = client
+        self.stack_name = stack_name
+        self.stack_id = None
+        self.since = datetime.datetime.now(tzutc()) if since is None else _utc(since)
+        self.last_event_id = None
+        self.log = logging.getLogger(__name__) if log is None else log
+        self.min_delay = self.MIN_DELAY if min_delay is None else min_delay
+        self.max_delay = self.MAX_DELAY if max_delay is None else max_delay
+        self.timeout = self.TIMEOUT if timeout is None else timeout
+
+    @staticmethod
+    def is_terminal(status):
+        return status is None or not status.endswith('_IN_PROGRESS')
+
+    def status(self):
+        """Current status of the stack, None if the stack does not exist
+
+        Once the stack was seen, it is looked up by its ID so that a deleted stack reports DELETE_COMPLETE.
+        """
+        try:
+            response = self.client.describe_stacks(StackName=self.stack_id or self.stack_name)
+        except ClientError as e:
+            if 'does not exist' in e.response['Error'].get('Message', ''):
+                return None
+            raise
+        stack = response['Stacks'][0]
+        self.stack_id = stack['StackId']
+        return stack['StackStatus']
+
+    def new_events(self):
+        """Events that happened since the last call, oldest first
+        """
+        events = []
+        kwargs = {'StackName': self.stack_id or self.stack_name}
+        done = False
+        while not done:
+            try:
+                response = self.client.describe_stack_events(**kwargs)
+            except ClientError as e:
+                if 'does not exist' in e.response['Error'].get('Message', ''):
+                    return []
+                raise
+            for event in response['StackEvents']:
+                if event['EventId'] == self.last_event_id or _utc(event['Timestamp']) < self.since:
+                    done = True
+                    break
+                events.append(event)
+            if not response.get('NextToken'):
+                break
+            kwargs['NextToken'] = response['NextToken']
+
+        if events:
+            self.last_event_id = events[0]['EventId']
+        events.reverse()
+        return events
+
+    def _sleep(self, delay):
+        time.sleep(random.uniform(self.min_delay, delay))
+
+    def wait(self, callback=None):
+        """Blocks until the stack reaches a terminal state
+
+        Args:
+            callback (callable): called with every new stack event as it is seen
+
+        Returns:
+            str: the terminal status of the stack, None if it does not exist (anymore)
+        """
+        start = time.time()
+        delay = self.min_delay
+        while True:
+            status = self.status()
+            events = self.new_events()
+            for event in events:
+                self.log.info(self.format_event(event))
+                if callback is not None:
+                    callback(event)
+            if self.is_terminal(status):
+                return status
+            if time.time() - start > self.timeout:
+                raise Exception('Timed out waiting for stack %s, last status %s' % (self.stack_name, status))
+            # poll quickly while events are coming in, back off while the stack is idle
+            delay = self.min_delay if events else min(self.max_delay, delay * self.BACKOFF)
+            self._sleep(delay)
+
+    @staticmethod
+    def format_event(event):
+        line = '%s %s %s' % (event['Timestamp'].strftime('%H:%M:%S'), event['LogicalResourceId'], event['ResourceStatus'])
+        if event.get('ResourceStatusReason'):
+            line += ' %s' % event['ResourceStatusReason']
+        return line
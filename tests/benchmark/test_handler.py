@@ -0,0 +1,20 @@
+import os
+import pytest
+
+pytest.importorskip('pytest_benchmark')
+
+import sam.local
+
+LAMBDA_DIR = os.path.join(os.path.dirname(__file__), '..', '..', 'lambda')
+
+@pytest.fixture
+def handler():
+    return sam.local.load_handler(LAMBDA_DIR, 'main.handler')
+
+def test_warm_invocation(benchmark, handler):
+    event = sam.local.proxy_event('GET', '/bench', query=[('page', '1')])
+    context = sam.local.LocalContext('main.handler')
+    benchmark(handler, event, context)
+
+def test_event_translation(benchmark):
+    benchmark(sam.local.proxy_event, 'POST', '/bench', headers={'Content-Type': 'application/json'}, body=b'{"page": 1}')
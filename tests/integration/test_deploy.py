@@ -11,8 +11,8 @@ def cloud(settings, pill):
     return cloud
 
 def test_bucket_deploy_and_exists(settings, cloud, pill):
-    response = {'ResponseMetadata': {'HTTPHeaders': {'content-length': '123', 'content-type': 'text/xml', 'date': 'xyz', 'x-amzn-requestid': 'xyz'}, 'HTTPStatusCode': 200, 'RequestId': 'xyz', 'RetryAttempts': 0}, 'StackSummaries': []}
-    pill.save_response(service='cloudformation', operation='ListStacks', response_data=response, http_response=200)
+    response = {'Error': {'Code': 'ValidationError', 'Message': 'Stack with id UnitTestApp does not exist'}, 'ResponseMetadata': {'HTTPStatusCode': 400}}
+    pill.save_response(service='cloudformation', operation='DescribeStacks', response_data=response, http_response=400)
 
     response = { "status_code": 200, "data": { "StackId": "arn:aws:cloudformation:us-east-1:123:stack/TestStackName/xyz", "ResponseMetadata": { "RequestId": "xyz", "HTTPStatusCode": 200, "HTTPHeaders": { "x-amzn-requestid": "xyz", "content-type": "text/xml", "content-length": "123"}, "RetryAttempts": 0 } } }
     pill.save_response(service='cloudformation', operation='CreateStack', response_data=response, http_response=200)
@@ -22,8 +22,8 @@ def test_bucket_deploy_and_exists(settings, cloud, pill):
     status = cloud.deploy()
     assert(status['status_code'] == 200)
 
-    response = {'ResponseMetadata': {'HTTPHeaders': {'content-length': '123', 'content-type': 'text/xml', 'date': 'xyz', 'x-amzn-requestid': 'xyz'}, 'HTTPStatusCode': 200, 'RequestId': 'xyz', 'RetryAttempts': 0}, 'StackSummaries': [{'CreationTime': datetime.datetime(2018, 1, 1, tzinfo=tzutc()), 'StackId': 'arn:aws:cloudformation:us-east-1:123:stack/TestStackName/xyz', 'StackName': cloud.name, 'StackStatus': 'CREATE_COMPLETE'}]}
-    pill.save_response(service='cloudformation', operation='ListStacks', response_data=response, http_response=200)
+    response = {'ResponseMetadata': {'HTTPHeaders': {'content-length': '123', 'content-type': 'text/xml', 'date': 'xyz', 'x-amzn-requestid': 'xyz'}, 'HTTPStatusCode': 200, 'RequestId': 'xyz', 'RetryAttempts': 0}, 'Stacks': [{'CreationTime': datetime.datetime(2018, 1, 1, tzinfo=tzutc()), 'StackId': 'arn:aws:cloudformation:us-east-1:123:stack/TestStackName/xyz', 'StackName': cloud.name, 'StackStatus': 'CREATE_COMPLETE'}]}
+    pill.save_response(service='cloudformation', operation='DescribeStacks', response_data=response, http_response=200)
 
     status = cloud.stack_exists(cloud.name)
     assert(status)
@@ -0,0 +1,78 @@
+import asyncio
+import datetime
+import json
+import threading
+import time
+
+import sam.aio
+
+from dateutil.tz import tzutc
+from sam.app import App
+from sam.cloud import Cloud
+
+def test_executor_limits_concurrency():
+    executor = sam.aio.Executor(limit=2)
+    lock = threading.Lock()
+    running = []
+    peak = []
+
+    def call(item):
+        with lock:
+            running.append(item)
+            peak.append(len(running))
+        time.sleep(0.02)
+        with lock:
+            running.remove(item)
+        return item * 2
+
+    results = asyncio.run(executor.map(call, range(6)))
+    executor.shutdown()
+    assert(results == [0, 2, 4, 6, 8, 10])
+    assert(max(peak) == 2)
+
+def test_executor_map_returns_exceptions():
+    executor = sam.aio.Executor(limit=2)
+
+    def call(item):
+        if item == 1:
+            raise ValueError('failed %d' % item)
+        return item
+
+    results = asyncio.run(executor.map(call, range(3), return_exceptions=True))
+    assert(results[0] == 0 and results[2] == 2)
+    assert(isinstance(results[1], ValueError))
+
+def test_proxy_runs_methods_concurrently(settings, pill):
+    response = {'Stacks': [{'CreationTime': datetime.datetime(2018, 1, 1, tzinfo=tzutc()), 'StackId': 'arn:aws:cloudformation:us-east-1:123:stack/UnitTestApp/xyz', 'StackName': settings['name'], 'StackStatus': 'CREATE_COMPLETE'}]}
+    pill.save_response(service='cloudformation', operation='DescribeStacks', response_data=response, http_response=200)
+    cloud = sam.aio.AsyncProxy(Cloud(settings, session=pill.session), limit=4)
+
+    async def lookups():
+        return await asyncio.gather(cloud.stack_exists(settings['name']), cloud.stack_ready(settings['name']), cloud.get('name'))
+
+    assert(asyncio.run(lookups()) == [True, True, settings['name']])
+    # plain attributes are passed through
+    assert(cloud.STACK_TYPE == Cloud.STACK_TYPE)
+
+def test_proxy_properties_are_read_with_get(settings):
+    cloud = sam.aio.AsyncProxy(Cloud(settings))
+    try:
+        cloud.function_names
+        assert(False)
+    except AttributeError as e:
+        assert('get(' in str(e))
+
+def test_async_fan_out_scaffold(tmpdir, settings, pill):
+    response = {'Error': {'Code': 'ValidationError', 'Message': 'Stack with id UnitTestApp does not exist'}, 'ResponseMetadata': {'HTTPStatusCode': 400}}
+    pill.save_response(service='cloudformation', operation='DescribeStacks', response_data=response, http_response=400)
+    settings['regions'] = ['us-east-1', 'eu-west-1']
+    settings['async_limit'] = 3
+    with open(str(tmpdir) + '/settings.json', 'w') as f:
+        json.dump(settings, f)
+    app = sam.aio.AsyncApp(App(debug=False, cwd=tmpdir, session=pill.session))
+    assert(app.executor.limit == 3)
+
+    results = asyncio.run(app.fan_out('scaffold', dry=True))
+    assert(list(results) == ['us-east-1', 'eu-west-1'])
+    assert(all(result['error'] is None for result in results.values()))
+    assert(results['eu-west-1']['target'].cloud.client.meta.region_name == 'eu-west-1')
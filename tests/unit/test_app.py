@@ -4,6 +4,7 @@ import json
 import os
 import pytest
 import shutil
+import subprocess
 import sys
 
 import troposphere.awslambda
@@ -42,8 +43,8 @@ def test_settings_save(tmpdir):
     assert(os.path.isfile(str(tmpdir) + '/settings.json'))
 
 def test_scaffold(tmpdir, pill):
-    response = {'ResponseMetadata': {'HTTPHeaders': {'content-length': '123', 'content-type': 'text/xml', 'date': 'xyz', 'x-amzn-requestid': 'xyz'}, 'HTTPStatusCode': 200, 'RequestId': 'xyz', 'RetryAttempts': 0}, 'StackSummaries': []}
-    pill.save_response(service='cloudformation', operation='ListStacks', response_data=response, http_response=200)
+    response = {'Error': {'Code': 'ValidationError', 'Message': 'Stack with id UnitTestApp does not exist'}, 'ResponseMetadata': {'HTTPStatusCode': 400}}
+    pill.save_response(service='cloudformation', operation='DescribeStacks', response_data=response, http_response=400)
 
     response = { "status_code": 200, "data": { "StackId": "arn:aws:cloudformation:us-east-1:123:stack/TestStackName/xyz", "ResponseMetadata": { "RequestId": "xyz", "HTTPStatusCode": 200, "HTTPHeaders": { "x-amzn-requestid": "xyz", "content-type": "text/xml", "content-length": "123"}, "RetryAttempts": 0 } } }
     pill.save_response(service='cloudformation', operation='CreateStack', response_data=response, http_response=200)
@@ -57,11 +58,11 @@ def test_scaffold(tmpdir, pill):
 
 def test_check_stack_exists(tmpdir, pill, settings):
     stack_name = 'UnitTestStack'
-    response = {'ResponseMetadata': {'HTTPHeaders': {'content-length': '123', 'content-type': 'text/xml', 'date': 'xyz', 'x-amzn-requestid': 'xyz'}, 'HTTPStatusCode': 200, 'RequestId': 'xyz', 'RetryAttempts': 0}, 'StackSummaries': [{'CreationTime': datetime.datetime(2018, 1, 1, tzinfo=tzutc()), 'StackId': 'arn:aws:cloudformation:us-east-1:123:stack/TestStackName/xyz', 'StackName': stack_name, 'StackStatus': 'CREATE_COMPLETE'}]}
-    pill.save_response(service='cloudformation', operation='ListStacks', response_data=response, http_response=200)
+    response = {'ResponseMetadata': {'HTTPHeaders': {'content-length': '123', 'content-type': 'text/xml', 'date': 'xyz', 'x-amzn-requestid': 'xyz'}, 'HTTPStatusCode': 200, 'RequestId': 'xyz', 'RetryAttempts': 0}, 'Stacks': [{'CreationTime': datetime.datetime(2018, 1, 1, tzinfo=tzutc()), 'StackId': 'arn:aws:cloudformation:us-east-1:123:stack/TestStackName/xyz', 'StackName': stack_name, 'StackStatus': 'CREATE_COMPLETE'}]}
+    pill.save_response(service='cloudformation', operation='DescribeStacks', response_data=response, http_response=200)
 
-    response = {'ResponseMetadata': {'HTTPHeaders': {'content-length': '123', 'content-type': 'text/xml', 'date': 'xyz', 'x-amzn-requestid': 'xyz'}, 'HTTPStatusCode': 200, 'RequestId': 'xyz', 'RetryAttempts': 0}, 'StackSummaries': [{'CreationTime': datetime.datetime(2018, 1, 1, tzinfo=tzutc()), 'StackId': 'arn:aws:cloudformation:us-east-1:123:stack/TestStackName/xyz', 'StackName': settings['name'], 'StackStatus': 'CREATE_COMPLETE'}]}
-    pill.save_response(service='cloudformation', operation='ListStacks', response_data=response, http_response=200)
+    response = {'ResponseMetadata': {'HTTPHeaders': {'content-length': '123', 'content-type': 'text/xml', 'date': 'xyz', 'x-amzn-requestid': 'xyz'}, 'HTTPStatusCode': 200, 'RequestId': 'xyz', 'RetryAttempts': 0}, 'Stacks': [{'CreationTime': datetime.datetime(2018, 1, 1, tzinfo=tzutc()), 'StackId': 'arn:aws:cloudformation:us-east-1:123:stack/TestStackName/xyz', 'StackName': settings['name'], 'StackStatus': 'CREATE_COMPLETE'}]}
+    pill.save_response(service='cloudformation', operation='DescribeStacks', response_data=response, http_response=200)
 
     app = App(name=settings['name'], debug=False, cwd=tmpdir, session=pill.session)
 
@@ -74,14 +75,14 @@ def test_check_stack_exists(tmpdir, pill, settings):
 def test_check_stack_ready(tmpdir, pill, settings):
     stack_name = 'UnitTestStack'
     stack_name_not = 'UnitTestStackNot'
-    response = {'ResponseMetadata': {'HTTPHeaders': {'content-length': '123', 'content-type': 'text/xml', 'date': 'xyz', 'x-amzn-requestid': 'xyz'}, 'HTTPStatusCode': 200, 'RequestId': 'xyz', 'RetryAttempts': 0}, 'StackSummaries': [{'CreationTime': datetime.datetime(2018, 1, 1, tzinfo=tzutc()), 'StackId': 'arn:aws:cloudformation:us-east-1:123:stack/TestStackName/xyz', 'StackName': stack_name, 'StackStatus': 'CREATE_COMPLETE'}]}
-    pill.save_response(service='cloudformation', operation='ListStacks', response_data=response, http_response=200)
+    response = {'ResponseMetadata': {'HTTPHeaders': {'content-length': '123', 'content-type': 'text/xml', 'date': 'xyz', 'x-amzn-requestid': 'xyz'}, 'HTTPStatusCode': 200, 'RequestId': 'xyz', 'RetryAttempts': 0}, 'Stacks': [{'CreationTime': datetime.datetime(2018, 1, 1, tzinfo=tzutc()), 'StackId': 'arn:aws:cloudformation:us-east-1:123:stack/TestStackName/xyz', 'StackName': stack_name, 'StackStatus': 'CREATE_COMPLETE'}]}
+    pill.save_response(service='cloudformation', operation='DescribeStacks', response_data=response, http_response=200)
 
-    response = {'ResponseMetadata': {'HTTPHeaders': {'content-length': '123', 'content-type': 'text/xml', 'date': 'xyz', 'x-amzn-requestid': 'xyz'}, 'HTTPStatusCode': 200, 'RequestId': 'xyz', 'RetryAttempts': 0}, 'StackSummaries': [{'CreationTime': datetime.datetime(2018, 1, 1, tzinfo=tzutc()), 'StackId': 'arn:aws:cloudformation:us-east-1:123:stack/TestStackName/xyz', 'StackName': settings['name'], 'StackStatus': 'CREATE_COMPLETE'}]}
-    pill.save_response(service='cloudformation', operation='ListStacks', response_data=response, http_response=200)
+    response = {'ResponseMetadata': {'HTTPHeaders': {'content-length': '123', 'content-type': 'text/xml', 'date': 'xyz', 'x-amzn-requestid': 'xyz'}, 'HTTPStatusCode': 200, 'RequestId': 'xyz', 'RetryAttempts': 0}, 'Stacks': [{'CreationTime': datetime.datetime(2018, 1, 1, tzinfo=tzutc()), 'StackId': 'arn:aws:cloudformation:us-east-1:123:stack/TestStackName/xyz', 'StackName': settings['name'], 'StackStatus': 'CREATE_COMPLETE'}]}
+    pill.save_response(service='cloudformation', operation='DescribeStacks', response_data=response, http_response=200)
 
-    response = {'ResponseMetadata': {'HTTPHeaders': {'content-length': '123', 'content-type': 'text/xml', 'date': 'xyz', 'x-amzn-requestid': 'xyz'}, 'HTTPStatusCode': 200, 'RequestId': 'xyz', 'RetryAttempts': 0}, 'StackSummaries': []}
-    pill.save_response(service='cloudformation', operation='ListStacks', response_data=response, http_response=200)
+    response = {'Error': {'Code': 'ValidationError', 'Message': 'Stack with id UnitTestApp does not exist'}, 'ResponseMetadata': {'HTTPStatusCode': 400}}
+    pill.save_response(service='cloudformation', operation='DescribeStacks', response_data=response, http_response=400)
 
     app = App(name=settings['name'], debug=False, cwd=tmpdir, session=pill.session)
 
@@ -99,18 +100,21 @@ def test_upload_lambda_code(tmpdir, pill, settings):
     code_filepath = str(tmpdir) + '/lambda.zip'
     open(code_filepath, 'a').close()
 
-    response = {'ResponseMetadata': {'HTTPHeaders': {'content-length': '123', 'content-type': 'text/xml', 'date': 'xyz', 'x-amzn-requestid': 'xyz'}, 'HTTPStatusCode': 200, 'RequestId': 'xyz', 'RetryAttempts': 0}, 'StackSummaries': []}
-    pill.save_response(service='cloudformation', operation='ListStacks', response_data=response, http_response=200)
+    response = {'Error': {'Code': 'ValidationError', 'Message': 'Stack with id UnitTestApp does not exist'}, 'ResponseMetadata': {'HTTPStatusCode': 400}}
+    pill.save_response(service='cloudformation', operation='DescribeStacks', response_data=response, http_response=400)
 
     response = { "status_code": 200, "data": { "StackId": "arn:aws:cloudformation:us-east-1:123:stack/TestStackName/xyz", "ResponseMetadata": { "RequestId": "xyz", "HTTPStatusCode": 200, "HTTPHeaders": { "x-amzn-requestid": "xyz", "content-type": "text/xml", "content-length": "123"}, "RetryAttempts": 0 } } }
     pill.save_response(service='cloudformation', operation='CreateStack', response_data=response, http_response=200)
 
-    response = {'ResponseMetadata': {'HTTPHeaders': {'content-length': '123', 'content-type': 'text/xml', 'date': 'xyz', 'x-amzn-requestid': 'xyz'}, 'HTTPStatusCode': 200, 'RequestId': 'xyz', 'RetryAttempts': 0}, 'StackSummaries': [{'CreationTime': datetime.datetime(2018, 1, 1, tzinfo=tzutc()), 'StackId': 'arn:aws:cloudformation:us-east-1:123:stack/TestStackName/xyz', 'StackName': settings['name'], 'StackStatus': 'CREATE_COMPLETE'}]}
-    pill.save_response(service='cloudformation', operation='ListStacks', response_data=response, http_response=200)
+    response = {'ResponseMetadata': {'HTTPHeaders': {'content-length': '123', 'content-type': 'text/xml', 'date': 'xyz', 'x-amzn-requestid': 'xyz'}, 'HTTPStatusCode': 200, 'RequestId': 'xyz', 'RetryAttempts': 0}, 'Stacks': [{'CreationTime': datetime.datetime(2018, 1, 1, tzinfo=tzutc()), 'StackId': 'arn:aws:cloudformation:us-east-1:123:stack/TestStackName/xyz', 'StackName': settings['name'], 'StackStatus': 'CREATE_COMPLETE'}]}
+    pill.save_response(service='cloudformation', operation='DescribeStacks', response_data=response, http_response=200)
 
     response = { "StackResourceSummaries": [ { "LogicalResourceId": "LambdaExecutionRole", "PhysicalResourceId": settings['name'], "ResourceType": troposphere.awslambda.Function.resource_type, "LastUpdatedTimestamp": { "__class__": "datetime", "year": 2018, "month": 3, "day": 18, "hour": 17, "minute": 24, "second": 33, "microsecond": 565000 }, "ResourceStatus": "CREATE_COMPLETE" } ] }
     pill.save_response(service='cloudformation', operation='ListStackResources', response_data=response, http_response=200)
 
+    response = { "ResponseMetadata": { "RequestId": "xyz", "HTTPStatusCode": 200, "HTTPHeaders": { "date": "123", "content-type": "application/json", "content-length": "649", "connection": "keep-alive", "x-amzn-requestid": "xyz" }, "RetryAttempts": 0 }, "FunctionName": function_name, "CodeSize": 261, "CodeSha256": "xyz", "Version": "$LATEST", "LastUpdateStatus": "Successful" }
+    pill.save_response(service='lambda', operation='GetFunctionConfiguration', response_data=response, http_response=200)
+
     response = { "ResponseMetadata": { "RequestId": "xyz", "HTTPStatusCode": 200, "HTTPHeaders": { "date": "123", "content-type": "application/json", "content-length": "649", "connection": "keep-alive", "x-amzn-requestid": "xyz" }, "RetryAttempts": 0 }, "FunctionName": function_name, "FunctionArn": "arn:aws:lambda:us-east-1:123:function:%s" % function_name, "Runtime": "python3.6", "Role": "arn:aws:iam::123:role/xyz", "Handler": "default", "CodeSize": 261, "Description": "", "Timeout": 3, "MemorySize": 128, "LastModified": "123", "CodeSha256": "xyz", "Version": "$LATEST", "TracingConfig": { "Mode": "PassThrough" }, "RevisionId": "6a636cf5-8bdc-4e49-8ca8-bf7e166347d9" }
     pill.save_response(service='lambda', operation='UpdateFunctionCode', response_data=response, http_response=200)
 
@@ -149,23 +153,27 @@ def test_cli(runner):
     assert(result.exit_code == 0)
 
 def test_cli_scaffold_dry(runner, obj, pill):
-    response = {'ResponseMetadata': {'HTTPHeaders': {'content-length': '123', 'content-type': 'text/xml', 'date': 'xyz', 'x-amzn-requestid': 'xyz'}, 'HTTPStatusCode': 200, 'RequestId': 'xyz', 'RetryAttempts': 0}, 'StackSummaries': []}
-    pill.save_response(service='cloudformation', operation='ListStacks', response_data=response, http_response=200)
+    response = {'Error': {'Code': 'ValidationError', 'Message': 'Stack with id UnitTestApp does not exist'}, 'ResponseMetadata': {'HTTPStatusCode': 400}}
+    pill.save_response(service='cloudformation', operation='DescribeStacks', response_data=response, http_response=400)
 
     result = runner.invoke(sam.app.scaffold, ['--dry'], obj=obj)
     assert(result.exit_code == 0)
-    assert(result.output == 'scaffolding...\n')
+    lines = result.output.splitlines()
+    assert(lines[0] == 'scaffolding...')
+    # a new stack, every resource is added
+    assert('+ LambdaExecutionRole (AWS::IAM::Role)' in lines)
+    assert(all(line.startswith('+ ') for line in lines[1:]))
 
 def test_cli_stack_exists(runner, obj, pill, settings):
     stack_name = 'UnitTestStack'
-    response = {'ResponseMetadata': {'HTTPHeaders': {'content-length': '123', 'content-type': 'text/xml', 'date': 'xyz', 'x-amzn-requestid': 'xyz'}, 'HTTPStatusCode': 200, 'RequestId': 'xyz', 'RetryAttempts': 0}, 'StackSummaries': [{'CreationTime': datetime.datetime(2018, 1, 1, tzinfo=tzutc()), 'StackId': 'arn:aws:cloudformation:us-east-1:123:stack/TestStackName/xyz', 'StackName': stack_name, 'StackStatus': 'CREATE_IN_PROGRESS'}]}
-    pill.save_response(service='cloudformation', operation='ListStacks', response_data=response, http_response=200)
+    response = {'ResponseMetadata': {'HTTPHeaders': {'content-length': '123', 'content-type': 'text/xml', 'date': 'xyz', 'x-amzn-requestid': 'xyz'}, 'HTTPStatusCode': 200, 'RequestId': 'xyz', 'RetryAttempts': 0}, 'Stacks': [{'CreationTime': datetime.datetime(2018, 1, 1, tzinfo=tzutc()), 'StackId': 'arn:aws:cloudformation:us-east-1:123:stack/TestStackName/xyz', 'StackName': stack_name, 'StackStatus': 'CREATE_IN_PROGRESS'}]}
+    pill.save_response(service='cloudformation', operation='DescribeStacks', response_data=response, http_response=200)
 
-    response = {'ResponseMetadata': {'HTTPHeaders': {'content-length': '123', 'content-type': 'text/xml', 'date': 'xyz', 'x-amzn-requestid': 'xyz'}, 'HTTPStatusCode': 200, 'RequestId': 'xyz', 'RetryAttempts': 0}, 'StackSummaries': [{'CreationTime': datetime.datetime(2018, 1, 1, tzinfo=tzutc()), 'StackId': 'arn:aws:cloudformation:us-east-1:123:stack/TestStackName/xyz', 'StackName': settings['name'], 'StackStatus': 'CREATE_COMPLETE'}]}
-    pill.save_response(service='cloudformation', operation='ListStacks', response_data=response, http_response=200)
+    response = {'ResponseMetadata': {'HTTPHeaders': {'content-length': '123', 'content-type': 'text/xml', 'date': 'xyz', 'x-amzn-requestid': 'xyz'}, 'HTTPStatusCode': 200, 'RequestId': 'xyz', 'RetryAttempts': 0}, 'Stacks': [{'CreationTime': datetime.datetime(2018, 1, 1, tzinfo=tzutc()), 'StackId': 'arn:aws:cloudformation:us-east-1:123:stack/TestStackName/xyz', 'StackName': settings['name'], 'StackStatus': 'CREATE_COMPLETE'}]}
+    pill.save_response(service='cloudformation', operation='DescribeStacks', response_data=response, http_response=200)
 
-    response = {'ResponseMetadata': {'HTTPHeaders': {'content-length': '123', 'content-type': 'text/xml', 'date': 'xyz', 'x-amzn-requestid': 'xyz'}, 'HTTPStatusCode': 200, 'RequestId': 'xyz', 'RetryAttempts': 0}, 'StackSummaries': [{'CreationTime': datetime.datetime(2018, 1, 1, tzinfo=tzutc()), 'StackId': 'arn:aws:cloudformation:us-east-1:123:stack/TestStackName/xyz', 'StackName': settings['name'], 'StackStatus': 'CREATE_COMPLETE'}]}
-    pill.save_response(service='cloudformation', operation='ListStacks', response_data=response, http_response=200)
+    response = {'ResponseMetadata': {'HTTPHeaders': {'content-length': '123', 'content-type': 'text/xml', 'date': 'xyz', 'x-amzn-requestid': 'xyz'}, 'HTTPStatusCode': 200, 'RequestId': 'xyz', 'RetryAttempts': 0}, 'Stacks': [{'CreationTime': datetime.datetime(2018, 1, 1, tzinfo=tzutc()), 'StackId': 'arn:aws:cloudformation:us-east-1:123:stack/TestStackName/xyz', 'StackName': settings['name'], 'StackStatus': 'CREATE_COMPLETE'}]}
+    pill.save_response(service='cloudformation', operation='DescribeStacks', response_data=response, http_response=200)
 
     result = runner.invoke(sam.app.exists, ['--stack', stack_name], obj=obj)
     assert(result.output == 'stack %s exists\n' % stack_name)
@@ -179,30 +187,341 @@ def test_cli_stack_exists(runner, obj, pill, settings):
 def test_cli_upload_lambda_code(runner, obj, pill, settings):
     function_name = obj['app'].function_name
 
-    response = {'ResponseMetadata': {'HTTPHeaders': {'content-length': '123', 'content-type': 'text/xml', 'date': 'xyz', 'x-amzn-requestid': 'xyz'}, 'HTTPStatusCode': 200, 'RequestId': 'xyz', 'RetryAttempts': 0}, 'StackSummaries': []}
-    pill.save_response(service='cloudformation', operation='ListStacks', response_data=response, http_response=200)
+    response = {'Error': {'Code': 'ValidationError', 'Message': 'Stack with id UnitTestApp does not exist'}, 'ResponseMetadata': {'HTTPStatusCode': 400}}
+    pill.save_response(service='cloudformation', operation='DescribeStacks', response_data=response, http_response=400)
 
     response = { "status_code": 200, "data": { "StackId": "arn:aws:cloudformation:us-east-1:123:stack/TestStackName/xyz", "ResponseMetadata": { "RequestId": "xyz", "HTTPStatusCode": 200, "HTTPHeaders": { "x-amzn-requestid": "xyz", "content-type": "text/xml", "content-length": "123"}, "RetryAttempts": 0 } } }
     pill.save_response(service='cloudformation', operation='CreateStack', response_data=response, http_response=200)
 
-    response = {'ResponseMetadata': {'HTTPHeaders': {'content-length': '123', 'content-type': 'text/xml', 'date': 'xyz', 'x-amzn-requestid': 'xyz'}, 'HTTPStatusCode': 200, 'RequestId': 'xyz', 'RetryAttempts': 0}, 'StackSummaries': [{'CreationTime': datetime.datetime(2018, 1, 1, tzinfo=tzutc()), 'StackId': 'arn:aws:cloudformation:us-east-1:123:stack/TestStackName/xyz', 'StackName': settings['name'], 'StackStatus': 'CREATE_COMPLETE'}]}
-    pill.save_response(service='cloudformation', operation='ListStacks', response_data=response, http_response=200)
+    response = {'ResponseMetadata': {'HTTPHeaders': {'content-length': '123', 'content-type': 'text/xml', 'date': 'xyz', 'x-amzn-requestid': 'xyz'}, 'HTTPStatusCode': 200, 'RequestId': 'xyz', 'RetryAttempts': 0}, 'Stacks': [{'CreationTime': datetime.datetime(2018, 1, 1, tzinfo=tzutc()), 'StackId': 'arn:aws:cloudformation:us-east-1:123:stack/TestStackName/xyz', 'StackName': settings['name'], 'StackStatus': 'CREATE_COMPLETE'}]}
+    pill.save_response(service='cloudformation', operation='DescribeStacks', response_data=response, http_response=200)
 
-    response = { "StackResourceSummaries": [ { "LogicalResourceId": "LambdaExecutionRole", "PhysicalResourceId": settings['name'], "ResourceType": troposphere.awslambda.Function.resource_type, "LastUpdatedTimestamp": { "__class__": "datetime", "year": 2018, "month": 3, "day": 18, "hour": 17, "minute": 24, "second": 33, "microsecond": 565000 }, "ResourceStatus": "CREATE_COMPLETE" } ] }
+    response = { "StackResourceSummaries": [ { "LogicalResourceId": "LambdaExecutionRole", "PhysicalResourceId": function_name, "ResourceType": troposphere.awslambda.Function.resource_type, "LastUpdatedTimestamp": { "__class__": "datetime", "year": 2018, "month": 3, "day": 18, "hour": 17, "minute": 24, "second": 33, "microsecond": 565000 }, "ResourceStatus": "CREATE_COMPLETE" } ] }
     pill.save_response(service='cloudformation', operation='ListStackResources', response_data=response, http_response=200)
 
+    response = { "ResponseMetadata": { "RequestId": "xyz", "HTTPStatusCode": 200, "HTTPHeaders": { "date": "123", "content-type": "application/json", "content-length": "649", "connection": "keep-alive", "x-amzn-requestid": "xyz" }, "RetryAttempts": 0 }, "FunctionName": function_name, "CodeSize": 261, "CodeSha256": "xyz", "Version": "$LATEST", "LastUpdateStatus": "Successful" }
+    pill.save_response(service='lambda', operation='GetFunctionConfiguration', response_data=response, http_response=200)
+
     response = { "ResponseMetadata": { "RequestId": "xyz", "HTTPStatusCode": 200, "HTTPHeaders": { "date": "123", "content-type": "application/json", "content-length": "649", "connection": "keep-alive", "x-amzn-requestid": "xyz" }, "RetryAttempts": 0 }, "FunctionName": function_name, "FunctionArn": "arn:aws:lambda:us-east-1:123:function:%s" % function_name, "Runtime": "python3.6", "Role": "arn:aws:iam::123:role/xyz", "Handler": "default", "CodeSize": 261, "Description": "", "Timeout": 3, "MemorySize": 128, "LastModified": "123", "CodeSha256": "xyz", "Version": "$LATEST", "TracingConfig": { "Mode": "PassThrough" }, "RevisionId": "6a636cf5-8bdc-4e49-8ca8-bf7e166347d9" }
     pill.save_response(service='lambda', operation='UpdateFunctionCode', response_data=response, http_response=200)
 
-    response = {'ResponseMetadata': {'HTTPHeaders': {'content-length': '123', 'content-type': 'text/xml', 'date': 'xyz', 'x-amzn-requestid': 'xyz'}, 'HTTPStatusCode': 200, 'RequestId': 'xyz', 'RetryAttempts': 0}, 'StackSummaries': [{'CreationTime': datetime.datetime(2018, 1, 1, tzinfo=tzutc()), 'StackId': 'arn:aws:cloudformation:us-east-1:123:stack/TestStackName/xyz', 'StackName': settings['name'], 'StackStatus': 'CREATE_COMPLETE'}]}
-    pill.save_response(service='cloudformation', operation='ListStacks', response_data=response, http_response=200)
+    response = {'ResponseMetadata': {'HTTPHeaders': {'content-length': '123', 'content-type': 'text/xml', 'date': 'xyz', 'x-amzn-requestid': 'xyz'}, 'HTTPStatusCode': 200, 'RequestId': 'xyz', 'RetryAttempts': 0}, 'Stacks': [{'CreationTime': datetime.datetime(2018, 1, 1, tzinfo=tzutc()), 'StackId': 'arn:aws:cloudformation:us-east-1:123:stack/TestStackName/xyz', 'StackName': settings['name'], 'StackStatus': 'CREATE_COMPLETE'}]}
+    pill.save_response(service='cloudformation', operation='DescribeStacks', response_data=response, http_response=200)
 
     response = { "StackResourceSummaries": [ { "LogicalResourceId": "LambdaExecutionRole", "PhysicalResourceId": function_name, "ResourceType": troposphere.awslambda.Function.resource_type, "LastUpdatedTimestamp": { "__class__": "datetime", "year": 2018, "month": 3, "day": 18, "hour": 17, "minute": 24, "second": 33, "microsecond": 565000 }, "ResourceStatus": "CREATE_COMPLETE" } ] }
     pill.save_response(service='cloudformation', operation='ListStackResources', response_data=response, http_response=200)
 
     result = runner.invoke(sam.app.scaffold, obj=obj)
     assert(result.exit_code == 0)
-    assert(result.output == 'scaffolding...\n')
+    assert(result.output.startswith('scaffolding...\n'))
 
     result = runner.invoke(sam.app.update, obj=obj)
     assert(result.output == 'lambda function %s updated\n' % function_name)
+
+def _functions_settings(tmpdir, settings):
+    settings['functions'] = {
+        'Users': {'handler': 'main.handler', 'memory_size': 256, 'timeout': 10},
+        'Orders': {'source': 'orders'}
+    }
+    with open(str(tmpdir) + '/settings.json', 'w') as f:
+        json.dump(settings, f)
+    tmpdir.ensure('lambda/Users/main.py').write('def handler(event, context):\n    return event\n')
+    return settings
+
+def test_functions_default(tmpdir, settings):
+    app = App(name=settings['name'], debug=False, cwd=tmpdir)
+    assert(list(app.functions) == [app.function_name])
+    assert(app.functions[app.function_name]['archive'] == App.LAMBDA_ZIP)
+
+def test_functions_invalid_name(tmpdir, settings):
+    settings['functions'] = {'my-func': {}}
+    with open(str(tmpdir) + '/settings.json', 'w') as f:
+        json.dump(settings, f)
+    with pytest.raises(Exception) as e:
+        App(debug=False, cwd=tmpdir)
+    assert('my-func' in str(e.value))
+
+def test_scaffold_functions(tmpdir, pill, settings):
+    _functions_settings(tmpdir, settings)
+    response = {'Error': {'Code': 'ValidationError', 'Message': 'Stack with id UnitTestApp does not exist'}, 'ResponseMetadata': {'HTTPStatusCode': 400}}
+    pill.save_response(service='cloudformation', operation='DescribeStacks', response_data=response, http_response=400)
+
+    app = App(debug=False, cwd=tmpdir, session=pill.session)
+    app.scaffold(dry=True)
+
+    assert('Users' in app.cloud.template.resources)
+    assert('Orders' in app.cloud.template.resources)
+    assert(app.cloud.template.resources['Users'].properties['MemorySize'] == 256)
+    assert(app.cloud.template.resources['Orders'].properties['Handler'] == 'main.handler')
+
+def test_upload_functions(tmpdir, pill, settings):
+    _functions_settings(tmpdir, settings)
+
+    response = {'Stacks': [{'CreationTime': datetime.datetime(2018, 1, 1, tzinfo=tzutc()), 'StackId': 'arn:aws:cloudformation:us-east-1:123:stack/TestStackName/xyz', 'StackName': settings['name'], 'StackStatus': 'CREATE_COMPLETE'}]}
+    pill.save_response(service='cloudformation', operation='DescribeStacks', response_data=response, http_response=200)
+
+    response = { "StackResourceSummaries": [ { "LogicalResourceId": "Users", "PhysicalResourceId": "users-xyz", "ResourceType": troposphere.awslambda.Function.resource_type, "ResourceStatus": "CREATE_COMPLETE" }, { "LogicalResourceId": "Orders", "PhysicalResourceId": "orders-xyz", "ResourceType": troposphere.awslambda.Function.resource_type, "ResourceStatus": "CREATE_COMPLETE" } ] }
+    pill.save_response(service='cloudformation', operation='ListStackResources', response_data=response, http_response=200)
+
+    response = { "ResponseMetadata": { "HTTPStatusCode": 200 }, "FunctionName": "users-xyz", "CodeSha256": "xyz", "LastUpdateStatus": "Successful" }
+    pill.save_response(service='lambda', operation='GetFunctionConfiguration', response_data=response, http_response=200)
+
+    response = { "ResponseMetadata": { "HTTPStatusCode": 200 }, "FunctionName": "users-xyz", "CodeSha256": "abc" }
+    pill.save_response(service='lambda', operation='UpdateFunctionCode', response_data=response, http_response=200)
+
+    app = App(debug=False, cwd=tmpdir, session=pill.session)
+    results = app.upload_functions()
+
+    assert(results['Users']['error'] is None)
+    assert(results['Users']['function_name'] == 'users-xyz')
+    assert(os.path.isfile(str(tmpdir) + '/lambda-Users.zip'))
+    assert(results['Orders']['error'] is not None)
+    assert(app.upload_lambda_code() is None)
+
+def test_upload_functions_share_one_bucket(tmpdir, pill, settings):
+    _functions_settings(tmpdir, settings)
+    del settings['bucket']
+    settings['s3_upload_threshold'] = 0
+    with open(str(tmpdir) + '/settings.json', 'w') as f:
+        json.dump(settings, f)
+    tmpdir.ensure('lambda/orders/main.py').write('def handler(event, context):\n    return event\n')
+
+    response = {'Stacks': [{'CreationTime': datetime.datetime(2018, 1, 1, tzinfo=tzutc()), 'StackId': 'arn:aws:cloudformation:us-east-1:123:stack/TestStackName/xyz', 'StackName': settings['name'], 'StackStatus': 'CREATE_COMPLETE'}]}
+    pill.save_response(service='cloudformation', operation='DescribeStacks', response_data=response, http_response=200)
+
+    response = { "StackResourceSummaries": [ { "LogicalResourceId": "Users", "PhysicalResourceId": "users-xyz", "ResourceType": troposphere.awslambda.Function.resource_type, "ResourceStatus": "CREATE_COMPLETE" }, { "LogicalResourceId": "Orders", "PhysicalResourceId": "orders-xyz", "ResourceType": troposphere.awslambda.Function.resource_type, "ResourceStatus": "CREATE_COMPLETE" } ] }
+    pill.save_response(service='cloudformation', operation='ListStackResources', response_data=response, http_response=200)
+
+    response = { "ResponseMetadata": { "HTTPStatusCode": 200 }, "CodeSha256": "xyz", "LastUpdateStatus": "Successful" }
+    pill.save_response(service='lambda', operation='GetFunctionConfiguration', response_data=response, http_response=200)
+
+    pill.save_response(service='s3', operation='ListBuckets', response_data={'Buckets': []}, http_response=200)
+    pill.save_response(service='s3', operation='CreateBucket', response_data={'ResponseMetadata': {'HTTPStatusCode': 200}}, http_response=200)
+    pill.save_response(service='s3', operation='PutObject', response_data={'ResponseMetadata': {'HTTPStatusCode': 200}, 'ETag': '"xyz"'}, http_response=200)
+
+    response = { "ResponseMetadata": { "HTTPStatusCode": 200 }, "CodeSha256": "abc" }
+    pill.save_response(service='lambda', operation='UpdateFunctionCode', response_data=response, http_response=200)
+
+    buckets = []
+    pill.session.events.register('provide-client-params.lambda.UpdateFunctionCode', lambda params, **kwargs: buckets.append(params['S3Bucket']))
+
+    app = App(debug=False, cwd=tmpdir, session=pill.session)
+    results = app.upload_functions()
+
+    assert(all(result['error'] is None for result in results.values()))
+    assert(len(buckets) == 2)
+    assert(buckets == [app.settings['bucket']] * 2)
+    with open(str(tmpdir) + '/settings.json') as f:
+        assert(json.load(f)['bucket'] == app.settings['bucket'])
+
+def test_cli_configure(runner, tmpdir, settings):
+    _functions_settings(tmpdir, settings)
+    obj = {'debug': False, 'app': App(debug=False, cwd=tmpdir)}
+
+    result = runner.invoke(sam.app.configure, ['--memory-size', '512', '--architecture', 'arm64'], obj=obj)
+    assert(result.output == 'settings saved\n')
+    result = runner.invoke(sam.app.configure, ['--function', 'Users', '--provisioned-concurrency', '2', '--memory-size', '1024'], obj=obj)
+    assert(result.exit_code == 0)
+    result = runner.invoke(sam.app.configure, ['--function', 'Missing', '--timeout', '3'], obj=obj)
+    assert(result.exit_code != 0)
+
+    with open(str(tmpdir) + '/settings.json') as f:
+        saved = json.load(f)
+    assert(saved['memory_size'] == 512)
+    assert(saved['functions']['Users']['provisioned_concurrency'] == 2)
+
+    functions = obj['app'].functions
+    assert(functions['Users']['memory_size'] == 1024)
+    assert(functions['Orders']['memory_size'] == 512)
+    assert(functions['Orders']['architecture'] == 'arm64')
+    assert(App.alias_name(functions['Users']) == 'live')
+    assert(App.alias_name(functions['Orders']) is None)
+
+def test_cli_bench(runner, tmpdir, settings):
+    tmpdir.mkdir('lambda').join('index.py').write("def handler(event, context):\n    return {'statusCode': 200, 'body': event['path']}\n")
+    obj = {'debug': False, 'app': App(debug=False, cwd=tmpdir)}
+
+    output = str(tmpdir) + '/bench.json'
+    result = runner.invoke(sam.app.bench, ['--invocations', '20', '--runs', '1', '--output', output], obj=obj)
+    assert(result.exit_code == 0)
+    assert('warm: p50' in result.output)
+    with open(output) as f:
+        results = json.load(f)
+    assert(results['warm']['invocations'] == 20)
+    assert(results['archive']['files'] == 1)
+
+    results['archive']['size'] = 1
+    with open(output, 'w') as f:
+        json.dump(results, f)
+    result = runner.invoke(sam.app.bench, ['--invocations', '20', '--runs', '1', '--baseline', output], obj=obj)
+    assert(result.exit_code == 1)
+    assert('regression: archive.size' in result.output)
+
+def test_cli_package(runner, tmpdir, settings):
+    lambda_dir = tmpdir.mkdir('lambda')
+    lambda_dir.join('index.py').write('def handler(event, context):\n    return event\n')
+    lambda_dir.mkdir('tests').join('test_index.py').write('def test():\n    pass\n')
+    settings['package'] = {'strip': True}
+    with open(str(tmpdir) + '/settings.json', 'w') as f:
+        json.dump(settings, f)
+    obj = {'debug': False, 'app': App(debug=False, cwd=tmpdir)}
+
+    result = runner.invoke(sam.app.package, [], obj=obj)
+    assert(result.exit_code == 0)
+    assert('lambda.zip' in result.output)
+    assert(result.output.strip().endswith('index.py'))
+    assert('tests' not in result.output)
+
+STARTUP = '''import sys
+import sam.app
+try:
+    sam.app.main()
+except SystemExit:
+    pass
+print('loaded: %s' % ','.join(name for name in ('boto3', 'botocore', 'troposphere') if name in sys.modules))
+'''
+
+def test_cli_startup_is_lazy(tmpdir):
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    for args in (['--help'], ['--version'], ['exists', '--help'], ['update', '--help']):
+        process = subprocess.run(
+            [sys.executable, '-c', STARTUP] + args,
+            cwd=str(tmpdir), env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True
+        )
+        assert(process.stdout.splitlines()[-1] == 'loaded: ')
+    assert(not os.path.exists(str(tmpdir) + '/settings.json'))
+    assert(not os.path.exists(str(tmpdir) + '/lambda'))
+
+def test_cli_exists_does_not_import_troposphere(runner, obj, pill, settings):
+    response = {'Stacks': [{'CreationTime': datetime.datetime(2018, 1, 1, tzinfo=tzutc()), 'StackId': 'arn:aws:cloudformation:us-east-1:123:stack/UnitTestApp/xyz', 'StackName': 'UnitTestApp', 'StackStatus': 'CREATE_COMPLETE'}], 'ResponseMetadata': {'HTTPStatusCode': 200}}
+    pill.save_response(service='cloudformation', operation='DescribeStacks', response_data=response, http_response=200)
+
+    result = runner.invoke(sam.app.exists, [], obj=obj)
+    assert(result.output == 'stack UnitTestApp exists\n')
+    assert(obj['app'].cloud._template is None)
+
+def _regions_settings(tmpdir, settings, regions, profiles=None):
+    settings['regions'] = regions
+    if profiles is not None:
+        settings['profiles'] = profiles
+    settings['targets'] = {'eu-west-1': {'bucket': 'UnitTestBucketEU'}}
+    with open(str(tmpdir) + '/settings.json', 'w') as f:
+        json.dump(settings, f)
+    return settings
+
+def test_targets(tmpdir, settings, pill):
+    _regions_settings(tmpdir, settings, ['us-east-1', 'eu-west-1'], profiles=[None, 'prod'])
+    app = App(debug=False, cwd=tmpdir, session=pill.session)
+    assert(app.targets() == [(None, 'us-east-1'), (None, 'eu-west-1'), ('prod', 'us-east-1'), ('prod', 'eu-west-1')])
+    assert(app.targets(['ap-south-1'])[0] == (None, 'ap-south-1'))
+    assert([App.target_key(profile, region) for profile, region in app.targets()][2:] == ['prod/us-east-1', 'prod/eu-west-1'])
+
+    target = app.for_target(region_name='eu-west-1')
+    assert(target.settings['bucket'] == 'UnitTestBucketEU')
+    assert(app.for_target(region_name='us-east-1').settings.get('bucket') is None)
+    assert(target.cloud.client.meta.region_name == 'eu-west-1')
+    assert(target.cloud.cache_key == 'eu-west-1/UnitTestApp')
+    assert(target.cloud.resource_cache is app.for_target(region_name='us-east-1').cloud.resource_cache)
+
+def test_fan_out_scaffold(tmpdir, settings, pill):
+    response = {'Error': {'Code': 'ValidationError', 'Message': 'Stack with id UnitTestApp does not exist'}, 'ResponseMetadata': {'HTTPStatusCode': 400}}
+    pill.save_response(service='cloudformation', operation='DescribeStacks', response_data=response, http_response=400)
+    _regions_settings(tmpdir, settings, ['us-east-1', 'eu-west-1'], profiles=[None, 'sapling-unit-test-missing-profile'])
+    app = App(debug=False, cwd=tmpdir, session=pill.session)
+
+    results = app.fan_out('scaffold', dry=True)
+    assert(list(results) == ['us-east-1', 'eu-west-1', 'sapling-unit-test-missing-profile/us-east-1', 'sapling-unit-test-missing-profile/eu-west-1'])
+    assert(results['us-east-1']['error'] is None)
+    assert(results['eu-west-1']['error'] is None)
+    assert(results['eu-west-1']['target'].cloud.client.meta.region_name == 'eu-west-1')
+    assert('sapling-unit-test-missing-profile' in results['sapling-unit-test-missing-profile/us-east-1']['error'])
+
+    with open(str(tmpdir) + '/settings.json') as f:
+        saved = json.load(f)
+    assert(saved['bucket'] == 'UnitTestBucket')
+    assert(saved['targets']['eu-west-1'] == {'bucket': 'UnitTestBucketEU'})
+
+def test_cli_update_regions(runner, tmpdir, settings, pill):
+    _regions_settings(tmpdir, settings, ['us-east-1'])
+    tmpdir.ensure('lambda/index.py').write('def handler(event, context):\n    return event\n')
+    obj = {'debug': False, 'app': App(debug=False, cwd=tmpdir, session=pill.session)}
+    response = {'Error': {'Code': 'ValidationError', 'Message': 'Stack with id UnitTestApp does not exist'}, 'ResponseMetadata': {'HTTPStatusCode': 400}}
+    pill.save_response(service='cloudformation', operation='DescribeStacks', response_data=response, http_response=400)
+
+    result = runner.invoke(sam.app.update, ['--regions', 'us-east-1,eu-west-1'], obj=obj)
+    assert(result.exit_code == 0)
+    assert(result.output.splitlines() == [
+        'us-east-1 failed: not updated',
+        'eu-west-1 failed: not updated',
+        '0 of 2 targets updated'
+    ])
+    assert(os.path.isfile(str(tmpdir) + '/lambda.zip'))
+
+def test_cli_template(runner, tmpdir, settings):
+    obj = {'debug': False, 'app': App(debug=False, cwd=tmpdir)}
+    output = str(tmpdir) + '/template.json'
+    result = runner.invoke(sam.app.template, ['--output', output], obj=obj)
+    assert(result.exit_code == 0)
+    assert(result.output.startswith('template: '))
+    with open(output) as f:
+        template = json.load(f)
+    assert(obj['app'].function_name in template['Resources'])
+
+def test_cli_scaffold_async_and_status(runner, tmpdir, settings, pill):
+    stack_id = 'arn:aws:cloudformation:us-east-1:123:stack/UnitTestApp/xyz'
+    response = {'Error': {'Code': 'ValidationError', 'Message': 'Stack with id UnitTestApp does not exist'}, 'ResponseMetadata': {'HTTPStatusCode': 400}}
+    pill.save_response(service='cloudformation', operation='DescribeStacks', response_data=response, http_response=400)
+    response = {'StackId': stack_id, 'ResponseMetadata': {'HTTPStatusCode': 200}}
+    pill.save_response(service='cloudformation', operation='CreateStack', response_data=response, http_response=200)
+    obj = {'app': App(debug=False, cwd=tmpdir, session=pill.session)}
+
+    result = runner.invoke(sam.app.scaffold, ['--async'], obj=obj)
+    assert(result.exit_code == 0)
+    assert(result.output.splitlines()[-1].startswith('CREATE of stack %s started ' % stack_id))
+    with open(str(tmpdir) + '/.sapling/state.json') as f:
+        operation = json.load(f)['stacks']['us-east-1/UnitTestApp']['operation']
+    assert(operation['stack_id'] == stack_id)
+
+    # a later run reattaches to the recorded operation
+    obj = {'app': App(debug=False, cwd=tmpdir, session=pill.session)}
+    response = {'Stacks': [{'CreationTime': datetime.datetime(2018, 1, 1, tzinfo=tzutc()), 'StackId': stack_id, 'StackName': 'UnitTestApp', 'StackStatus': 'CREATE_IN_PROGRESS'}]}
+    pill.save_response(service='cloudformation', operation='DescribeStacks', response_data=response, http_response=200)
+    event = {'EventId': '1', 'StackId': stack_id, 'StackName': 'UnitTestApp', 'LogicalResourceId': 'UnitTestApp', 'ResourceStatus': 'CREATE_IN_PROGRESS', 'Timestamp': datetime.datetime.now(tzutc())}
+    pill.save_response(service='cloudformation', operation='DescribeStackEvents', response_data={'StackEvents': [event]}, http_response=200)
+
+    result = runner.invoke(sam.app.status, [], obj=obj)
+    assert(result.exit_code == 0)
+    lines = result.output.splitlines()
+    assert(lines[0].startswith('CREATE of stack %s' % stack_id))
+    assert(lines[1].endswith('UnitTestApp CREATE_IN_PROGRESS'))
+    assert(lines[2] == 'stack UnitTestApp CREATE_IN_PROGRESS')
+
+def test_resume_creates_replaced_stack(tmpdir, settings, pill):
+    stack_id = 'arn:aws:cloudformation:us-east-1:123:stack/UnitTestApp/xyz'
+    app = App(debug=False, cwd=tmpdir, session=pill.session)
+    app.cloud.record_operation('DELETE', stack_id=stack_id, token='sapling-xyz', then='CREATE')
+    response = {'Stacks': [{'CreationTime': datetime.datetime(2018, 1, 1, tzinfo=tzutc()), 'StackId': stack_id, 'StackName': 'UnitTestApp', 'StackStatus': 'DELETE_COMPLETE'}]}
+    pill.save_response(service='cloudformation', operation='DescribeStacks', response_data=response, http_response=200)
+    pill.save_response(service='cloudformation', operation='DescribeStackEvents', response_data={'StackEvents': []}, http_response=200)
+    response = {'StackId': 'arn:aws:cloudformation:us-east-1:123:stack/UnitTestApp/abc', 'ResponseMetadata': {'HTTPStatusCode': 200}}
+    pill.save_response(service='cloudformation', operation='CreateStack', response_data=response, http_response=200)
+
+    assert(app.resume(wait=False) == 'CREATE_IN_PROGRESS')
+    operation = app.cloud.operation()
+    assert(operation['action'] == 'CREATE')
+    assert(operation['stack_id'].endswith('/abc'))
+
+def test_cli_scaffold_async_conflicts_with_wait(runner, obj):
+    result = runner.invoke(sam.app.scaffold, ['--async', '--wait'], obj=obj)
+    assert(result.exit_code != 0)
+
+def test_synthesize_http_api(tmpdir, settings):
+    settings['api_gateway'] = {'type': 'http'}
+    with open(str(tmpdir) + '/settings.json', 'w') as f:
+        json.dump(settings, f)
+    app = App(debug=False, cwd=tmpdir)
+
+    resources = app.synthesize().to_dict()['Resources']
+    assert(resources[app.rest_name]['Type'] == 'AWS::ApiGatewayV2::Api')
+    assert(resources['%sDefaultRoute' % app.rest_name]['Properties']['RouteKey'] == '$default')
@@ -1,6 +1,8 @@
+import datetime
 import pytest
 
 from sam.awslambda import Lambda
+from sam.package import code_sha256
 
 @pytest.fixture
 def awslambda(settings, pill):
@@ -12,6 +14,13 @@ def settings(settings):
     settings['function_name'] = '%sFunction' % settings['name']
     return settings
 
+def _function_updated(pill, settings):
+    '''
+    helper method to answer the function_updated waiter
+    '''
+    response = { "ResponseMetadata": { "HTTPStatusCode": 200 }, "FunctionName": settings['function_name'], "CodeSha256": "xyz", "LastUpdateStatus": "Successful" }
+    pill.save_response(service='lambda', operation='GetFunctionConfiguration', response_data=response, http_response=200)
+
 def test_lambda_initialize(awslambda):
     assert(awslambda is not None)
 
@@ -30,6 +39,9 @@ def test_lambda_update_function(awslambda, pill, tmpdir, settings):
     code_filepath = str(tmpdir) + '/lambda.zip'
     open(code_filepath, 'a').close()
 
+    response = { "ResponseMetadata": { "RequestId": "xyz", "HTTPStatusCode": 200, "HTTPHeaders": { "date": "123", "content-type": "application/json", "content-length": "649", "connection": "keep-alive", "x-amzn-requestid": "xyz" }, "RetryAttempts": 0 }, "FunctionName": settings['function_name'], "CodeSize": 261, "CodeSha256": "xyz", "Version": "$LATEST", "LastUpdateStatus": "Successful" }
+    pill.save_response(service='lambda', operation='GetFunctionConfiguration', response_data=response, http_response=200)
+
     response = { "ResponseMetadata": { "RequestId": "xyz", "HTTPStatusCode": 200, "HTTPHeaders": { "date": "123", "content-type": "application/json", "content-length": "649", "connection": "keep-alive", "x-amzn-requestid": "xyz" }, "RetryAttempts": 0 }, "FunctionName": settings['function_name'], "FunctionArn": "arn:aws:lambda:us-east-1:123:function:%s" % settings['function_name'], "Runtime": "python3.6", "Role": "arn:aws:iam::123:role/xyz", "Handler": "default", "CodeSize": 261, "Description": "", "Timeout": 3, "MemorySize": 128, "LastModified": "123", "CodeSha256": "xyz", "Version": "$LATEST", "TracingConfig": { "Mode": "PassThrough" }, "RevisionId": "6a636cf5-8bdc-4e49-8ca8-bf7e166347d9" }
     pill.save_response(service='lambda', operation='UpdateFunctionCode', response_data=response, http_response=200)
 
@@ -43,6 +55,7 @@ def test_lambda_update_function_filenotfound(awslambda, pill):
         awslambda.update(code=code_filepath)
 
 def test_lambda_update_function_handler(awslambda, pill, settings):
+    _function_updated(pill, settings)
     handler = 'main.exports'
 
     response = { "status_code": 200, "data": { "ResponseMetadata": { "RequestId": "xyz", "HTTPStatusCode": 200, "HTTPHeaders": { "date": "123", "content-type": "application/json", "content-length": "123", "connection": "keep-alive", "x-amzn-requestid": "xyz" }, "RetryAttempts": 0 }, "FunctionName": settings['function_name'], "FunctionArn": "arn:aws:lambda:us-east-1:123:function:%s" % settings['function_name'], "Runtime": "python3.6", "Role": "arn:aws:iam::123:role/role", "Handler": "main.handler", "CodeSize": 123, "Description": "", "Timeout": 3, "MemorySize": 128, "LastModified": "123", "CodeSha256": "xyz", "Version": "$LATEST", "TracingConfig": { "Mode": "PassThrough" }, "RevisionId": "xyz" } }
@@ -54,3 +67,82 @@ def test_lambda_update_function_handler(awslambda, pill, settings):
 def test_lambda_update_function_nothing(awslambda, pill, settings):
     with pytest.raises(Exception):
         awslambda.update()
+
+def test_lambda_update_function_unchanged(awslambda, pill, tmpdir, settings):
+    code_filepath = str(tmpdir) + '/lambda.zip'
+    open(code_filepath, 'a').close()
+
+    response = { "ResponseMetadata": { "RequestId": "xyz", "HTTPStatusCode": 200, "HTTPHeaders": { "date": "123", "content-type": "application/json", "content-length": "649", "connection": "keep-alive", "x-amzn-requestid": "xyz" }, "RetryAttempts": 0 }, "FunctionName": settings['function_name'], "CodeSize": 0, "CodeSha256": code_sha256(code_filepath), "Version": "$LATEST", "LastUpdateStatus": "Successful" }
+    pill.save_response(service='lambda', operation='GetFunctionConfiguration', response_data=response, http_response=200)
+
+    response = awslambda.update(code=code_filepath)
+    assert(response['Skipped'])
+
+def test_lambda_update_function_through_s3(awslambda, pill, tmpdir, settings):
+    code_filepath = str(tmpdir) + '/lambda.zip'
+    with open(code_filepath, 'w') as f:
+        f.write('code')
+    awslambda.upload_threshold = 0
+
+    response = { "ResponseMetadata": { "RequestId": "xyz", "HTTPStatusCode": 200, "HTTPHeaders": { "date": "123", "content-type": "application/json", "content-length": "649", "connection": "keep-alive", "x-amzn-requestid": "xyz" }, "RetryAttempts": 0 }, "FunctionName": settings['function_name'], "CodeSize": 261, "CodeSha256": "xyz", "Version": "$LATEST", "LastUpdateStatus": "Successful" }
+    pill.save_response(service='lambda', operation='GetFunctionConfiguration', response_data=response, http_response=200)
+
+    response = { 'Buckets': [{ 'CreationDate': datetime.datetime(2018, 1, 10, 1, 10, 16), 'Name': settings['bucket'] }] }
+    pill.save_response(service='s3', operation='ListBuckets', response_data=response, http_response=200)
+
+    response = { "ResponseMetadata": { "HTTPStatusCode": 200 }, "ETag": "\"xyz\"" }
+    pill.save_response(service='s3', operation='PutObject', response_data=response, http_response=200)
+
+    response = { "ResponseMetadata": { "RequestId": "xyz", "HTTPStatusCode": 200, "HTTPHeaders": { "date": "123", "content-type": "application/json", "content-length": "649", "connection": "keep-alive", "x-amzn-requestid": "xyz" }, "RetryAttempts": 0 }, "FunctionName": settings['function_name'], "CodeSize": 4, "CodeSha256": code_sha256(code_filepath), "Version": "$LATEST" }
+    pill.save_response(service='lambda', operation='UpdateFunctionCode', response_data=response, http_response=200)
+
+    response = awslambda.update(code=code_filepath)
+    assert(response['ResponseMetadata']['HTTPStatusCode'] == 200)
+    assert(response['CodeSha256'] == code_sha256(code_filepath))
+
+def test_lambda_update_function_layers(awslambda, pill, settings):
+    _function_updated(pill, settings)
+    layer_arn = 'arn:aws:lambda:us-east-1:123:layer:UnitTestLayer:1'
+
+    response = { "ResponseMetadata": { "HTTPStatusCode": 200 }, "FunctionName": settings['function_name'], "Layers": [{"Arn": layer_arn, "CodeSize": 123}] }
+    pill.save_response(service='lambda', operation='UpdateFunctionConfiguration', response_data=response, http_response=200)
+
+    response = awslambda.update(layers=[layer_arn])
+    assert(response['Layers'][0]['Arn'] == layer_arn)
+
+def test_lambda_publish_alias(awslambda, pill, settings):
+    _function_updated(pill, settings)
+    response = { "ResponseMetadata": { "HTTPStatusCode": 201 }, "FunctionName": settings['function_name'], "Version": "2" }
+    pill.save_response(service='lambda', operation='PublishVersion', response_data=response, http_response=201)
+
+    response = { "ResponseMetadata": { "HTTPStatusCode": 200 }, "Name": "live", "FunctionVersion": "2" }
+    pill.save_response(service='lambda', operation='UpdateAlias', response_data=response, http_response=200)
+
+    response = awslambda.publish_alias(settings['function_name'], 'live')
+    assert(response['FunctionVersion'] == '2')
+
+def test_lambda_update_waits_between_calls(awslambda, pill, tmpdir, settings):
+    code_filepath = str(tmpdir) + '/lambda.zip'
+    with open(code_filepath, 'w') as f:
+        f.write('code')
+    layer_arn = 'arn:aws:lambda:us-east-1:123:layer:UnitTestLayer:1'
+    _function_updated(pill, settings)
+    response = { "ResponseMetadata": { "HTTPStatusCode": 200 }, "FunctionName": settings['function_name'], "CodeSha256": code_sha256(code_filepath) }
+    pill.save_response(service='lambda', operation='UpdateFunctionCode', response_data=response, http_response=200)
+    response = { "ResponseMetadata": { "HTTPStatusCode": 200 }, "FunctionName": settings['function_name'], "Layers": [{"Arn": layer_arn}] }
+    pill.save_response(service='lambda', operation='UpdateFunctionConfiguration', response_data=response, http_response=200)
+    pill.save_response(service='lambda', operation='PublishVersion', response_data={ "ResponseMetadata": { "HTTPStatusCode": 201 }, "Version": "2" }, http_response=201)
+    pill.save_response(service='lambda', operation='UpdateAlias', response_data={ "ResponseMetadata": { "HTTPStatusCode": 200 }, "Name": "live" }, http_response=200)
+
+    calls = []
+    awslambda.client.meta.events.register('provide-client-params.lambda', lambda model, **kwargs: calls.append(model.name))
+    awslambda.update(code=code_filepath)
+    awslambda.update(layers=[layer_arn])
+    awslambda.publish_alias(settings['function_name'], 'live')
+
+    # every update is applied before the next call touches the function
+    assert(calls == [
+        'GetFunctionConfiguration', 'UpdateFunctionCode', 'GetFunctionConfiguration',
+        'UpdateFunctionConfiguration', 'GetFunctionConfiguration',
+        'GetFunctionConfiguration', 'PublishVersion', 'UpdateAlias'
+    ])
@@ -0,0 +1,79 @@
+import os
+import pytest
+import zipfile
+
+import sam.bench
+
+HANDLER = '''import json
+
+def handler(event, context):
+    return {'statusCode': 200, 'body': json.dumps(event['path'])}
+'''
+
+@pytest.fixture
+def source_dir(tmpdir):
+    source_dir = tmpdir.mkdir('lambda_bench')
+    source_dir.join('bench_main.py').write(HANDLER)
+    return str(source_dir)
+
+def test_percentile():
+    values = list(range(1, 101))
+    assert(sam.bench.percentile(values, 50) == 50)
+    assert(sam.bench.percentile(values, 99) == 99)
+    assert(sam.bench.percentile([3], 95) == 3)
+    assert(sam.bench.percentile([], 50) is None)
+
+def test_parse_importtime():
+    output = '\n'.join([
+        'import time: self [us] | cumulative | imported package',
+        'import time:       120 |        120 |   _json',
+        'import time:       300 |        420 | json',
+        'hello'
+    ])
+    modules = sam.bench.parse_importtime(output)
+    assert([module['module'] for module in modules] == ['json', '_json'])
+    assert(modules[0]['cumulative_us'] == 420)
+
+def test_cold_import(source_dir):
+    results = sam.bench.cold_import(source_dir, 'bench_main', runs=1)
+    assert(len(results['seconds']) == 1)
+    assert(results['median'] > 0)
+    assert(any(module['module'] == 'bench_main' for module in results['modules']))
+
+def test_warm_invocations(source_dir):
+    results = sam.bench.warm_invocations(source_dir, 'bench_main.handler', invocations=50)
+    assert(results['invocations'] == 50)
+    assert(results['p50'] <= results['p95'] <= results['p99'])
+    assert(results['throughput'] > 0)
+
+def test_warm_invocations_requires_an_invocation(source_dir):
+    with pytest.raises(Exception) as e:
+        sam.bench.warm_invocations(source_dir, 'bench_main.handler', invocations=0)
+    assert('At least one invocation' in str(e.value))
+
+def test_cold_import_failure_without_stderr(tmpdir):
+    source_dir = tmpdir.mkdir('lambda_exit')
+    source_dir.join('exit_main.py').write('import os\nos._exit(3)\n')
+    with pytest.raises(Exception) as e:
+        sam.bench.cold_import(str(source_dir), 'exit_main', runs=1)
+    assert('exit status 3' in str(e.value))
+
+def test_archive_stats(tmpdir):
+    archive = str(tmpdir) + '/lambda.zip'
+    with zipfile.ZipFile(archive, 'w', zipfile.ZIP_DEFLATED) as z:
+        z.writestr('main.py', 'x' * 100)
+    stats = sam.bench.archive_stats(archive)
+    assert(stats['files'] == 1)
+    assert(stats['uncompressed_size'] == 100)
+    assert(stats['size'] == os.path.getsize(archive))
+
+def test_compare(tmpdir):
+    baseline = {'cold_import': {'median': 0.1}, 'warm': {'p50': 0.001, 'p95': 0.002, 'p99': 0.003}, 'archive': {'size': 1000}}
+    results = {'cold_import': {'median': 0.105}, 'warm': {'p50': 0.001, 'p95': 0.002, 'p99': 0.01}, 'archive': {'size': 2000}}
+
+    regressions = sam.bench.compare(baseline, results, threshold=0.1)
+    assert([metric for metric, old, new in regressions] == ['warm.p99', 'archive.size'])
+
+    path = str(tmpdir) + '/bench.json'
+    sam.bench.save(results, path)
+    assert(sam.bench.load(path) == results)
@@ -48,3 +48,32 @@ def test_bucket_upload_file(settings, pill, tmpdir):
 
     bucket = Bucket(settings, pill.session)
     status = bucket.upload_file(filepath, filename)
+
+def test_bucket_transfer_config(settings, pill):
+    settings['upload_part_size'] = 16 * 1024 * 1024
+    settings['upload_concurrency'] = 4
+
+    bucket = Bucket(settings, pill.session)
+    config = bucket.transfer_config()
+    assert(config.multipart_chunksize == settings['upload_part_size'])
+    assert(config.multipart_threshold == settings['upload_part_size'])
+    assert(config.max_concurrency == settings['upload_concurrency'])
+
+def test_bucket_upload_file_multipart(settings, pill, tmpdir):
+    settings['upload_part_size'] = 5 * 1024 * 1024
+    settings['upload_concurrency'] = 2
+
+    response = {'Bucket': settings['bucket'], 'Key': 'lambda.zip', 'UploadId': 'xyz', 'ResponseMetadata': {'HTTPStatusCode': 200}}
+    pill.save_response(service='s3', operation='CreateMultipartUpload', response_data=response, http_response=200)
+
+    response = {'ETag': '"xyz"', 'ResponseMetadata': {'HTTPStatusCode': 200}}
+    pill.save_response(service='s3', operation='UploadPart', response_data=response, http_response=200)
+
+    response = {'Bucket': settings['bucket'], 'Key': 'lambda.zip', 'ETag': '"xyz-2"', 'ResponseMetadata': {'HTTPStatusCode': 200}}
+    pill.save_response(service='s3', operation='CompleteMultipartUpload', response_data=response, http_response=200)
+
+    p = tmpdir.join('lambda.zip')
+    p.write_binary(os.urandom(6 * 1024 * 1024))
+
+    bucket = Bucket(settings, pill.session)
+    bucket.upload_file(str(p), 'lambda.zip')
@@ -0,0 +1,32 @@
+import concurrent.futures
+
+from sam.app import App
+from sam.clients import ClientRegistry
+
+def test_client_is_shared(settings, pill):
+    clients = ClientRegistry(settings, pill.session)
+    assert(clients.client('lambda') is clients.client('lambda'))
+    assert(clients.client('lambda') is not clients.client('lambda', region_name='eu-west-1'))
+    assert(clients.client('lambda', region_name='eu-west-1').meta.region_name == 'eu-west-1')
+    assert(len(clients) == 2)
+
+def test_client_config(settings, pill):
+    settings['client_config'] = {'max_pool_connections': 64, 'retry_mode': 'standard', 'read_timeout': 5}
+    client = ClientRegistry(settings, pill.session).client('s3')
+    assert(client.meta.config.max_pool_connections == 64)
+    assert(client.meta.config.retries['mode'] == 'standard')
+    assert(client.meta.config.read_timeout == 5)
+    assert(client.meta.config.connect_timeout == ClientRegistry.CONNECT_TIMEOUT)
+    assert(client.meta.config.tcp_keepalive)
+
+def test_client_created_once_across_threads(settings, pill):
+    clients = ClientRegistry(settings, pill.session)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(lambda _: clients.client('cloudformation'), range(32)))
+    assert(all(client is results[0] for client in results))
+
+def test_app_shares_clients(tmpdir, settings, pill):
+    app = App(debug=False, cwd=tmpdir, session=pill.session)
+    assert(app.awslambda is app.awslambda)
+    assert(app.awslambda.client is app.clients.client('lambda'))
+    assert(app.cloud.client is app.clients.client('cloudformation'))
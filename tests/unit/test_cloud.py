@@ -1,10 +1,13 @@
 import datetime
+import json
 import pytest
 import uuid
 
 import troposphere.awslambda
 import troposphere.iam
 
+import sam.template
+
 from dateutil.tz import tzutc
 from sam.cloud import Cloud
 
@@ -13,6 +16,14 @@ def cloud(settings, pill):
     cloud = Cloud(settings, session=pill.session)
     return cloud
 
+def _deployment(resources):
+    '''
+    helper method to find the API Gateway deployment, whose logical ID carries a digest of the API
+    '''
+    deployments = [resource for resource in resources.values() if resource['Type'] == 'AWS::ApiGateway::Deployment']
+    assert(len(deployments) == 1)
+    return deployments[0]
+
 def _validate_resources(cloud):
     '''
     helper method to validate cloud template's resources
@@ -34,8 +45,8 @@ def test_s3_template(cloud):
     assert(cloud.template.outputs[s3name].properties['Description'] == s3description)
 
 def test_deploy(cloud, pill):
-    response = {'ResponseMetadata': {'HTTPHeaders': {'content-length': '123', 'content-type': 'text/xml', 'date': 'xyz', 'x-amzn-requestid': 'xyz'}, 'HTTPStatusCode': 200, 'RequestId': 'xyz', 'RetryAttempts': 0}, 'StackSummaries': []}
-    pill.save_response(service='cloudformation', operation='ListStacks', response_data=response, http_response=200)
+    response = {'Error': {'Code': 'ValidationError', 'Message': 'Stack with id UnitTestApp does not exist'}, 'ResponseMetadata': {'HTTPStatusCode': 400}}
+    pill.save_response(service='cloudformation', operation='DescribeStacks', response_data=response, http_response=400)
 
     response = { "status_code": 200, "data": { "StackId": "arn:aws:cloudformation:us-east-1:123:stack/TestStackName/xyz", "ResponseMetadata": { "RequestId": "xyz", "HTTPStatusCode": 200, "HTTPHeaders": { "x-amzn-requestid": "xyz", "content-type": "text/xml", "content-length": "123"}, "RetryAttempts": 0 } } }
     pill.save_response(service='cloudformation', operation='CreateStack', response_data=response, http_response=200)
@@ -46,8 +57,8 @@ def test_deploy(cloud, pill):
     assert(status['status_code'] == 200)
 
 def test_deploy_dry(cloud, pill):
-    response = {'ResponseMetadata': {'HTTPHeaders': {'content-length': '123', 'content-type': 'text/xml', 'date': 'xyz', 'x-amzn-requestid': 'xyz'}, 'HTTPStatusCode': 200, 'RequestId': 'xyz', 'RetryAttempts': 0}, 'StackSummaries': []}
-    pill.save_response(service='cloudformation', operation='ListStacks', response_data=response, http_response=200)
+    response = {'Error': {'Code': 'ValidationError', 'Message': 'Stack with id UnitTestApp does not exist'}, 'ResponseMetadata': {'HTTPStatusCode': 400}}
+    pill.save_response(service='cloudformation', operation='DescribeStacks', response_data=response, http_response=400)
 
     cloud.add_s3_bucket('UnitTestS3Bucket')
 
@@ -55,31 +66,149 @@ def test_deploy_dry(cloud, pill):
     assert(status is None)
 
 def test_deploy_replace(cloud, pill):
-    response = {'ResponseMetadata': {'HTTPHeaders': {'content-length': '123', 'content-type': 'text/xml', 'date': 'xyz', 'x-amzn-requestid': 'xyz'}, 'HTTPStatusCode': 200, 'RequestId': 'xyz', 'RetryAttempts': 0}, 'StackSummaries': [{'CreationTime': datetime.datetime(2018, 1, 1, tzinfo=tzutc()), 'StackId': 'arn:aws:cloudformation:us-east-1:123:stack/TestStackName/xyz', 'StackName': cloud.name, 'StackStatus': 'CREATE_COMPLETE'}]}
-    pill.save_response(service='cloudformation', operation='ListStacks', response_data=response, http_response=200)
+    response = {'ResponseMetadata': {'HTTPHeaders': {'content-length': '123', 'content-type': 'text/xml', 'date': 'xyz', 'x-amzn-requestid': 'xyz'}, 'HTTPStatusCode': 200, 'RequestId': 'xyz', 'RetryAttempts': 0}, 'Stacks': [{'CreationTime': datetime.datetime(2018, 1, 1, tzinfo=tzutc()), 'StackId': 'arn:aws:cloudformation:us-east-1:123:stack/TestStackName/xyz', 'StackName': cloud.name, 'StackStatus': 'CREATE_COMPLETE'}]}
+    pill.save_response(service='cloudformation', operation='DescribeStacks', response_data=response, http_response=200)
+
+    response = {'Stacks': [{'StackId': 'arn:aws:cloudformation:us-east-1:123:stack/TestStackName/xyz', 'StackName': cloud.name, 'CreationTime': datetime.datetime(2018, 1, 1, tzinfo=tzutc()), 'StackStatus': 'CREATE_COMPLETE'}], 'ResponseMetadata': {'HTTPStatusCode': 200}}
+    pill.save_response(service='cloudformation', operation='DescribeStacks', response_data=response, http_response=200)
 
     response = {'ResponseMetadata': {'HTTPStatusCode': 200}}
     pill.save_response(service='cloudformation', operation='DeleteStack', response_data=response, http_response=200)
 
-    response = {'ResponseMetadata': {'HTTPHeaders': {'content-length': '123', 'content-type': 'text/xml', 'date': 'xyz', 'x-amzn-requestid': 'xyz'}, 'HTTPStatusCode': 200, 'RequestId': 'xyz', 'RetryAttempts': 0}, 'StackSummaries': []}
-    pill.save_response(service='cloudformation', operation='ListStacks', response_data=response, http_response=200)
+    response = {'Stacks': [{'StackId': 'arn:aws:cloudformation:us-east-1:123:stack/TestStackName/xyz', 'StackName': cloud.name, 'CreationTime': datetime.datetime(2018, 1, 1, tzinfo=tzutc()), 'StackStatus': 'DELETE_COMPLETE'}], 'ResponseMetadata': {'HTTPStatusCode': 200}}
+    pill.save_response(service='cloudformation', operation='DescribeStacks', response_data=response, http_response=200)
+
+    response = {'StackEvents': [], 'ResponseMetadata': {'HTTPStatusCode': 200}}
+    pill.save_response(service='cloudformation', operation='DescribeStackEvents', response_data=response, http_response=200)
 
     response = { "status_code": 200, "data": { "StackId": "arn:aws:cloudformation:us-east-1:123:stack/TestStackName/xyz", "ResponseMetadata": { "RequestId": "xyz", "HTTPStatusCode": 200, "HTTPHeaders": { "x-amzn-requestid": "xyz", "content-type": "text/xml", "content-length": "123"}, "RetryAttempts": 0 } } }
     pill.save_response(service='cloudformation', operation='CreateStack', response_data=response, http_response=200)
 
-    status = cloud.deploy()
+    status = cloud.deploy(replace=True)
     assert(status['status_code'] == 200)
 
+def test_deploy_update_change_set(cloud, pill):
+    response = {'ResponseMetadata': {'HTTPHeaders': {'content-length': '123', 'content-type': 'text/xml', 'date': 'xyz', 'x-amzn-requestid': 'xyz'}, 'HTTPStatusCode': 200, 'RequestId': 'xyz', 'RetryAttempts': 0}, 'Stacks': [{'CreationTime': datetime.datetime(2018, 1, 1, tzinfo=tzutc()), 'StackId': 'arn:aws:cloudformation:us-east-1:123:stack/TestStackName/xyz', 'StackName': cloud.name, 'StackStatus': 'CREATE_COMPLETE'}]}
+    pill.save_response(service='cloudformation', operation='DescribeStacks', response_data=response, http_response=200)
+
+    response = {'Id': 'arn:aws:cloudformation:us-east-1:123:changeSet/sapling/xyz', 'StackId': 'arn:aws:cloudformation:us-east-1:123:stack/TestStackName/xyz', 'ResponseMetadata': {'HTTPStatusCode': 200}}
+    pill.save_response(service='cloudformation', operation='CreateChangeSet', response_data=response, http_response=200)
+
+    response = {'ChangeSetName': 'sapling', 'StackName': cloud.name, 'Status': 'CREATE_COMPLETE', 'ExecutionStatus': 'AVAILABLE', 'Changes': [{'Type': 'Resource', 'ResourceChange': {'Action': 'Add', 'LogicalResourceId': 'UnitTestS3Bucket', 'ResourceType': 'AWS::S3::Bucket', 'Replacement': 'False'}}], 'ResponseMetadata': {'HTTPStatusCode': 200}}
+    pill.save_response(service='cloudformation', operation='DescribeChangeSet', response_data=response, http_response=200)
+
+    response = {'ResponseMetadata': {'HTTPStatusCode': 200}}
+    pill.save_response(service='cloudformation', operation='ExecuteChangeSet', response_data=response, http_response=200)
+
+    cloud.add_s3_bucket('UnitTestS3Bucket')
+
+    status = cloud.deploy()
+    assert(status['ResponseMetadata']['HTTPStatusCode'] == 200)
+    assert(cloud.format_changes(cloud.changes) == ['Add UnitTestS3Bucket (AWS::S3::Bucket)'])
+
+def test_deploy_update_no_changes(cloud, pill):
+    response = {'ResponseMetadata': {'HTTPHeaders': {'content-length': '123', 'content-type': 'text/xml', 'date': 'xyz', 'x-amzn-requestid': 'xyz'}, 'HTTPStatusCode': 200, 'RequestId': 'xyz', 'RetryAttempts': 0}, 'Stacks': [{'CreationTime': datetime.datetime(2018, 1, 1, tzinfo=tzutc()), 'StackId': 'arn:aws:cloudformation:us-east-1:123:stack/TestStackName/xyz', 'StackName': cloud.name, 'StackStatus': 'CREATE_COMPLETE'}]}
+    pill.save_response(service='cloudformation', operation='DescribeStacks', response_data=response, http_response=200)
+
+    response = {'Id': 'arn:aws:cloudformation:us-east-1:123:changeSet/sapling/xyz', 'StackId': 'arn:aws:cloudformation:us-east-1:123:stack/TestStackName/xyz', 'ResponseMetadata': {'HTTPStatusCode': 200}}
+    pill.save_response(service='cloudformation', operation='CreateChangeSet', response_data=response, http_response=200)
+
+    response = {'ChangeSetName': 'sapling', 'StackName': cloud.name, 'Status': 'FAILED', 'StatusReason': "The submitted information didn't contain changes. Submit different information to create a change set.", 'ExecutionStatus': 'UNAVAILABLE', 'Changes': [], 'ResponseMetadata': {'HTTPStatusCode': 200}}
+    pill.save_response(service='cloudformation', operation='DescribeChangeSet', response_data=response, http_response=200)
+
+    response = {'ResponseMetadata': {'HTTPStatusCode': 200}}
+    pill.save_response(service='cloudformation', operation='DeleteChangeSet', response_data=response, http_response=200)
+
+    cloud.add_s3_bucket('UnitTestS3Bucket')
+
+    status = cloud.deploy()
+    assert(status is None)
+    assert(cloud.changes == [])
+
+def test_deploy_update_change_set_failed(cloud, pill):
+    response = {'ResponseMetadata': {'HTTPHeaders': {'content-length': '123', 'content-type': 'text/xml', 'date': 'xyz', 'x-amzn-requestid': 'xyz'}, 'HTTPStatusCode': 200, 'RequestId': 'xyz', 'RetryAttempts': 0}, 'Stacks': [{'CreationTime': datetime.datetime(2018, 1, 1, tzinfo=tzutc()), 'StackId': 'arn:aws:cloudformation:us-east-1:123:stack/TestStackName/xyz', 'StackName': cloud.name, 'StackStatus': 'CREATE_COMPLETE'}]}
+    pill.save_response(service='cloudformation', operation='DescribeStacks', response_data=response, http_response=200)
+
+    response = {'Id': 'arn:aws:cloudformation:us-east-1:123:changeSet/sapling/xyz', 'StackId': 'arn:aws:cloudformation:us-east-1:123:stack/TestStackName/xyz', 'ResponseMetadata': {'HTTPStatusCode': 200}}
+    pill.save_response(service='cloudformation', operation='CreateChangeSet', response_data=response, http_response=200)
+
+    response = {'ChangeSetName': 'sapling', 'StackName': cloud.name, 'Status': 'FAILED', 'StatusReason': 'Template format error', 'ExecutionStatus': 'UNAVAILABLE', 'Changes': [], 'ResponseMetadata': {'HTTPStatusCode': 200}}
+    pill.save_response(service='cloudformation', operation='DescribeChangeSet', response_data=response, http_response=200)
+
+    response = {'ResponseMetadata': {'HTTPStatusCode': 200}}
+    pill.save_response(service='cloudformation', operation='DeleteChangeSet', response_data=response, http_response=200)
+
+    cloud.add_s3_bucket('UnitTestS3Bucket')
+
+    with pytest.raises(Exception):
+        cloud.deploy()
+
+def _existing_stack(cloud, pill):
+    response = {'Stacks': [{'CreationTime': datetime.datetime(2018, 1, 1, tzinfo=tzutc()), 'StackId': 'arn:aws:cloudformation:us-east-1:123:stack/TestStackName/xyz', 'StackName': cloud.name, 'StackStatus': 'UPDATE_COMPLETE'}], 'ResponseMetadata': {'HTTPStatusCode': 200}}
+    pill.save_response(service='cloudformation', operation='DescribeStacks', response_data=response, http_response=200)
+
+def test_deploy_unchanged_template_is_skipped(cloud, pill):
+    _existing_stack(cloud, pill)
+    cloud.add_s3_bucket('UnitTestS3Bucket')
+    template_body = cloud.template.to_json()
+    cloud.state.update(cloud.cache_key, template_hash=sam.template.template_hash(template_body), resources=sam.template.resource_digests(template_body))
+
+    # reformatted, the same template deployed
+    response = {'TemplateBody': json.dumps(json.loads(template_body), indent=None), 'ResponseMetadata': {'HTTPStatusCode': 200}}
+    pill.save_response(service='cloudformation', operation='GetTemplate', response_data=response, http_response=200)
+
+    status = cloud.deploy()
+    assert(status is None)
+    assert(cloud.diff == [])
+
+def test_deploy_changed_template_diff(cloud, pill):
+    _existing_stack(cloud, pill)
+    cloud.add_s3_bucket('UnitTestS3Bucket')
+    template_body = cloud.template.to_json()
+    cloud.state.update(cloud.cache_key, template_hash=sam.template.template_hash(template_body), resources=sam.template.resource_digests(template_body))
+
+    response = {'Id': 'arn:aws:cloudformation:us-east-1:123:changeSet/sapling/xyz', 'StackId': 'arn:aws:cloudformation:us-east-1:123:stack/TestStackName/xyz', 'ResponseMetadata': {'HTTPStatusCode': 200}}
+    pill.save_response(service='cloudformation', operation='CreateChangeSet', response_data=response, http_response=200)
+    response = {'ChangeSetName': 'sapling', 'StackName': cloud.name, 'Status': 'CREATE_COMPLETE', 'ExecutionStatus': 'AVAILABLE', 'Changes': [{'Type': 'Resource', 'ResourceChange': {'Action': 'Add', 'LogicalResourceId': 'OtherBucket', 'ResourceType': 'AWS::S3::Bucket', 'Replacement': 'False'}}], 'ResponseMetadata': {'HTTPStatusCode': 200}}
+    pill.save_response(service='cloudformation', operation='DescribeChangeSet', response_data=response, http_response=200)
+    response = {'ResponseMetadata': {'HTTPStatusCode': 200}}
+    pill.save_response(service='cloudformation', operation='ExecuteChangeSet', response_data=response, http_response=200)
+
+    cloud.add_s3_bucket('OtherBucket')
+    status = cloud.deploy()
+    assert(status['ResponseMetadata']['HTTPStatusCode'] == 200)
+    assert(sam.template.format_diff(cloud.diff) == ['+ OtherBucket (AWS::S3::Bucket)'])
+    assert(cloud.state.get(cloud.cache_key)['template_hash'] == sam.template.template_hash(cloud.template.to_json()))
+
+def test_deploy_drifted_template_is_updated(cloud, pill):
+    _existing_stack(cloud, pill)
+    cloud.add_s3_bucket('UnitTestS3Bucket')
+    template_body = cloud.template.to_json()
+    cloud.state.update(cloud.cache_key, template_hash=sam.template.template_hash(template_body), resources={})
+
+    response = {'TemplateBody': {'Resources': {}}, 'ResponseMetadata': {'HTTPStatusCode': 200}}
+    pill.save_response(service='cloudformation', operation='GetTemplate', response_data=response, http_response=200)
+    response = {'Id': 'arn:aws:cloudformation:us-east-1:123:changeSet/sapling/xyz', 'StackId': 'arn:aws:cloudformation:us-east-1:123:stack/TestStackName/xyz', 'ResponseMetadata': {'HTTPStatusCode': 200}}
+    pill.save_response(service='cloudformation', operation='CreateChangeSet', response_data=response, http_response=200)
+    response = {'ChangeSetName': 'sapling', 'StackName': cloud.name, 'Status': 'CREATE_COMPLETE', 'ExecutionStatus': 'AVAILABLE', 'Changes': [{'Type': 'Resource', 'ResourceChange': {'Action': 'Add', 'LogicalResourceId': 'UnitTestS3Bucket', 'ResourceType': 'AWS::S3::Bucket', 'Replacement': 'False'}}], 'ResponseMetadata': {'HTTPStatusCode': 200}}
+    pill.save_response(service='cloudformation', operation='DescribeChangeSet', response_data=response, http_response=200)
+    response = {'ResponseMetadata': {'HTTPStatusCode': 200}}
+    pill.save_response(service='cloudformation', operation='ExecuteChangeSet', response_data=response, http_response=200)
+
+    status = cloud.deploy()
+    assert(status is not None)
+    assert(cloud.format_changes(cloud.changes) == ['Add UnitTestS3Bucket (AWS::S3::Bucket)'])
+
 def test_stack_exists(cloud, pill):
-    response = {'ResponseMetadata': {'HTTPHeaders': {'content-length': '123', 'content-type': 'text/xml', 'date': 'xyz', 'x-amzn-requestid': 'xyz'}, 'HTTPStatusCode': 200, 'RequestId': 'xyz', 'RetryAttempts': 0}, 'StackSummaries': [{'CreationTime': datetime.datetime(2018, 1, 1, tzinfo=tzutc()), 'StackId': 'arn:aws:cloudformation:us-east-1:123:stack/TestStackName/xyz', 'StackName': cloud.name, 'StackStatus': 'CREATE_COMPLETE'}]}
-    pill.save_response(service='cloudformation', operation='ListStacks', response_data=response, http_response=200)
+    response = {'ResponseMetadata': {'HTTPHeaders': {'content-length': '123', 'content-type': 'text/xml', 'date': 'xyz', 'x-amzn-requestid': 'xyz'}, 'HTTPStatusCode': 200, 'RequestId': 'xyz', 'RetryAttempts': 0}, 'Stacks': [{'CreationTime': datetime.datetime(2018, 1, 1, tzinfo=tzutc()), 'StackId': 'arn:aws:cloudformation:us-east-1:123:stack/TestStackName/xyz', 'StackName': cloud.name, 'StackStatus': 'CREATE_COMPLETE'}]}
+    pill.save_response(service='cloudformation', operation='DescribeStacks', response_data=response, http_response=200)
 
     status = cloud.stack_exists(cloud.name)
     assert(status)
 
 def test_stack_ready(cloud, pill):
-    response = {'ResponseMetadata': {'HTTPHeaders': {'content-length': '123', 'content-type': 'text/xml', 'date': 'xyz', 'x-amzn-requestid': 'xyz'}, 'HTTPStatusCode': 200, 'RequestId': 'xyz', 'RetryAttempts': 0}, 'StackSummaries': [{'CreationTime': datetime.datetime(2018, 1, 1, tzinfo=tzutc()), 'StackId': 'arn:aws:cloudformation:us-east-1:123:stack/TestStackName/xyz', 'StackName': cloud.name, 'StackStatus': 'CREATE_COMPLETE'}]}
-    pill.save_response(service='cloudformation', operation='ListStacks', response_data=response, http_response=200)
+    response = {'ResponseMetadata': {'HTTPHeaders': {'content-length': '123', 'content-type': 'text/xml', 'date': 'xyz', 'x-amzn-requestid': 'xyz'}, 'HTTPStatusCode': 200, 'RequestId': 'xyz', 'RetryAttempts': 0}, 'Stacks': [{'CreationTime': datetime.datetime(2018, 1, 1, tzinfo=tzutc()), 'StackId': 'arn:aws:cloudformation:us-east-1:123:stack/TestStackName/xyz', 'StackName': cloud.name, 'StackStatus': 'CREATE_COMPLETE'}]}
+    pill.save_response(service='cloudformation', operation='DescribeStacks', response_data=response, http_response=200)
 
     status = cloud.stack_ready(cloud.name)
     assert(status)
@@ -137,8 +266,8 @@ def test_get_stack_resource_not_found(cloud, pill):
     assert(resource is None)
 
 def test_get_cloud_function_name(cloud, pill):
-    response = {'ResponseMetadata': {'HTTPHeaders': {'content-length': '123', 'content-type': 'text/xml', 'date': 'xyz', 'x-amzn-requestid': 'xyz'}, 'HTTPStatusCode': 200, 'RequestId': 'xyz', 'RetryAttempts': 0}, 'StackSummaries': [{'CreationTime': datetime.datetime(2018, 1, 1, tzinfo=tzutc()), 'StackId': 'arn:aws:cloudformation:us-east-1:123:stack/TestStackName/xyz', 'StackName': cloud.name, 'StackStatus': 'CREATE_COMPLETE'}]}
-    pill.save_response(service='cloudformation', operation='ListStacks', response_data=response, http_response=200)
+    response = {'ResponseMetadata': {'HTTPHeaders': {'content-length': '123', 'content-type': 'text/xml', 'date': 'xyz', 'x-amzn-requestid': 'xyz'}, 'HTTPStatusCode': 200, 'RequestId': 'xyz', 'RetryAttempts': 0}, 'Stacks': [{'CreationTime': datetime.datetime(2018, 1, 1, tzinfo=tzutc()), 'StackId': 'arn:aws:cloudformation:us-east-1:123:stack/TestStackName/xyz', 'StackName': cloud.name, 'StackStatus': 'CREATE_COMPLETE'}]}
+    pill.save_response(service='cloudformation', operation='DescribeStacks', response_data=response, http_response=200)
 
     response = { "StackResourceSummaries": [ { "LogicalResourceId": "LambdaExecutionRole", "PhysicalResourceId": cloud.name, "ResourceType": troposphere.awslambda.Function.resource_type, "LastUpdatedTimestamp": { "__class__": "datetime", "year": 2018, "month": 3, "day": 18, "hour": 17, "minute": 24, "second": 33, "microsecond": 565000 }, "ResourceStatus": "CREATE_COMPLETE" } ] }
     pill.save_response(service='cloudformation', operation='ListStackResources', response_data=response, http_response=200)
@@ -149,8 +278,497 @@ def test_get_cloud_function_name(cloud, pill):
     assert(cloud.name == cloud_function_name)
 
 def test_is_deployed(cloud, pill):
-    response = {'ResponseMetadata': {'HTTPHeaders': {'content-length': '123', 'content-type': 'text/xml', 'date': 'xyz', 'x-amzn-requestid': 'xyz'}, 'HTTPStatusCode': 200, 'RequestId': 'xyz', 'RetryAttempts': 0}, 'StackSummaries': [{'CreationTime': datetime.datetime(2018, 1, 1, tzinfo=tzutc()), 'StackId': 'arn:aws:cloudformation:us-east-1:123:stack/TestStackName/xyz', 'StackName': cloud.name, 'StackStatus': 'CREATE_COMPLETE'}]}
-    pill.save_response(service='cloudformation', operation='ListStacks', response_data=response, http_response=200)
+    response = {'ResponseMetadata': {'HTTPHeaders': {'content-length': '123', 'content-type': 'text/xml', 'date': 'xyz', 'x-amzn-requestid': 'xyz'}, 'HTTPStatusCode': 200, 'RequestId': 'xyz', 'RetryAttempts': 0}, 'Stacks': [{'CreationTime': datetime.datetime(2018, 1, 1, tzinfo=tzutc()), 'StackId': 'arn:aws:cloudformation:us-east-1:123:stack/TestStackName/xyz', 'StackName': cloud.name, 'StackStatus': 'CREATE_COMPLETE'}]}
+    pill.save_response(service='cloudformation', operation='DescribeStacks', response_data=response, http_response=200)
 
     result = cloud.is_deployed()
     assert(result)
+
+def test_stack_status_does_not_exist(cloud, pill):
+    response = {'Error': {'Code': 'ValidationError', 'Message': 'Stack with id UnitTestApp does not exist'}, 'ResponseMetadata': {'HTTPStatusCode': 400}}
+    pill.save_response(service='cloudformation', operation='DescribeStacks', response_data=response, http_response=400)
+
+    assert(cloud.stack_status() is None)
+    assert(not cloud.stack_exists(cloud.name))
+
+def test_stack_status_scans_when_describe_is_denied(cloud, pill):
+    response = {'Error': {'Code': 'AccessDenied', 'Message': 'User is not authorized to perform: cloudformation:DescribeStacks'}, 'ResponseMetadata': {'HTTPStatusCode': 403}}
+    pill.save_response(service='cloudformation', operation='DescribeStacks', response_data=response, http_response=403)
+
+    response = {'StackSummaries': [{'CreationTime': datetime.datetime(2018, 1, 1, tzinfo=tzutc()), 'StackId': 'arn:aws:cloudformation:us-east-1:123:stack/Other/xyz', 'StackName': 'Other', 'StackStatus': 'CREATE_COMPLETE'}], 'NextToken': 'page2', 'ResponseMetadata': {'HTTPStatusCode': 200}}
+    pill.save_response(service='cloudformation', operation='ListStacks', response_data=response, http_response=200)
+
+    response = {'StackSummaries': [{'CreationTime': datetime.datetime(2018, 1, 1, tzinfo=tzutc()), 'StackId': 'arn:aws:cloudformation:us-east-1:123:stack/TestStackName/xyz', 'StackName': cloud.name, 'StackStatus': 'UPDATE_COMPLETE'}], 'ResponseMetadata': {'HTTPStatusCode': 200}}
+    pill.save_response(service='cloudformation', operation='ListStacks', response_data=response, http_response=200)
+
+    assert(cloud.stack_status() == 'UPDATE_COMPLETE')
+
+def test_stack_not_ready_while_in_progress(cloud, pill):
+    response = {'Stacks': [{'CreationTime': datetime.datetime(2018, 1, 1, tzinfo=tzutc()), 'StackId': 'arn:aws:cloudformation:us-east-1:123:stack/TestStackName/xyz', 'StackName': cloud.name, 'StackStatus': 'UPDATE_IN_PROGRESS'}]}
+    pill.save_response(service='cloudformation', operation='DescribeStacks', response_data=response, http_response=200)
+
+    assert(cloud.stack_exists(cloud.name))
+    assert(not cloud.stack_ready(cloud.name))
+
+def test_stack_resources_are_cached(cloud, pill):
+    response = { "StackResourceSummaries": [ { "LogicalResourceId": "UnitTestLambdaFunction", "PhysicalResourceId": "UnitTestFunctionName", "ResourceType": troposphere.awslambda.Function.resource_type, "ResourceStatus": "CREATE_COMPLETE" }, { "LogicalResourceId": "LambdaExecutionRole", "PhysicalResourceId": cloud.name, "ResourceType": troposphere.iam.Role.resource_type, "ResourceStatus": "CREATE_COMPLETE" } ] }
+    pill.save_response(service='cloudformation', operation='ListStackResources', response_data=response, http_response=200)
+
+    response = { "StackResourceSummaries": [] }
+    pill.save_response(service='cloudformation', operation='ListStackResources', response_data=response, http_response=200)
+
+    assert(cloud.get_resource(troposphere.iam.Role.resource_type)['PhysicalResourceId'] == cloud.name)
+    assert(cloud.get_resource_by_logical_id('UnitTestLambdaFunction')['PhysicalResourceId'] == 'UnitTestFunctionName')
+    assert(cloud.function_name == 'UnitTestFunctionName')
+
+    assert(cloud.resource_cache.get(cloud.cache_key) is cloud.resource_cache.get(cloud.cache_key))
+
+    cloud.resource_cache.invalidate(cloud.cache_key)
+    assert(cloud.get_resource(troposphere.iam.Role.resource_type) is None)
+
+def test_stack_resources_expire(cloud, pill):
+    response = { "StackResourceSummaries": [ { "LogicalResourceId": "LambdaExecutionRole", "PhysicalResourceId": cloud.name, "ResourceType": troposphere.iam.Role.resource_type, "ResourceStatus": "CREATE_COMPLETE" } ] }
+    pill.save_response(service='cloudformation', operation='ListStackResources', response_data=response, http_response=200)
+
+    response = { "StackResourceSummaries": [] }
+    pill.save_response(service='cloudformation', operation='ListStackResources', response_data=response, http_response=200)
+
+    cloud.resource_cache.ttl = -1
+    assert(cloud.get_resource(troposphere.iam.Role.resource_type) is not None)
+    assert(cloud.get_resource(troposphere.iam.Role.resource_type) is None)
+
+def test_stack_resources_persisted(settings, pill, tmpdir):
+    settings['resource_cache_file'] = str(tmpdir) + '/.sapling/resources.json'
+    response = { "StackResourceSummaries": [ { "LogicalResourceId": "LambdaExecutionRole", "PhysicalResourceId": settings['name'], "ResourceType": troposphere.iam.Role.resource_type, "ResourceStatus": "CREATE_COMPLETE" } ] }
+    pill.save_response(service='cloudformation', operation='ListStackResources', response_data=response, http_response=200)
+
+    cloud = Cloud(settings, session=pill.session)
+    assert(cloud.get_resource(troposphere.iam.Role.resource_type) is not None)
+
+    cloud = Cloud(settings, session=pill.session)
+    assert(cloud.resource_cache.get(cloud.cache_key) is not None)
+    assert(len(cloud.resource_cache.get(cloud.cache_key)) == 1)
+    # the entry read from the file is indexed once and reused
+    assert(cloud.resource_cache.get(cloud.cache_key) is cloud.resource_cache.get(cloud.cache_key))
+
+def test_multiple_lambdas_share_role(cloud):
+    cloud.add_lambda('UnitTestFirstFunction')
+    cloud.add_lambda('UnitTestSecondFunction', memory_size=512, timeout=30)
+
+    assert(list(cloud.lambda_functions) == ['UnitTestFirstFunction', 'UnitTestSecondFunction'])
+    assert(cloud.lambda_function.title == 'UnitTestFirstFunction')
+    second = cloud.template.resources['UnitTestSecondFunction']
+    assert(second.properties['MemorySize'] == 512)
+    assert(second.properties['Timeout'] == 30)
+    _validate_resources(cloud)
+
+def test_function_names(cloud, pill):
+    response = { "StackResourceSummaries": [ { "LogicalResourceId": "UnitTestFirstFunction", "PhysicalResourceId": "first-xyz", "ResourceType": troposphere.awslambda.Function.resource_type, "ResourceStatus": "CREATE_COMPLETE" }, { "LogicalResourceId": "UnitTestSecondFunction", "PhysicalResourceId": "second-xyz", "ResourceType": troposphere.awslambda.Function.resource_type, "ResourceStatus": "CREATE_COMPLETE" } ] }
+    pill.save_response(service='cloudformation', operation='ListStackResources', response_data=response, http_response=200)
+    response = {'Stacks': [{'CreationTime': datetime.datetime(2018, 1, 1, tzinfo=tzutc()), 'StackId': 'arn:aws:cloudformation:us-east-1:123:stack/TestStackName/xyz', 'StackName': cloud.name, 'StackStatus': 'CREATE_COMPLETE'}]}
+    pill.save_response(service='cloudformation', operation='DescribeStacks', response_data=response, http_response=200)
+
+    assert(cloud.function_names == {'UnitTestFirstFunction': 'first-xyz', 'UnitTestSecondFunction': 'second-xyz'})
+
+def test_lambda_with_layers(cloud):
+    layer_arn = 'arn:aws:lambda:us-east-1:123:layer:UnitTestLayer:1'
+    cloud.add_lambda('UnitTestLambdaFunction', layers=[layer_arn])
+
+    assert(cloud.template.resources['UnitTestLambdaFunction'].properties['Layers'] == [layer_arn])
+    _validate_resources(cloud)
+
+def test_lambda_tuning(cloud):
+    lambda_name = 'UnitTestLambdaFunction'
+    cloud.add_lambda(lambda_name, runtime='python3.9', memory_size=1024, reserved_concurrency=10, architecture='arm64')
+
+    properties = cloud.template.resources[lambda_name].properties
+    assert(properties['Runtime'] == 'python3.9')
+    assert(properties['MemorySize'] == 1024)
+    assert(properties['ReservedConcurrentExecutions'] == 10)
+    assert(properties['Architectures'] == ['arm64'])
+    assert('%sAlias' % lambda_name not in cloud.template.resources)
+    _validate_resources(cloud)
+
+def test_lambda_version_changes_with_configuration(settings):
+    def version_name(**tuning):
+        cloud = Cloud(settings)
+        cloud.add_lambda('UnitTestLambdaFunction', **tuning)
+        versions = [name for name, resource in cloud.template.resources.items() if resource.resource_type == 'AWS::Lambda::Version']
+        alias = cloud.template.resources['UnitTestLambdaFunctionAlias']
+        assert(alias.properties['FunctionVersion'].to_dict() == {'Fn::GetAtt': [versions[0], 'Version']})
+        return versions[0]
+
+    version = version_name(provisioned_concurrency=5)
+    assert(version == version_name(provisioned_concurrency=5))
+    assert(version != version_name(provisioned_concurrency=10))
+    assert(version != version_name(provisioned_concurrency=5, memory_size=1024))
+    assert(version != version_name(provisioned_concurrency=5, architecture='arm64'))
+
+def test_lambda_provisioned_concurrency_through_alias(cloud):
+    lambda_name = 'UnitTestLambdaFunction'
+    cloud.add_lambda(lambda_name, provisioned_concurrency=5)
+    cloud.add_api_gateway('UnitTestAPIGateway')
+
+    alias = cloud.template.resources['%sAlias' % lambda_name]
+    assert(len([name for name in cloud.template.resources if name.startswith('%sVersion' % lambda_name)]) == 1)
+    assert(alias.properties['Name'] == Cloud.ALIAS_NAME)
+    assert(alias.properties['ProvisionedConcurrencyConfig'].properties['ProvisionedConcurrentExecutions'] == 5)
+
+    template = cloud.template.to_dict()
+    permission = template['Resources']['UnitTestAPIGatewayLambdaPermission']
+    assert(permission['Properties']['FunctionName'] == {'Ref': '%sAlias' % lambda_name})
+    uri = template['Resources']['UnitTestAPIGatewayLambdaMethod']['Properties']['Integration']['Uri']
+    assert({'Ref': '%sAlias' % lambda_name} in uri['Fn::Join'][1])
+    _validate_resources(cloud)
+
+def test_template_source_inline(cloud):
+    cloud.add_s3_bucket('UnitTestS3Bucket')
+    template_body = sam.template.render(cloud.template)
+    assert(cloud.template_source(template_body) == {'TemplateBody': template_body})
+    assert(': ' not in template_body and '\n' not in template_body)
+
+def test_deploy_uploads_large_template(cloud, pill, settings):
+    settings['template_upload'] = True
+    response = {'Error': {'Code': 'ValidationError', 'Message': 'Stack with id UnitTestApp does not exist'}, 'ResponseMetadata': {'HTTPStatusCode': 400}}
+    pill.save_response(service='cloudformation', operation='DescribeStacks', response_data=response, http_response=400)
+    response = {'Error': {'Code': '404', 'Message': 'Not Found'}, 'ResponseMetadata': {'HTTPStatusCode': 404}}
+    pill.save_response(service='s3', operation='HeadObject', response_data=response, http_response=404)
+    response = {'Buckets': [{'CreationDate': datetime.datetime(2018, 1, 10, 1, 10, 16), 'Name': settings['bucket']}]}
+    pill.save_response(service='s3', operation='ListBuckets', response_data=response, http_response=200)
+    response = {'ETag': '"xyz"', 'ResponseMetadata': {'HTTPStatusCode': 200}}
+    pill.save_response(service='s3', operation='PutObject', response_data=response, http_response=200)
+    response = {'StackId': 'arn:aws:cloudformation:us-east-1:123:stack/UnitTestApp/xyz', 'ResponseMetadata': {'HTTPStatusCode': 200}}
+    pill.save_response(service='cloudformation', operation='CreateStack', response_data=response, http_response=200)
+
+    cloud.add_s3_bucket('UnitTestS3Bucket')
+    status = cloud.deploy()
+    assert(status['StackId'].endswith('/xyz'))
+    assert(cloud.size_report['resources'] == 1)
+
+    template_hash = sam.template.template_hash(sam.template.render(cloud.template))
+    # already uploaded, not uploaded again
+    response = {'ContentLength': 123, 'ResponseMetadata': {'HTTPStatusCode': 200}}
+    pill.save_response(service='s3', operation='HeadObject', response_data=response, http_response=200)
+    source = cloud.template_source(sam.template.render(cloud.template))
+    assert(source == {'TemplateURL': 'https://UnitTestBucket.s3.us-east-1.amazonaws.com/templates/UnitTestApp/%s.json' % template_hash})
+
+def test_upload_template_dry_keeps_settings(cloud, settings):
+    del settings['bucket']
+    template_body = sam.template.render(cloud.template)
+    url = cloud.upload_template(template_body, upload=False)
+    assert(url.endswith('/templates/UnitTestApp/%s.json' % sam.template.template_hash(template_body)))
+    assert('bucket' not in settings)
+
+def test_deploy_nested_stacks(cloud, pill, settings):
+    settings['nested_stacks'] = {'First': ['UnitTestFirstFunction'], 'Second': ['UnitTestSecondFunction']}
+    response = {'Error': {'Code': 'ValidationError', 'Message': 'Stack with id UnitTestApp does not exist'}, 'ResponseMetadata': {'HTTPStatusCode': 400}}
+    pill.save_response(service='cloudformation', operation='DescribeStacks', response_data=response, http_response=400)
+    response = {'ContentLength': 123, 'ResponseMetadata': {'HTTPStatusCode': 200}}
+    pill.save_response(service='s3', operation='HeadObject', response_data=response, http_response=200)
+    response = {'StackId': 'arn:aws:cloudformation:us-east-1:123:stack/UnitTestApp/xyz', 'ResponseMetadata': {'HTTPStatusCode': 200}}
+    pill.save_response(service='cloudformation', operation='CreateStack', response_data=response, http_response=200)
+
+    cloud.add_lambda('UnitTestFirstFunction')
+    cloud.add_lambda('UnitTestSecondFunction')
+    cloud.add_api_gateway('UnitTestAPIGateway')
+    root = json.loads(cloud.nest(sam.template.render(cloud.template)))
+    assert(root['Resources']['FirstStack']['Type'] == Cloud.STACK_TYPE)
+    assert(root['Resources']['SecondStack']['Properties']['TemplateURL'].startswith('https://UnitTestBucket.s3.us-east-1.amazonaws.com/templates/UnitTestApp/'))
+    assert('UnitTestFirstFunction' not in root['Resources'])
+
+    status = cloud.deploy()
+    assert(status['StackId'].endswith('/xyz'))
+    # the diff lists the resources of the nested stacks
+    assert(('Add', 'UnitTestFirstFunction', Cloud.FUNCTION_TYPE) in cloud.diff)
+
+def test_stack_resources_include_nested_stacks(cloud, pill):
+    nested_id = 'arn:aws:cloudformation:us-east-1:123:stack/UnitTestApp-FirstStack-abc/xyz'
+    response = { "StackResourceSummaries": [ { "LogicalResourceId": "FirstStack", "PhysicalResourceId": nested_id, "ResourceType": Cloud.STACK_TYPE, "ResourceStatus": "CREATE_COMPLETE" } ] }
+    pill.save_response(service='cloudformation', operation='ListStackResources', response_data=response, http_response=200)
+    response = { "StackResourceSummaries": [ { "LogicalResourceId": "UnitTestFirstFunction", "PhysicalResourceId": "first-xyz", "ResourceType": troposphere.awslambda.Function.resource_type, "ResourceStatus": "CREATE_COMPLETE" } ] }
+    pill.save_response(service='cloudformation', operation='ListStackResources', response_data=response, http_response=200)
+
+    resources = cloud.stack_resources()
+    assert(resources.by_logical_id('FirstStack')['PhysicalResourceId'] == nested_id)
+    assert(resources.by_logical_id('UnitTestFirstFunction')['PhysicalResourceId'] == 'first-xyz')
+
+def test_deploy_records_operation(cloud, pill):
+    response = {'Error': {'Code': 'ValidationError', 'Message': 'Stack with id UnitTestApp does not exist'}, 'ResponseMetadata': {'HTTPStatusCode': 400}}
+    pill.save_response(service='cloudformation', operation='DescribeStacks', response_data=response, http_response=400)
+    response = {'StackId': 'arn:aws:cloudformation:us-east-1:123:stack/UnitTestApp/xyz', 'ResponseMetadata': {'HTTPStatusCode': 200}}
+    pill.save_response(service='cloudformation', operation='CreateStack', response_data=response, http_response=200)
+
+    assert(cloud.operation() is None)
+    cloud.add_s3_bucket('UnitTestS3Bucket')
+    cloud.deploy()
+
+    operation = cloud.operation()
+    assert(operation['action'] == 'CREATE')
+    assert(operation['stack_id'] == 'arn:aws:cloudformation:us-east-1:123:stack/UnitTestApp/xyz')
+    assert(operation['token'].startswith('sapling-'))
+    assert(operation['status'] is None)
+
+def test_deploy_detached(cloud, pill):
+    stack_id = 'arn:aws:cloudformation:us-east-1:123:stack/UnitTestApp/xyz'
+    response = {'Stacks': [{'CreationTime': datetime.datetime(2018, 1, 1, tzinfo=tzutc()), 'StackId': stack_id, 'StackName': cloud.name, 'StackStatus': 'CREATE_COMPLETE'}]}
+    pill.save_response(service='cloudformation', operation='DescribeStacks', response_data=response, http_response=200)
+    response = {'StackId': stack_id, 'ResponseMetadata': {'HTTPStatusCode': 200}}
+    pill.save_response(service='cloudformation', operation='UpdateStack', response_data=response, http_response=200)
+    pill.save_response(service='cloudformation', operation='DeleteStack', response_data={'ResponseMetadata': {'HTTPStatusCode': 200}}, http_response=200)
+    cloud.add_s3_bucket('UnitTestS3Bucket')
+
+    # an update is started without a change set
+    status = cloud.deploy(detach=True)
+    assert(status['StackId'] == stack_id)
+    assert(cloud.changes == [])
+    assert(cloud.operation()['action'] == 'UPDATE')
+
+    # a replace returns once the deletion started, the creation is left to resume
+    cloud.deploy(replace=True, detach=True)
+    operation = cloud.operation()
+    assert(operation['action'] == 'DELETE')
+    assert(operation['then'] == 'CREATE')
+    assert(operation['status'] is None)
+
+    with pytest.raises(Exception):
+        cloud.deploy(wait=True, detach=True)
+
+def test_resume_replays_operation_events(cloud, pill):
+    stack_id = 'arn:aws:cloudformation:us-east-1:123:stack/UnitTestApp/xyz'
+    cloud.record_operation('CREATE', stack_id=stack_id, token='sapling-xyz', since=datetime.datetime(2018, 1, 1, tzinfo=tzutc()))
+    response = {'Stacks': [{'CreationTime': datetime.datetime(2018, 1, 1, tzinfo=tzutc()), 'StackId': stack_id, 'StackName': cloud.name, 'StackStatus': 'CREATE_IN_PROGRESS'}]}
+    pill.save_response(service='cloudformation', operation='DescribeStacks', response_data=response, http_response=200)
+    events = [
+        {'EventId': '2', 'StackId': stack_id, 'StackName': cloud.name, 'LogicalResourceId': 'UnitTestS3Bucket', 'ResourceStatus': 'CREATE_IN_PROGRESS', 'Timestamp': datetime.datetime(2018, 1, 1, 0, 0, 2, tzinfo=tzutc())},
+        {'EventId': '1', 'StackId': stack_id, 'StackName': cloud.name, 'LogicalResourceId': cloud.name, 'ResourceStatus': 'CREATE_IN_PROGRESS', 'Timestamp': datetime.datetime(2018, 1, 1, 0, 0, 1, tzinfo=tzutc())},
+        {'EventId': '0', 'StackId': stack_id, 'StackName': cloud.name, 'LogicalResourceId': cloud.name, 'ResourceStatus': 'DELETE_COMPLETE', 'Timestamp': datetime.datetime(2017, 12, 31, tzinfo=tzutc())}
+    ]
+    pill.save_response(service='cloudformation', operation='DescribeStackEvents', response_data={'StackEvents': events}, http_response=200)
+
+    seen = []
+    status = cloud.resume(wait=False, callback=seen.append)
+    assert(status == 'CREATE_IN_PROGRESS')
+    assert([event['EventId'] for event in seen] == ['1', '2'])
+    assert(cloud.operation()['status'] is None)
+
+    response = {'Stacks': [{'CreationTime': datetime.datetime(2018, 1, 1, tzinfo=tzutc()), 'StackId': stack_id, 'StackName': cloud.name, 'StackStatus': 'CREATE_COMPLETE'}]}
+    pill.save_response(service='cloudformation', operation='DescribeStacks', response_data=response, http_response=200)
+    pill.save_response(service='cloudformation', operation='DescribeStackEvents', response_data={'StackEvents': events}, http_response=200)
+    assert(cloud.resume(wait=True) == 'CREATE_COMPLETE')
+    assert(cloud.operation()['status'] == 'CREATE_COMPLETE')
+
+def test_resume_without_operation(cloud):
+    assert(cloud.resume() is None)
+
+def test_api_gateway_cache_and_throttling(cloud):
+    apigateway_name = 'UnitTestAPIGateway'
+    cloud.add_lambda('UnitTestLambdaFunction')
+    cloud.add_api_gateway(
+        apigateway_name,
+        cache={'size': '1.6', 'ttl': 60, 'key_parameters': ['path.proxy', 'method.request.querystring.page']},
+        throttling={'rate': 100, 'burst': 200, 'methods': {'post': {'rate': 10, 'burst': 20}}},
+        minimum_compression_size=1024
+    )
+    _validate_resources(cloud)
+    template = cloud.template.to_dict()
+    resources = template['Resources']
+
+    assert(resources[apigateway_name]['Properties']['MinimumCompressionSize'] == 1024)
+    # GET is cached through its own method, the ANY method serves the other HTTP methods
+    get = resources['%sGetMethod' % apigateway_name]['Properties']
+    assert(get['HttpMethod'] == 'GET')
+    assert(get['Integration']['CacheKeyParameters'] == ['method.request.path.proxy', 'method.request.querystring.page'])
+    assert(get['RequestParameters'] == {'method.request.path.proxy': True, 'method.request.querystring.page': False})
+    assert('CacheKeyParameters' not in resources['%sPostMethod' % apigateway_name]['Properties']['Integration'])
+    assert(resources['%sLambdaMethod' % apigateway_name]['Properties']['HttpMethod'] == 'ANY')
+    assert(set(_deployment(resources)['DependsOn']) == set(['%s%sMethod' % (apigateway_name, name) for name in ('Lambda', 'Get', 'Post')]))
+
+    stage = resources['v1Stage']['Properties']
+    assert(stage['CacheClusterEnabled'] is True)
+    assert(stage['CacheClusterSize'] == '1.6')
+    method_settings = dict((setting['HttpMethod'], setting) for setting in stage['MethodSettings'])
+    assert(method_settings['*'] == {'ResourcePath': '/*', 'HttpMethod': '*', 'ThrottlingRateLimit': 100.0, 'ThrottlingBurstLimit': 200})
+    assert(method_settings['GET']['CachingEnabled'] is True)
+    assert(method_settings['GET']['CacheTtlInSeconds'] == 60)
+    assert(method_settings['GET']['ResourcePath'] == '/~1{proxy+}')
+    assert(method_settings['POST']['ThrottlingRateLimit'] == 10.0)
+    assert('CachingEnabled' not in method_settings['POST'])
+
+def test_api_gateway_cache_keys_on_proxy_path(cloud):
+    apigateway_name = 'UnitTestAPIGateway'
+    cloud.add_lambda('UnitTestLambdaFunction')
+    cloud.add_api_gateway(apigateway_name, cache={'size': '0.5'})
+    get = cloud.template.to_dict()['Resources']['%sGetMethod' % apigateway_name]['Properties']
+
+    assert(get['Integration']['CacheKeyParameters'] == ['method.request.path.proxy'])
+    assert(get['RequestParameters'] == {'method.request.path.proxy': True})
+
+def test_api_gateway_defaults_to_bare_stage(cloud):
+    cloud.add_lambda('UnitTestLambdaFunction')
+    cloud.add_api_gateway('UnitTestAPIGateway')
+    resources = cloud.template.to_dict()['Resources']
+
+    assert('CacheClusterEnabled' not in resources['v1Stage']['Properties'])
+    assert('MethodSettings' not in resources['v1Stage']['Properties'])
+    assert('MinimumCompressionSize' not in resources['UnitTestAPIGateway']['Properties'])
+    assert(_deployment(resources)['DependsOn'] == 'UnitTestAPIGatewayLambdaMethod')
+
+def test_http_api(cloud):
+    api_name = 'UnitTestHttpApi'
+    cloud.add_lambda('UnitTestLambdaFunction')
+    cloud.add_http_api(api_name, routes=['GET /items/{id}', '$default'], throttling={'rate': 100, 'burst': 50, 'routes': {'GET /items/{id}': {'rate': 10}}})
+    _validate_resources(cloud)
+    resources = cloud.template.to_dict()['Resources']
+
+    assert(resources[api_name]['Properties']['ProtocolType'] == 'HTTP')
+    integration = resources['%sLambdaIntegration' % api_name]['Properties']
+    assert(integration['IntegrationType'] == 'AWS_PROXY')
+    assert(integration['PayloadFormatVersion'] == '2.0')
+    assert(resources['%sGetItemsIdParamRoute' % api_name]['Properties']['RouteKey'] == 'GET /items/{id}')
+    assert(resources['%sDefaultRoute' % api_name]['Properties']['RouteKey'] == '$default')
+    stage = resources['%sStage' % api_name]
+    assert(stage['Properties']['StageName'] == '$default')
+    assert(stage['Properties']['AutoDeploy'] is True)
+    assert(stage['Properties']['DefaultRouteSettings'] == {'ThrottlingRateLimit': 100.0, 'ThrottlingBurstLimit': 50})
+    assert(stage['Properties']['RouteSettings'] == {'GET /items/{id}': {'ThrottlingRateLimit': 10.0}})
+    assert(set(stage['DependsOn']) == set(['%sGetItemsIdParamRoute' % api_name, '%sDefaultRoute' % api_name]))
+    assert(not any(resource['Type'].startswith('AWS::ApiGateway::') for resource in resources.values()))
+
+def test_api_gateway_routes(cloud):
+    apigateway_name = 'UnitTestAPIGateway'
+    cloud.add_lambda('UnitTestItemsFunction')
+    cloud.add_lambda('UnitTestUsersFunction')
+    cloud.add_api_gateway(apigateway_name, cache={'ttl': 300}, throttling={'rate': 100}, routes=[
+        {'path': '/items', 'method': 'get', 'function': 'UnitTestItemsFunction'},
+        {'path': '/items/{id}', 'method': 'GET', 'function': 'UnitTestItemsFunction', 'cache': {'ttl': 60}},
+        {'path': 'items/{id}/', 'method': 'DELETE', 'function': 'UnitTestItemsFunction', 'throttling': {'rate': 5, 'burst': 5}},
+        {'path': '/users/{id}', 'function': 'UnitTestUsersFunction', 'cache': False}
+    ])
+    _validate_resources(cloud)
+    resources = cloud.template.to_dict()['Resources']
+
+    # no catch-all, the shared /items prefix is a single resource
+    assert('%sResource' % apigateway_name not in resources)
+    path_resources = dict((name, resource['Properties']) for name, resource in resources.items() if resource['Type'] == 'AWS::ApiGateway::Resource')
+    assert(set(path_resources) == set(['%s%sResource' % (apigateway_name, name) for name in ('Items', 'ItemsIdParam', 'Users', 'UsersIdParam')]))
+    assert(path_resources['%sItemsIdParamResource' % apigateway_name]['ParentId'] == {'Ref': '%sItemsResource' % apigateway_name})
+    assert(path_resources['%sItemsIdParamResource' % apigateway_name]['PathPart'] == '{id}')
+    assert(path_resources['%sItemsResource' % apigateway_name]['ParentId'] == {'Fn::GetAtt': [apigateway_name, 'RootResourceId']})
+
+    get_item = resources['%sItemsIdParamGetMethod' % apigateway_name]['Properties']
+    assert(get_item['ResourceId'] == {'Ref': '%sItemsIdParamResource' % apigateway_name})
+    assert(get_item['RequestParameters'] == {'method.request.path.id': True})
+    assert(get_item['Integration']['CacheKeyParameters'] == ['method.request.path.id'])
+    users = resources['%sUsersIdParamAnyMethod' % apigateway_name]
+    assert(users['Properties']['HttpMethod'] == 'ANY')
+    assert(users['DependsOn'] == '%sUnitTestUsersFunctionPermission' % apigateway_name)
+    assert({'Fn::GetAtt': ['UnitTestUsersFunction', 'Arn']} in users['Properties']['Integration']['Uri']['Fn::Join'][1])
+    assert(resources['%sLambdaPermission' % apigateway_name]['Properties']['FunctionName'] == {'Fn::GetAtt': ['UnitTestItemsFunction', 'Arn']})
+    assert(len(_deployment(resources)['DependsOn']) == 4)
+
+    stage = resources['v1Stage']['Properties']
+    assert(stage['CacheClusterEnabled'] is True)
+    method_settings = dict(((setting['ResourcePath'], setting['HttpMethod']), setting) for setting in stage['MethodSettings'])
+    assert(set(method_settings) == set([('/*', '*'), ('/~1items', 'GET'), ('/~1items~1{id}', 'GET'), ('/~1items~1{id}', 'DELETE')]))
+    assert(method_settings[('/~1items', 'GET')]['CacheTtlInSeconds'] == 300)
+    assert(method_settings[('/~1items~1{id}', 'GET')]['CacheTtlInSeconds'] == 60)
+    assert(method_settings[('/~1items~1{id}', 'DELETE')]['ThrottlingBurstLimit'] == 5)
+    assert('CachingEnabled' not in method_settings[('/~1items~1{id}', 'DELETE')])
+
+def test_api_gateway_route_cache_keys_keep_path_parameters(cloud):
+    apigateway_name = 'UnitTestAPIGateway'
+    cloud.add_lambda('UnitTestLambdaFunction')
+    cloud.add_api_gateway(apigateway_name, cache={'key_parameters': ['querystring.page']}, routes=[
+        {'path': '/items', 'method': 'GET'},
+        {'path': '/items/{id}', 'method': 'GET'},
+        {'path': '/items/{id}/tags', 'method': 'GET', 'cache': {'key_parameters': ['path.id', 'header.Accept']}}
+    ])
+    resources = cloud.template.to_dict()['Resources']
+
+    items = resources['%sItemsGetMethod' % apigateway_name]['Properties']['Integration']
+    assert(items['CacheKeyParameters'] == ['method.request.querystring.page'])
+    item = resources['%sItemsIdParamGetMethod' % apigateway_name]['Properties']['Integration']
+    assert(item['CacheKeyParameters'] == ['method.request.path.id', 'method.request.querystring.page'])
+    tags = resources['%sItemsIdParamTagsGetMethod' % apigateway_name]['Properties']['Integration']
+    # the keys of a route replace the ones of the stage, without repeating a path parameter
+    assert(tags['CacheKeyParameters'] == ['method.request.path.id', 'method.request.header.Accept'])
+
+def test_api_gateway_route_errors(cloud):
+    cloud.add_lambda('UnitTestLambdaFunction')
+    try:
+        cloud.add_api_gateway('UnitTestAPIGateway', routes=[{'path': '/items', 'function': 'UnitTestMissingFunction'}])
+        assert(False)
+    except Exception as e:
+        assert('UnitTestMissingFunction' in str(e))
+
+    cloud = Cloud(cloud.settings)
+    cloud.add_lambda('UnitTestLambdaFunction')
+    try:
+        cloud.add_api_gateway('UnitTestAPIGateway', routes=[{'path': '/items', 'method': 'GET'}, {'path': '/items/', 'method': 'get'}])
+        assert(False)
+    except Exception as e:
+        assert('defined twice' in str(e))
+
+def test_route_names(cloud):
+    assert(Cloud.route_name('GET /items/{id}') == 'GetItemsIdParam')
+    assert(Cloud.route_name('/{proxy+}') == 'ProxyGreedy')
+    assert(Cloud.route_name('$default') == 'Default')
+    assert(Cloud.route_name('/') == 'Root')
+
+    apigateway_name = 'UnitTestAPIGateway'
+    cloud.add_lambda('UnitTestLambdaFunction')
+    cloud.add_api_gateway(apigateway_name, routes=[
+        {'path': '/items/{id}', 'method': 'GET'},
+        {'path': '/items/id', 'method': 'GET'},
+        {'path': '/{proxy+}', 'method': 'GET'},
+        {'path': '/proxy', 'method': 'GET'},
+        {'path': '/items-id', 'method': 'GET'},
+        {'path': '/items_id', 'method': 'GET'}
+    ])
+    _validate_resources(cloud)
+    resources = cloud.template.to_dict()['Resources']
+
+    methods = dict((resource['Properties']['ResourceId']['Ref'], name) for name, resource in resources.items() if resource['Type'] == 'AWS::ApiGateway::Method')
+    assert(len(methods) == 6)
+    parts = dict((name, resource['Properties']['PathPart']) for name, resource in resources.items() if resource['Type'] == 'AWS::ApiGateway::Resource')
+    assert(parts['%sItemsIdParamResource' % apigateway_name] == '{id}')
+    assert(parts['%sItemsIdResource' % apigateway_name] == 'id')
+    assert(parts['%sProxyGreedyResource' % apigateway_name] == '{proxy+}')
+    assert(parts['%sProxyResource' % apigateway_name] == 'proxy')
+    # the second path named ItemsId gets a hash suffix
+    assert(len([name for name, part in parts.items() if part in ('items-id', 'items_id')]) == 2)
+
+def test_http_api_routes(cloud):
+    api_name = 'UnitTestHttpApi'
+    cloud.add_lambda('UnitTestItemsFunction')
+    cloud.add_lambda('UnitTestUsersFunction')
+    cloud.add_http_api(api_name, routes=[
+        '$default',
+        {'path': '/users/{id}', 'method': 'get', 'function': 'UnitTestUsersFunction', 'throttling': {'rate': 10}}
+    ])
+    _validate_resources(cloud)
+    resources = cloud.template.to_dict()['Resources']
+
+    route = resources['%sGetUsersIdParamRoute' % api_name]['Properties']
+    assert(route['RouteKey'] == 'GET /users/{id}')
+    assert(route['Target'] == {'Fn::Join': ['/', ['integrations', {'Ref': '%sUnitTestUsersFunctionIntegration' % api_name}]]})
+    assert(resources['%sUnitTestUsersFunctionIntegration' % api_name]['Properties']['IntegrationUri'] == {'Fn::GetAtt': ['UnitTestUsersFunction', 'Arn']})
+    assert(resources['%sDefaultRoute' % api_name]['Properties']['Target'] == {'Fn::Join': ['/', ['integrations', {'Ref': '%sLambdaIntegration' % api_name}]]})
+    assert('%sUnitTestUsersFunctionPermission' % api_name in resources)
+    assert(resources['%sStage' % api_name]['Properties']['RouteSettings'] == {'GET /users/{id}': {'ThrottlingRateLimit': 10.0}})
+
+def test_api_gateway_deployment_changes_with_routes(settings):
+    def deployment_name(routes):
+        cloud = Cloud(settings)
+        cloud.add_lambda('UnitTestLambdaFunction')
+        cloud.add_api_gateway('UnitTestAPIGateway', routes=routes)
+        resources = cloud.template.to_dict()['Resources']
+        names = [name for name, resource in resources.items() if resource['Type'] == 'AWS::ApiGateway::Deployment']
+        assert(resources['v1Stage']['Properties']['DeploymentId'] == {'Ref': names[0]})
+        return names[0]
+
+    items = deployment_name([{'path': '/items', 'method': 'GET'}])
+    assert(items.startswith('v1Deployment'))
+    assert(items == deployment_name([{'path': '/items', 'method': 'GET'}]))
+    assert(items != deployment_name([{'path': '/items', 'method': 'POST'}]))
+    assert(items != deployment_name([{'path': '/items/{id}', 'method': 'GET'}]))
@@ -0,0 +1,70 @@
+import pytest
+
+from sam.layer import Layer
+
+LAYER_ARN = 'arn:aws:lambda:us-east-1:123:layer:UnitTestAppDependencies:%s'
+
+@pytest.fixture
+def layer(settings, pill, tmpdir):
+    requirements = tmpdir.join('requirements.txt')
+    requirements.write('requests==2.18.4\n')
+    settings['layer'] = {'requirements': str(requirements)}
+    layer = Layer(settings, pill.session)
+    layer.build_dir = str(tmpdir.mkdir('build'))
+    return layer
+
+def test_layer_digest(layer):
+    digest = layer.digest()
+    assert(digest == layer.digest())
+
+    with open(layer.requirements, 'a') as f:
+        f.write('six==1.11.0\n')
+    assert(digest != layer.digest())
+
+    layer.requirements = 'does_not_exist'
+    with pytest.raises(FileNotFoundError):
+        layer.digest()
+
+def test_layer_pip_command_targets_lambda(settings, pill, layer):
+    command = layer.pip_command('build/layer/python')
+    assert(command[command.index('--platform') + 1] == 'manylinux2014_x86_64')
+    assert(command[command.index('--python-version') + 1] == layer.runtime[len('python'):])
+    assert('--only-binary=:all:' in command)
+
+    settings['runtime'] = 'python3.12'
+    settings['architecture'] = 'arm64'
+    arm = Layer(settings, pill.session)
+    command = arm.pip_command('build/layer/python')
+    assert(command[command.index('--platform') + 1] == 'manylinux2014_aarch64')
+    assert(command[command.index('--implementation') + 1] == 'cp')
+    assert(command[command.index('--python-version') + 1] == '3.12')
+    assert(arm.digest() != layer.digest())
+
+def test_layer_publish_skipped_when_remembered(layer, settings):
+    settings['layer_hash'] = layer.digest()
+    settings['layer_arn'] = LAYER_ARN % 1
+
+    assert(layer.publish() == LAYER_ARN % 1)
+
+def test_layer_publish_reuses_existing_version(layer, settings, pill):
+    response = {'LayerVersions': [{'LayerVersionArn': LAYER_ARN % 2, 'Version': 2, 'Description': 'sha256:other'}], 'NextMarker': 'xyz', 'ResponseMetadata': {'HTTPStatusCode': 200}}
+    pill.save_response(service='lambda', operation='ListLayerVersions', response_data=response, http_response=200)
+    response = {'LayerVersions': [{'LayerVersionArn': LAYER_ARN % 1, 'Version': 1, 'Description': 'sha256:%s' % layer.digest()}], 'ResponseMetadata': {'HTTPStatusCode': 200}}
+    pill.save_response(service='lambda', operation='ListLayerVersions', response_data=response, http_response=200)
+
+    assert(layer.publish() == LAYER_ARN % 1)
+    assert(settings['layer_arn'] == LAYER_ARN % 1)
+    assert(settings['layer_hash'] == layer.digest())
+
+def test_layer_publish_new_version(layer, settings, pill):
+    response = {'LayerVersions': [], 'ResponseMetadata': {'HTTPStatusCode': 200}}
+    pill.save_response(service='lambda', operation='ListLayerVersions', response_data=response, http_response=200)
+    response = {'LayerArn': 'arn:aws:lambda:us-east-1:123:layer:UnitTestAppDependencies', 'LayerVersionArn': LAYER_ARN % 3, 'Version': 3, 'ResponseMetadata': {'HTTPStatusCode': 201}}
+    pill.save_response(service='lambda', operation='PublishLayerVersion', response_data=response, http_response=201)
+
+    # the archive for this digest was built before, so nothing is installed
+    with open(layer.archive(), 'wb') as f:
+        f.write(b'layer')
+
+    assert(layer.publish() == LAYER_ARN % 3)
+    assert(settings['layer_arn'] == LAYER_ARN % 3)
@@ -0,0 +1,165 @@
+import base64
+import http.client
+import json
+import pytest
+import threading
+import urllib.request
+
+from sam.local import LocalServer, http_event, load_handler, proxy_event, translate_response
+
+HANDLER = '''import base64
+import json
+
+def handler(event, context):
+    if event['path'] == '/binary':
+        return {'statusCode': 200, 'headers': {'Content-Type': 'application/octet-stream'}, 'body': base64.b64encode(b'\\x00\\x01').decode('ascii'), 'isBase64Encoded': True}
+    return {'statusCode': 201, 'headers': {'X-Echo': 'yes'}, 'body': json.dumps(event), 'isBase64Encoded': False}
+'''
+
+HTTP_HANDLER = '''def handler(event, context):
+    if event['rawPath'] == '/fail':
+        raise ValueError('failed')
+    return {'path': event['rawPath'], 'query': event.get('queryStringParameters'), 'cookies': event.get('cookies'), 'tag': event['headers'].get('x-tag')}
+'''
+
+@pytest.fixture
+def source_dir(tmpdir):
+    source_dir = tmpdir.mkdir('lambda_local')
+    source_dir.join('local_main.py').write(HANDLER)
+    source_dir.join('local_http.py').write(HTTP_HANDLER)
+    return str(source_dir)
+
+def test_proxy_event():
+    event = proxy_event('POST', '/users/1', headers={'Content-Type': 'application/json'}, query=[('a', '1'), ('a', '2')], body=b'{"x": 1}')
+
+    assert(event['resource'] == '/{proxy+}')
+    assert(event['httpMethod'] == 'POST')
+    assert(event['pathParameters'] == {'proxy': 'users/1'})
+    assert(event['queryStringParameters'] == {'a': '2'})
+    assert(event['multiValueQueryStringParameters'] == {'a': ['1', '2']})
+    assert(event['requestContext']['path'] == '/v1/users/1')
+    assert(event['body'] == '{"x": 1}')
+    assert(not event['isBase64Encoded'])
+
+def test_proxy_event_binary_body():
+    event = proxy_event('PUT', '/upload', headers={'Content-Type': 'application/octet-stream'}, body=b'\x00\xff')
+
+    assert(event['isBase64Encoded'])
+    assert(base64.b64decode(event['body']) == b'\x00\xff')
+
+def test_translate_response():
+    status, headers, body = translate_response({'statusCode': 404, 'headers': {'A': 'b'}, 'multiValueHeaders': {'Set-Cookie': ['x=1', 'y=2']}, 'body': 'missing'})
+    assert(status == 404)
+    assert(headers == [('A', 'b'), ('Set-Cookie', 'x=1'), ('Set-Cookie', 'y=2')])
+    assert(body == b'missing')
+
+    status, headers, body = translate_response({'body': base64.b64encode(b'\x00').decode('ascii'), 'isBase64Encoded': True})
+    assert(status == 200)
+    assert(body == b'\x00')
+
+    status, headers, body = translate_response(None)
+    assert(status == 502)
+
+def test_http_event():
+    event = http_event('GET', '/users/1', headers={'Cookie': 'a=1; b=2', 'User-Agent': 'test'}, query=[('a', '1'), ('a', '2')])
+
+    assert(event['version'] == '2.0')
+    assert(event['routeKey'] == '$default')
+    assert(event['rawPath'] == '/users/1')
+    assert(event['rawQueryString'] == 'a=1&a=2')
+    assert(event['queryStringParameters'] == {'a': '1,2'})
+    assert(event['cookies'] == ['a=1', 'b=2'])
+    assert(event['headers'] == {'user-agent': 'test'})
+    assert(event['requestContext']['http']['method'] == 'GET')
+    assert(event['requestContext']['http']['userAgent'] == 'test')
+    assert('body' not in event)
+    assert(not event['isBase64Encoded'])
+
+def test_events_repeated_headers():
+    headers = [('Accept', 'text/html'), ('Accept', 'application/json'), ('Cookie', 'a=1'), ('Cookie', 'b=2')]
+    event = proxy_event('GET', '/', headers=headers)
+    assert(event['headers']['Accept'] == 'application/json')
+    assert(event['multiValueHeaders']['Accept'] == ['text/html', 'application/json'])
+
+    event = http_event('GET', '/', headers=headers)
+    assert(event['headers'] == {'accept': 'text/html,application/json'})
+    assert(event['cookies'] == ['a=1', 'b=2'])
+
+def test_translate_response_payload_format_2():
+    status, headers, body = translate_response({'items': [1]}, payload_format='2.0')
+    assert(status == 200)
+    assert(headers == [('Content-Type', 'application/json')])
+    assert(json.loads(body.decode('utf-8')) == {'items': [1]})
+
+    status, headers, body = translate_response({'statusCode': 302, 'headers': {'Location': '/'}, 'cookies': ['x=1']}, payload_format='2.0')
+    assert(status == 302)
+    assert(headers == [('Location', '/'), ('Set-Cookie', 'x=1')])
+
+def test_load_handler(source_dir):
+    handler = load_handler(source_dir, 'local_main.handler')
+    result = handler(proxy_event('GET', '/'), None)
+    assert(result['statusCode'] == 201)
+
+def test_local_server(source_dir):
+    server = LocalServer(source_dir, 'local_main.handler', port=0, workers=1)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    try:
+        url = 'http://127.0.0.1:%d' % server.server_port
+        with urllib.request.urlopen(url + '/users/1?page=2') as response:
+            assert(response.status == 201)
+            assert(response.headers['X-Echo'] == 'yes')
+            event = json.loads(response.read().decode('utf-8'))
+        assert(event['path'] == '/users/1')
+        assert(event['queryStringParameters'] == {'page': '2'})
+
+        with urllib.request.urlopen(url + '/binary') as response:
+            assert(response.read() == b'\x00\x01')
+
+        # repeated headers reach the handler with all of their values
+        connection = http.client.HTTPConnection('127.0.0.1', server.server_port)
+        connection.putrequest('GET', '/tags')
+        connection.putheader('X-Tag', 'a')
+        connection.putheader('X-Tag', 'b')
+        connection.endheaders()
+        event = json.loads(connection.getresponse().read().decode('utf-8'))
+        connection.close()
+        assert(event['headers']['X-Tag'] == 'b')
+        assert(event['multiValueHeaders']['X-Tag'] == ['a', 'b'])
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
+
+def test_local_server_http_api(source_dir):
+    server = LocalServer(source_dir, 'local_http.handler', port=0, workers=1, stage='$default', payload_format='2.0')
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    try:
+        url = 'http://127.0.0.1:%d' % server.server_port
+        request = urllib.request.Request(url + '/users/1?page=2', headers={'Cookie': 'session=abc'})
+        with urllib.request.urlopen(request) as response:
+            assert(response.status == 200)
+            assert(json.loads(response.read().decode('utf-8')) == {'path': '/users/1', 'query': {'page': '2'}, 'cookies': ['session=abc'], 'tag': None})
+
+        connection = http.client.HTTPConnection('127.0.0.1', server.server_port)
+        connection.putrequest('GET', '/tags')
+        connection.putheader('X-Tag', 'a')
+        connection.putheader('X-Tag', 'b')
+        connection.putheader('Cookie', 'session=abc')
+        connection.putheader('Cookie', 'theme=dark')
+        connection.endheaders()
+        result = json.loads(connection.getresponse().read().decode('utf-8'))
+        connection.close()
+        assert(result['tag'] == 'a,b')
+        assert(result['cookies'] == ['session=abc', 'theme=dark'])
+
+        try:
+            urllib.request.urlopen(url + '/fail')
+            assert(False)
+        except urllib.error.HTTPError as e:
+            assert(e.code == 502)
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
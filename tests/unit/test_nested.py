@@ -0,0 +1,115 @@
+import json
+
+import sam.nested
+import sam.template
+
+from sam.cloud import Cloud
+
+def _template(settings):
+    cloud = Cloud(settings)
+    cloud.add_lambda('UnitTestFirstFunction')
+    cloud.add_lambda('UnitTestSecondFunction')
+    cloud.add_api_gateway('UnitTestAPIGateway')
+    return json.loads(sam.template.render(cloud.template))
+
+def test_assign_follows_function_references(settings):
+    template = _template(settings)
+    assignment = sam.nested.assign(template, {'First': ['UnitTestFirstFunction'], 'Second': ['UnitTestSecondFunction']})
+
+    assert(assignment['UnitTestFirstFunction'] == 'First')
+    assert(assignment['UnitTestSecondFunction'] == 'Second')
+    # the API Gateway proxies to the first function
+    assert(assignment['UnitTestAPIGatewayLambdaMethod'] == 'First')
+    assert(assignment['UnitTestAPIGatewayLambdaPermission'] == 'First')
+    assert(assignment['UnitTestAPIGatewayResource'] == 'First')
+    for logical_id in ('LambdaExecutionRole', 'UnitTestAPIGateway', 'v1Stage'):
+        assert(logical_id not in assignment)
+    assert(not any(logical_id.startswith('v1Deployment') for logical_id in assignment))
+
+def test_assign_keeps_parents_of_shared_paths(settings):
+    cloud = Cloud(settings)
+    cloud.add_lambda('Fn')
+    cloud.add_lambda('Other')
+    cloud.add_api_gateway('Api', routes=[
+        {'path': '/items', 'method': 'GET', 'function': 'Fn'},
+        {'path': '/items/{id}', 'method': 'GET', 'function': 'Fn'},
+        {'path': '/items/{id}', 'method': 'POST', 'function': 'Other'}
+    ])
+    template = json.loads(sam.template.render(cloud.template))
+    assignment = sam.nested.assign(template, {'Fn': ['Fn'], 'Other': ['Other']})
+
+    # /items/{id} is shared by both groups, so it stays in the root stack with its parent /items
+    assert('ApiItemsIdParamResource' not in assignment)
+    assert('ApiItemsResource' not in assignment)
+    assert(assignment['ApiItemsGetMethod'] == 'Fn')
+    assert(assignment['ApiItemsIdParamPostMethod'] == 'Other')
+
+    root, children = sam.nested.partition(template, assignment)
+    assert('ApiItemsResource' in root['Resources'])
+    parameters = root['Resources']['FnStack']['Properties']['Parameters']
+    assert(parameters['ApiItemsResourceRef'] == {'Ref': 'ApiItemsResource'})
+
+def test_assign_unknown_function(settings):
+    template = _template(settings)
+    try:
+        sam.nested.assign(template, {'First': ['UnitTestMissingFunction']})
+        assert(False)
+    except Exception as e:
+        assert('UnitTestMissingFunction' in str(e))
+
+def test_partition_wires_parameters_and_outputs():
+    template = {
+        'AWSTemplateFormatVersion': '2010-09-09',
+        'Resources': {
+            'Role': {'Type': 'AWS::IAM::Role', 'Properties': {}},
+            'First': {'Type': 'AWS::Lambda::Function', 'Properties': {'Role': {'Fn::GetAtt': ['Role', 'Arn']}}},
+            'Second': {'Type': 'AWS::Lambda::Function', 'Properties': {'Environment': {'Variables': {'FIRST': {'Ref': 'First'}, 'REGION': {'Ref': 'AWS::Region'}}}}},
+            'Deployment': {'Type': 'AWS::ApiGateway::Deployment', 'DependsOn': 'First', 'Properties': {}}
+        },
+        'Outputs': {'FirstArn': {'Value': {'Fn::GetAtt': 'First.Arn'}}}
+    }
+    root, children = sam.nested.partition(template, {'First': 'A', 'Second': 'B'})
+
+    assert(list(children) == ['A', 'B'])
+    assert(set(root['Resources']) == set(['Role', 'Deployment', 'AStack', 'BStack']))
+    assert(root['Resources']['Deployment']['DependsOn'] == ['AStack'])
+    assert(root['Outputs']['FirstArn']['Value'] == {'Fn::GetAtt': ['AStack', 'Outputs.FirstArn']})
+
+    first = children['A']
+    assert(first['Resources']['First']['Properties']['Role'] == {'Ref': 'RoleArn'})
+    assert(first['Parameters'] == {'RoleArn': {'Type': 'String'}})
+    assert(first['Outputs'] == {'FirstRef': {'Value': {'Ref': 'First'}}, 'FirstArn': {'Value': {'Fn::GetAtt': ['First', 'Arn']}}})
+    assert(root['Resources']['AStack']['Properties']['Parameters'] == {'RoleArn': {'Fn::GetAtt': ['Role', 'Arn']}})
+
+    second = children['B']
+    variables = second['Resources']['Second']['Properties']['Environment']['Variables']
+    assert(variables == {'FIRST': {'Ref': 'FirstRef'}, 'REGION': {'Ref': 'AWS::Region'}})
+    assert('Outputs' not in second)
+    assert(root['Resources']['BStack']['Properties']['Parameters'] == {'FirstRef': {'Fn::GetAtt': ['AStack', 'Outputs.FirstRef']}})
+
+def test_partition_refuses_cycles():
+    template = {
+        'Resources': {
+            'Parent': {'Type': 'AWS::ApiGateway::Resource', 'Properties': {}},
+            'Child': {'Type': 'AWS::ApiGateway::Resource', 'Properties': {'ParentId': {'Ref': 'Parent'}}},
+            'Method': {'Type': 'AWS::ApiGateway::Method', 'Properties': {'ResourceId': {'Ref': 'Child'}}}
+        }
+    }
+    try:
+        sam.nested.partition(template, {'Parent': 'Group', 'Method': 'Group'})
+        assert(False)
+    except Exception as e:
+        assert('GroupStack' in str(e) and 'Child' in str(e))
+
+def test_partition_moves_dependencies_to_the_stack():
+    template = {
+        'Resources': {
+            'Role': {'Type': 'AWS::IAM::Role'},
+            'Function': {'Type': 'AWS::Lambda::Function', 'DependsOn': ['Role']}
+        }
+    }
+    root, children = sam.nested.partition(template, {'Function': 'Group'})
+
+    assert('DependsOn' not in children['Group']['Resources']['Function'])
+    assert(root['Resources']['GroupStack']['DependsOn'] == ['Role'])
+    assert(root['Resources']['GroupStack']['Properties']['TemplateURL'] is None)
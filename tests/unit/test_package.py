@@ -0,0 +1,165 @@
+import os
+import pytest
+import sys
+import zipfile
+
+from sam.package import Package, walk, write_archive
+
+@pytest.fixture
+def package(tmpdir):
+    source_dir = tmpdir.mkdir('lambda')
+    source_dir.join('main.py').write('def handler(event, context):\n    return event\n')
+    package = Package(str(source_dir), str(tmpdir) + '/lambda.zip')
+    return package
+
+def test_package_build(package):
+    assert(package.build())
+    assert(os.path.isfile(package.archive))
+    assert(os.path.isfile(package.manifest_path))
+    with zipfile.ZipFile(package.archive) as z:
+        assert('main.py' in z.namelist())
+
+def test_package_build_unchanged(package):
+    assert(package.build())
+    assert(not package.build())
+
+def test_package_build_forced(package):
+    assert(package.build())
+    assert(package.build(force=True))
+
+def test_package_build_changed(package):
+    assert(package.build())
+    with open(os.path.join(package.source_dir, 'other.py'), 'w') as f:
+        f.write('VALUE = 1\n')
+    assert(package.build())
+    with zipfile.ZipFile(package.archive) as z:
+        assert('other.py' in z.namelist())
+
+def test_package_touched_file_is_not_stale(package):
+    assert(package.build())
+    main = os.path.join(package.source_dir, 'main.py')
+    os.utime(main, (0, 0))
+    stale, manifest = package.is_stale()
+    assert(not stale)
+
+def test_package_missing_archive_is_stale(package):
+    assert(package.build())
+    os.remove(package.archive)
+    stale, manifest = package.is_stale()
+    assert(stale)
+
+def test_package_build_is_reproducible(package):
+    assert(package.build())
+    first = package.sha256()
+    os.utime(os.path.join(package.source_dir, 'main.py'), (0, 0))
+    assert(package.build(force=True))
+    assert(package.sha256() == first)
+
+def test_package_archive_entries_are_normalized(package):
+    assert(package.build())
+    with zipfile.ZipFile(package.archive) as z:
+        for info in z.infolist():
+            assert(info.date_time == (1980, 1, 1, 0, 0, 0))
+            assert((info.external_attr >> 16) & 0o777 == 0o644)
+
+def _pipeline_package(tmpdir, config, runtime=None):
+    source_dir = tmpdir.mkdir('pipeline')
+    source_dir.join('main.py').write('def handler(event, context):\n    return event\n')
+    source_dir.mkdir('__pycache__').join('main.cpython-36.pyc').write('stale')
+    library = source_dir.mkdir('library')
+    library.join('__init__.py').write('VALUE = 1\n')
+    library.mkdir('tests').join('test_library.py').write('def test():\n    pass\n')
+    source_dir.mkdir('library-1.0.dist-info').join('METADATA').write('Name: library\n')
+    source_dir.join('README.md').write('# library\n')
+    return Package(str(source_dir), str(tmpdir) + '/pipeline.zip', config=config, runtime=runtime)
+
+def test_package_strip(tmpdir):
+    package = _pipeline_package(tmpdir, {'strip': True})
+    assert(package.build())
+    with zipfile.ZipFile(package.archive) as z:
+        assert(sorted(z.namelist()) == ['library/__init__.py', 'main.py'])
+
+def test_package_include_exclude(tmpdir):
+    package = _pipeline_package(tmpdir, {'include': ['*.py'], 'exclude': ['library/tests/*']})
+    assert(package.build())
+    with zipfile.ZipFile(package.archive) as z:
+        assert(sorted(z.namelist()) == ['library/__init__.py', 'main.py'])
+
+def test_package_config_change_is_stale(tmpdir):
+    package = _pipeline_package(tmpdir, {})
+    assert(package.build())
+    package.strip = True
+    stale, manifest = package.is_stale()
+    assert(stale)
+
+def test_package_compile(tmpdir):
+    runtime = 'python%d.%d' % sys.version_info[:2]
+    package = _pipeline_package(tmpdir, {'strip': True, 'compile': True}, runtime=runtime)
+    assert(package.build())
+    with zipfile.ZipFile(package.archive) as z:
+        names = z.namelist()
+        pyc = [name for name in names if name.startswith('library/__pycache__/') and name.endswith('.pyc')]
+        assert(len(pyc) == 1)
+        # flags field of the header, 0b01 marks a hash-based pyc that is never checked against its source
+        assert(z.read(pyc[0])[4:8] == b'\x01\x00\x00\x00')
+    assert(not any(name.endswith('cpython-36.pyc') for name in names))
+    assert(not os.path.isdir(os.path.join(package.source_dir, 'library', '__pycache__')))
+
+def test_package_compile_old_runtime(tmpdir):
+    package = _pipeline_package(tmpdir, {'strip': True, 'compile': True}, runtime='python3.6')
+    assert(package.build())
+    with zipfile.ZipFile(package.archive) as z:
+        assert(not any(name.endswith('.pyc') for name in z.namelist()))
+    # the failed compile stage leaves no manifest, the next run builds again
+    assert(not os.path.isfile(package.manifest_path))
+    stale, manifest = package.is_stale()
+    assert(stale)
+
+def test_package_compile_interpreter_change_is_stale(tmpdir):
+    runtime = 'python%d.%d' % sys.version_info[:2]
+    package = _pipeline_package(tmpdir, {'compile': True}, runtime=runtime)
+    assert(package.build())
+    assert(not package.is_stale()[0])
+    package.python = sys.executable
+    stale, manifest = package.is_stale()
+    assert(stale)
+
+def test_package_breakdown(tmpdir):
+    package = _pipeline_package(tmpdir, {'strip': True})
+    assert(package.build())
+    entries = dict((name, (files, size)) for name, files, size, compressed in package.breakdown())
+    assert(entries['library'] == (1, len('VALUE = 1\n')))
+    assert(entries['main.py'][0] == 1)
+
+def _write_tree(source_dir, count):
+    for i in range(count):
+        source_dir.join('module_%03d.py' % i).write('VALUE = %d\n' % i * 200)
+    source_dir.join('wheel.whl').write('x' * 4096)
+    source_dir.join('café.py').write('NAME = 1\n')
+
+def test_write_archive_parallel_matches_serial(tmpdir):
+    source_dir = tmpdir.mkdir('tree')
+    _write_tree(source_dir, 50)
+    serial, parallel = str(tmpdir) + '/serial.zip', str(tmpdir) + '/parallel.zip'
+    write_archive(serial, walk(str(source_dir)), workers=1)
+    write_archive(parallel, walk(str(source_dir)), workers=8)
+    with open(serial, 'rb') as f, open(parallel, 'rb') as g:
+        assert(f.read() == g.read())
+
+    with zipfile.ZipFile(parallel) as z:
+        assert(z.testzip() is None)
+        names = z.namelist()
+        assert(names == sorted(names))
+        assert(len(names) == 52)
+        assert(z.getinfo('wheel.whl').compress_type == zipfile.ZIP_STORED)
+        assert(z.getinfo('module_000.py').compress_type == zipfile.ZIP_DEFLATED)
+        assert(z.read('café.py') == b'NAME = 1\n')
+
+def test_write_archive_compression_level(tmpdir):
+    source_dir = tmpdir.mkdir('tree')
+    _write_tree(source_dir, 5)
+    stored = str(tmpdir) + '/stored.zip'
+    write_archive(stored, walk(str(source_dir)), compression_level=0)
+    with zipfile.ZipFile(stored) as z:
+        assert(all(info.compress_type == zipfile.ZIP_STORED for info in z.infolist()))
+        assert(z.testzip() is None)
@@ -0,0 +1,52 @@
+import json
+
+import sam.template
+
+from sam.state import StateFile
+
+TEMPLATE = {
+    'Resources': {
+        'Bucket': {'Type': 'AWS::S3::Bucket', 'Properties': {'AccessControl': 'Private'}},
+        'Function': {'Type': 'AWS::Lambda::Function', 'Properties': {'Handler': 'index.handler', 'MemorySize': 128}}
+    }
+}
+
+def test_template_hash_ignores_formatting():
+    compact = json.dumps(TEMPLATE, separators=(',', ':'))
+    pretty = json.dumps(TEMPLATE, indent=4)
+    assert(sam.template.template_hash(compact) == sam.template.template_hash(pretty))
+    assert(sam.template.template_hash(TEMPLATE) == sam.template.template_hash(pretty))
+    assert(sam.template.template_hash(TEMPLATE) != sam.template.template_hash(TEMPLATE, {'Stage': 'v1'}))
+
+def test_diff_resources():
+    old = sam.template.resource_digests(TEMPLATE)
+    new_template = json.loads(json.dumps(TEMPLATE))
+    new_template['Resources']['Function']['Properties']['MemorySize'] = 512
+    new_template['Resources']['Role'] = {'Type': 'AWS::IAM::Role', 'Properties': {}}
+    del new_template['Resources']['Bucket']
+    diff = sam.template.diff_resources(old, sam.template.resource_digests(new_template))
+    assert(sam.template.format_diff(diff) == [
+        '- Bucket (AWS::S3::Bucket)',
+        '~ Function (AWS::Lambda::Function)',
+        '+ Role (AWS::IAM::Role)'
+    ])
+    assert(sam.template.diff_resources(old, old) == [])
+
+def test_state_file(tmpdir):
+    path = str(tmpdir) + '/.sapling/state.json'
+    state = StateFile(path)
+    assert(state.get('us-east-1/UnitTestApp') == {})
+    state.update('us-east-1/UnitTestApp', template_hash='abc')
+    state.update('us-east-1/UnitTestApp', resources={})
+    assert(StateFile(path).get('us-east-1/UnitTestApp') == {'template_hash': 'abc', 'resources': {}})
+    state.clear('us-east-1/UnitTestApp')
+    assert(StateFile(path).get('us-east-1/UnitTestApp') == {})
+
+def test_size_report():
+    template_body = json.dumps(TEMPLATE, separators=(',', ':'))
+    report = sam.template.size_report(template_body, top=1)
+    assert(report['bytes'] == len(template_body))
+    assert(report['resources'] == 2)
+    assert(report['largest'] == [('Function', 'AWS::Lambda::Function', len(sam.template.canonical(TEMPLATE['Resources']['Function'])))])
+    lines = sam.template.format_size_report(report)
+    assert(lines[1] == 'resources: 2 of 500, outputs: 0 of 200, parameters: 0 of 200')
@@ -0,0 +1,67 @@
+import datetime
+import pytest
+
+from dateutil.tz import tzutc
+from sam.tracker import StackTracker
+
+STACK_ID = 'arn:aws:cloudformation:us-east-1:123:stack/UnitTestApp/xyz'
+
+def _stack(status):
+    return {'Stacks': [{'StackId': STACK_ID, 'StackName': 'UnitTestApp', 'CreationTime': datetime.datetime(2018, 1, 1, tzinfo=tzutc()), 'StackStatus': status}], 'ResponseMetadata': {'HTTPStatusCode': 200}}
+
+def _event(event_id, resource, status, second):
+    return {'EventId': event_id, 'StackId': STACK_ID, 'StackName': 'UnitTestApp', 'LogicalResourceId': resource, 'ResourceStatus': status, 'Timestamp': datetime.datetime(2018, 1, 1, 0, 0, second, tzinfo=tzutc())}
+
+@pytest.fixture
+def tracker(settings, pill):
+    client = pill.session.client('cloudformation')
+    since = datetime.datetime(2018, 1, 1, tzinfo=tzutc())
+    tracker = StackTracker(client, settings['name'], since=since, min_delay=0, max_delay=0)
+    return tracker
+
+def test_tracker_terminal_states():
+    assert(StackTracker.is_terminal('CREATE_COMPLETE'))
+    assert(StackTracker.is_terminal('UPDATE_ROLLBACK_FAILED'))
+    assert(StackTracker.is_terminal(None))
+    assert(not StackTracker.is_terminal('UPDATE_COMPLETE_CLEANUP_IN_PROGRESS'))
+    assert(not StackTracker.is_terminal('CREATE_IN_PROGRESS'))
+
+def test_tracker_stack_does_not_exist(tracker, pill):
+    response = {'Error': {'Code': 'ValidationError', 'Message': 'Stack with id UnitTestApp does not exist'}}
+    pill.save_response(service='cloudformation', operation='DescribeStacks', response_data=response, http_response=400)
+
+    assert(tracker.status() is None)
+
+def test_tracker_wait_streams_events(tracker, pill):
+    pill.save_response(service='cloudformation', operation='DescribeStacks', response_data=_stack('CREATE_IN_PROGRESS'), http_response=200)
+    pill.save_response(service='cloudformation', operation='DescribeStacks', response_data=_stack('CREATE_COMPLETE'), http_response=200)
+
+    response = {'StackEvents': [_event('2', 'UnitTestBucket', 'CREATE_IN_PROGRESS', 2), _event('1', 'UnitTestApp', 'CREATE_IN_PROGRESS', 1)], 'ResponseMetadata': {'HTTPStatusCode': 200}}
+    pill.save_response(service='cloudformation', operation='DescribeStackEvents', response_data=response, http_response=200)
+    response = {'StackEvents': [_event('4', 'UnitTestApp', 'CREATE_COMPLETE', 4), _event('3', 'UnitTestBucket', 'CREATE_COMPLETE', 3)], 'NextToken': 'page2', 'ResponseMetadata': {'HTTPStatusCode': 200}}
+    pill.save_response(service='cloudformation', operation='DescribeStackEvents', response_data=response, http_response=200)
+    response = {'StackEvents': [_event('2', 'UnitTestBucket', 'CREATE_IN_PROGRESS', 2), _event('1', 'UnitTestApp', 'CREATE_IN_PROGRESS', 1)], 'ResponseMetadata': {'HTTPStatusCode': 200}}
+    pill.save_response(service='cloudformation', operation='DescribeStackEvents', response_data=response, http_response=200)
+
+    events = []
+    status = tracker.wait(callback=events.append)
+    assert(status == 'CREATE_COMPLETE')
+    assert([event['EventId'] for event in events] == ['1', '2', '3', '4'])
+    assert(tracker.stack_id == STACK_ID)
+
+def test_tracker_skips_events_before_since(tracker, pill):
+    tracker.since = datetime.datetime(2018, 1, 1, 0, 0, 2, tzinfo=tzutc())
+    response = {'StackEvents': [_event('2', 'UnitTestBucket', 'CREATE_IN_PROGRESS', 2), _event('1', 'UnitTestApp', 'CREATE_IN_PROGRESS', 1)], 'ResponseMetadata': {'HTTPStatusCode': 200}}
+    pill.save_response(service='cloudformation', operation='DescribeStackEvents', response_data=response, http_response=200)
+
+    events = tracker.new_events()
+    assert([event['EventId'] for event in events] == ['2'])
+
+def test_tracker_timeout(tracker, pill):
+    tracker.timeout = -1
+    pill.save_response(service='cloudformation', operation='DescribeStacks', response_data=_stack('CREATE_IN_PROGRESS'), http_response=200)
+    response = {'StackEvents': [], 'ResponseMetadata': {'HTTPStatusCode': 200}}
+    pill.save_response(service='cloudformation', operation='DescribeStackEvents', response_data=response, http_response=200)
+
+    with pytest.raises(Exception):
+        tracker.wait()